@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import datetime
+from collections import Counter
+from sqlalchemy import select, delete, union_all
+from sqlalchemy.dialects.sqlite import insert
+from models import AnalyticsRollup, Interaction, SurveySession
+
+# NPS, CSAT, sentiment and funnel counters bucketed by hour and day. Each turn
+# upserts a handful of rows in its own commit, so /analytics reads a number of
+# rows proportional to the time range, never the interactions table.
+
+BUCKET_SIZES = ("hour", "day")
+ALL_SEGMENTS = "*"
+# Display order of the built-in survey's steps; steps of other survey
+# definitions follow in alphabetical order
+FUNNEL_STEPS = ("NPS_ASK", "DEEP_DIVE", "REASONING", "FAVORITE_FEATURE", "CSAT_ASK", "CLOSING")
+
+
+def bucket_start(ts: datetime.datetime, bucket: str) -> datetime.datetime:
+    if bucket == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _naive_utc(ts):
+    # Timestamps are stored as naive UTC
+    if ts is not None and ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def nps_category(score: int) -> str:
+    if score >= 9:
+        return "promoter"
+    if score >= 7:
+        return "passive"
+    return "detractor"
+
+
+def turn_events(prev_step, next_step, started, score, sentiment_label, score_metric, initial_step) -> list[tuple[str, str]]:
+    """
+    (metric, key) counters one turn contributes. `started` marks the first
+    turn of a new or restarted survey, `score` is the number extracted from
+    the user's input (if any), and `sentiment_label` is None while deferred.
+    `score_metric` ("nps", "csat" or None) and `initial_step` come from the
+    session's survey definition.
+    """
+    events = [("turns", "")]
+    if started:
+        events.append(("started", ""))
+        events.append(("funnel", initial_step))
+    if next_step != prev_step:
+        events.append(("funnel", next_step))
+    if score_metric == "nps" and score is not None:
+        events.append(("nps", nps_category(score)))
+    if score_metric == "csat" and score is not None and 1 <= score <= 5:
+        events.append(("csat", str(score)))
+    if sentiment_label is not None:
+        events.append(("sentiment", sentiment_label))
+    return events
+
+
+def import_events(sentiment_label) -> list[tuple[str, str]]:
+    # Bulk-imported rows (ingest.py) aren't survey turns: only their sentiment counts
+    return [("sentiment", sentiment_label)] if sentiment_label is not None else []
+
+
+def rollup_counts(events, ts, segment, counts=None) -> Counter:
+    counts = counts if counts is not None else Counter()
+    segments = (ALL_SEGMENTS, segment) if segment else (ALL_SEGMENTS,)
+    for bucket in BUCKET_SIZES:
+        start = bucket_start(ts, bucket)
+        for seg in segments:
+            for metric, key in events:
+                counts[(bucket, seg, start, metric, key)] += 1
+    return counts
+
+
+async def apply_counts(db, counts: Counter):
+    """Upserts `counts` on the caller's session; applied when it commits."""
+    if not counts:
+        return
+    stmt = insert(AnalyticsRollup).values([
+        {"bucket": b, "segment": seg, "bucket_start": start, "metric": metric, "key": key, "count": n}
+        for (b, seg, start, metric, key), n in counts.items()
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["bucket", "segment", "bucket_start", "metric", "key"],
+        set_={"count": AnalyticsRollup.count + stmt.excluded["count"]},
+    ))
+
+
+async def record(db, events, ts, segment=None):
+    await apply_counts(db, rollup_counts(events, ts, segment))
+
+
+def _summarize(metrics: dict) -> dict:
+    nps = metrics.get("nps", {})
+    promoters, passives, detractors = nps.get("promoter", 0), nps.get("passive", 0), nps.get("detractor", 0)
+    nps_total = promoters + passives + detractors
+    csat = metrics.get("csat", {})
+    csat_total = sum(csat.values())
+    funnel = metrics.get("funnel", {})
+    started = metrics.get("started", {}).get("", 0)
+    steps = list(FUNNEL_STEPS) + sorted(set(funnel) - set(FUNNEL_STEPS))
+    return {
+        "turns": metrics.get("turns", {}).get("", 0),
+        "nps": {
+            "promoters": promoters,
+            "passives": passives,
+            "detractors": detractors,
+            "responses": nps_total,
+            "score": round(100 * (promoters - detractors) / nps_total, 1) if nps_total else None,
+        },
+        "csat": {
+            "responses": csat_total,
+            "distribution": {k: csat.get(k, 0) for k in ("1", "2", "3", "4", "5")},
+            "average": round(sum(int(k) * n for k, n in csat.items()) / csat_total, 2) if csat_total else None,
+            "satisfied_pct": round(100 * (csat.get("4", 0) + csat.get("5", 0)) / csat_total, 1) if csat_total else None,
+        },
+        "sentiment": dict(metrics.get("sentiment", {})),
+        "funnel": {
+            step: {"sessions": funnel.get(step, 0), "of_started": round(funnel.get(step, 0) / started, 3) if started else None}
+            for step in steps
+        },
+    }
+
+
+async def query(db, bucket="day", start=None, end=None, segment=None) -> dict:
+    """
+    Per-bucket and total metrics for [start, end). Reads only rollup rows, so
+    the cost depends on the number of buckets, not on interaction volume.
+    """
+    segment = segment or ALL_SEGMENTS
+    start, end = _naive_utc(start), _naive_utc(end)
+    stmt = select(AnalyticsRollup.bucket_start, AnalyticsRollup.metric, AnalyticsRollup.key, AnalyticsRollup.count).where(
+        AnalyticsRollup.bucket == bucket, AnalyticsRollup.segment == segment
+    )
+    if start is not None:
+        stmt = stmt.where(AnalyticsRollup.bucket_start >= bucket_start(start, bucket))
+    if end is not None:
+        stmt = stmt.where(AnalyticsRollup.bucket_start < end)
+    result = await db.execute(stmt.order_by(AnalyticsRollup.bucket_start))
+
+    buckets = {}
+    totals = {}
+    for start_ts, metric, key, count in result:
+        for metrics in (buckets.setdefault(start_ts, {}), totals):
+            per_key = metrics.setdefault(metric, {})
+            per_key[key] = per_key.get(key, 0) + count
+
+    return {
+        "bucket": bucket,
+        "segment": None if segment == ALL_SEGMENTS else segment,
+        "totals": _summarize(totals),
+        "buckets": [{"start": ts.isoformat(), **_summarize(m)} for ts, m in buckets.items()],
+    }
+
+
+async def rebuild(session_factory, batch_size=5000, archive_path=None, idle_timeout=None):
+    """
+    Recomputes all rollups from survey_sessions and interactions, plus the
+    interactions retention.py moved to the archive database at
+    `archive_path`. Steps are not stored per interaction, so each session's
+    turns are replayed through its survey's state machine. Replaces the
+    rollups in one commit; run it with the app stopped so no live turns are
+    counted twice or lost.
+
+    A session restarts after a terminal step, and, with `idle_timeout` (the
+    SESSION_IDLE_TIMEOUT retention ran with), after a gap between two turns
+    longer than that. Idle closes aren't recorded per turn, so the gap
+    stands in for them: a turn that came less than one RETENTION_INTERVAL
+    after the timeout may not have found its session closed yet, and then
+    counts as a restart here but not in the live rollups.
+    """
+    # Imported here: feedback_processor imports this module
+    from feedback_processor import FeedbackProcessor
+    from session_cache import SessionState
+    from ingest import IMPORT_SURVEY_ID
+    from retention import attached_archive, attached_interactions
+
+    replay = FeedbackProcessor(llm_service=None, db_session=None)
+    idle_gap = datetime.timedelta(seconds=idle_timeout) if idle_timeout else None
+    counts = Counter()
+    turns = 0
+    state = None
+    previous_ts = None
+
+    async with session_factory() as db, attached_archive(db, archive_path) as attached:
+        history = select(
+            Interaction.session_id, Interaction.id, Interaction.timestamp, Interaction.user_input, Interaction.sentiment_label,
+        )
+        if attached:
+            archived = attached_interactions.c
+            history = union_all(history, select(
+                archived.session_id, archived.id, archived.timestamp, archived.user_input, archived.sentiment_label,
+            ))
+        history = history.subquery()
+        result = await db.stream(
+            select(
+                history.c.session_id, history.c.timestamp, history.c.user_input, history.c.sentiment_label,
+                SurveySession.customer_segment, SurveySession.survey_id,
+            )
+            .join(SurveySession, SurveySession.session_id == history.c.session_id)
+            .order_by(history.c.session_id, history.c.id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for row in result:
+            turns += 1
+            if row.survey_id == IMPORT_SURVEY_ID:
+                rollup_counts(import_events(row.sentiment_label), row.timestamp, row.customer_segment, counts)
+                continue
+            survey = replay.surveys.get(row.survey_id)
+            started = (
+                state is None or state.session_id != row.session_id
+                or state.current_step in survey.terminal_states
+                # Closed for being idle (retention.py), like the live path's session.ended
+                or (idle_gap is not None and row.timestamp - previous_ts > idle_gap)
+            )
+            if started:
+                state = SessionState(session_id=row.session_id, current_step=survey.initial_state, survey_id=row.survey_id)
+            previous_ts = row.timestamp
+
+            prev_step = state.current_step
+            next_step, _ = replay.run_state_machine(state, row.user_input, {"label": row.sentiment_label})
+            state.current_step = next_step
+            events = turn_events(
+                prev_step, next_step, started, replay.extract_score(row.user_input), row.sentiment_label,
+                survey.metric(prev_step), survey.initial_state,
+            )
+            rollup_counts(events, row.timestamp, row.customer_segment, counts)
+        await result.close()
+
+        await db.execute(delete(AnalyticsRollup))
+        rows = list(counts.items())
+        for i in range(0, len(rows), batch_size):
+            await apply_counts(db, Counter(dict(rows[i:i + batch_size])))
+        await db.commit()
+
+    return turns, len(counts)
+
+
+async def _main(args):
+    import config
+    from database import AsyncSessionLocal, init_db
+
+    init_db()
+    if args.command == "rebuild":
+        turns, rows = await rebuild(
+            AsyncSessionLocal, archive_path=config.ARCHIVE_DATABASE_PATH,
+            idle_timeout=config.SESSION_IDLE_TIMEOUT if config.RETENTION_ENABLED else None,
+        )
+        print(f"Rebuilt analytics from {turns} interactions into {rows} rollup rows.")
+    else:
+        async with AsyncSessionLocal() as db:
+            report = await query(db, bucket=args.bucket, segment=args.segment)
+        print(f"NPS: {report['totals']['nps']}")
+        print(f"CSAT: {report['totals']['csat']}")
+        print(f"Sentiment: {report['totals']['sentiment']}")
+        for step, row in report["totals"]["funnel"].items():
+            print(f"  {step:<17} {row['sessions']:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain and inspect the analytics rollups.")
+    parser.add_argument("command", choices=["rebuild", "show"])
+    parser.add_argument("--bucket", choices=BUCKET_SIZES, default="day")
+    parser.add_argument("--segment", default=None)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,67 @@
+import asyncio
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent submit() calls into a single handler call.
+
+    A batch is flushed when it reaches `max_batch_size` items or `max_wait`
+    seconds after its first item arrived, whichever comes first. The handler
+    receives the list of items and must return a list of results in the same
+    order. A result that is an Exception is raised to that item's caller.
+    """
+
+    def __init__(self, handler, max_batch_size=8, max_wait=0.02):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = []  # list of (item, future)
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        # Keep a reference so the task isn't garbage collected mid-flight
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = list(await self.handler(items))
+        except Exception as e:
+            results = [e] * len(batch)
+
+        # Guard against handlers returning too few results
+        if len(results) < len(batch):
+            missing = ValueError("Batch handler returned no result for item")
+            results.extend([missing] * (len(batch) - len(results)))
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                # Caller gave up (cancelled / timed out)
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
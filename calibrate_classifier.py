@@ -0,0 +1,63 @@
+
+import argparse
+import csv
+import json
+import sys
+from local_classifier import LocalSentimentClassifier
+
+def load_labeled(path):
+    """
+    Reads (text, label) pairs from a CSV with `text` and `label` columns or a
+    JSONL file with one {"text": ..., "label": ...} object per line.
+    """
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl") or path.endswith(".ndjson"):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    rows.append((record["text"], record["label"]))
+        else:
+            for record in csv.DictReader(f):
+                rows.append((record["text"], record["label"]))
+    return rows
+
+def calibrate(rows, classifier, target_accuracy):
+    predictions = []
+    for text, label in rows:
+        result, confidence = classifier.classify(text)
+        predictions.append((confidence, result["label"] == label))
+
+    print(f"{'threshold':>9} {'coverage':>9} {'accuracy':>9}")
+    recommended = None
+    for step in range(0, 21):
+        threshold = step / 20
+        covered = [correct for confidence, correct in predictions if confidence >= threshold]
+        coverage = len(covered) / len(predictions)
+        accuracy = sum(covered) / len(covered) if covered else 0.0
+        print(f"{threshold:>9.2f} {coverage:>9.1%} {accuracy:>9.1%}")
+        # Lowest threshold that still meets the target keeps the most traffic local
+        if recommended is None and covered and accuracy >= target_accuracy:
+            recommended = (threshold, coverage, accuracy)
+
+    print()
+    if recommended:
+        threshold, coverage, accuracy = recommended
+        print(f"Recommended LOCAL_CLASSIFIER_THRESHOLD={threshold:.2f} "
+              f"(skips the LLM for {coverage:.1%} of inputs at {accuracy:.1%} accuracy)")
+    else:
+        print(f"No threshold reaches {target_accuracy:.0%} accuracy; keep the classifier disabled or extend the lexicon.")
+    return recommended
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the local sentiment classifier's confidence threshold.")
+    parser.add_argument("labeled_file", help="CSV (text,label) or JSONL with Frustrated/Delight/Neutral labels")
+    parser.add_argument("--target-accuracy", type=float, default=0.9)
+    parser.add_argument("--lexicon", help="Optional JSON lexicon to merge into the default one")
+    args = parser.parse_args()
+
+    rows = load_labeled(args.labeled_file)
+    if not rows:
+        sys.exit(f"No labeled examples in {args.labeled_file}; expected text/label rows to calibrate against.")
+    print(f"Loaded {len(rows)} labeled examples from {args.labeled_file}\n")
+    calibrate(rows, LocalSentimentClassifier(lexicon_path=args.lexicon), args.target_accuracy)
@@ -0,0 +1,125 @@
+import datetime
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker shared by all LLM calls.
+
+    CLOSED: calls pass; outcomes are recorded in a sliding time window. When
+    at least `min_calls` outcomes are in the window and the error/timeout
+    share reaches `failure_rate`, the breaker opens.
+    OPEN: calls are rejected immediately for `open_duration` seconds.
+    HALF_OPEN: up to `half_open_max_calls` probe calls are let through. If
+    all of them succeed the breaker closes; any failure re-opens it.
+    """
+
+    def __init__(self, window=30.0, min_calls=5, failure_rate=0.5, open_duration=15.0, half_open_max_calls=1):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.rejected = 0
+        self.transitions = deque(maxlen=50)
+        self._outcomes = deque()  # (monotonic time, ok)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def allow(self) -> bool:
+        """
+        Call before each LLM attempt. Returns True if the attempt is a
+        half-open probe; raises CircuitOpenError if it must not be made.
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_duration:
+                self.rejected += 1
+                raise CircuitOpenError("LLM circuit open, using fallback")
+            self._transition(HALF_OPEN, "open duration elapsed")
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight + self._probe_successes >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError("LLM circuit half-open, probe already in flight")
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def record_success(self, probe=False):
+        if probe:
+            self._probes_in_flight -= 1
+            self._probe_successes += 1
+            if self.state == HALF_OPEN and self._probe_successes >= self.half_open_max_calls:
+                self._transition(CLOSED, f"{self._probe_successes} probe(s) succeeded")
+            return
+        self._record(True)
+
+    def record_failure(self, probe=False, reason="error"):
+        if probe:
+            self._probes_in_flight -= 1
+            if self.state == HALF_OPEN:
+                self._transition(OPEN, f"probe failed ({reason})")
+            return
+        self._record(False)
+        if self.state == CLOSED:
+            total, failures = self._window_counts()
+            if total >= self.min_calls and failures / total >= self.failure_rate:
+                self._transition(OPEN, f"{failures}/{total} calls failed in {self.window:.0f}s window")
+
+    def cancel_probe(self):
+        # A probe that never reached the LLM (shed or cancelled) gives no verdict
+        self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def stats(self) -> dict:
+        total, failures = self._window_counts()
+        return {
+            "state": self.state,
+            "window_calls": total,
+            "window_failures": failures,
+            "window_failure_rate": round(failures / total, 4) if total else 0.0,
+            "rejected": self.rejected,
+            "transitions": list(self.transitions),
+        }
+
+    def _record(self, ok):
+        self._outcomes.append((time.monotonic(), ok))
+        self._trim()
+
+    def _trim(self):
+        cutoff = time.monotonic() - self.window
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+
+    def _window_counts(self):
+        self._trim()
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return len(self._outcomes), failures
+
+    def _transition(self, state, reason):
+        self.transitions.append({
+            "from": self.state,
+            "to": state,
+            "at": datetime.datetime.utcnow().isoformat(),
+            "reason": reason,
+        })
+        print(f"LLM circuit breaker: {self.state} -> {state} ({reason})")
+        self.state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state in (OPEN, HALF_OPEN):
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        if state == CLOSED:
+            # Start the closed state with a clean window
+            self._outcomes.clear()
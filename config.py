@@ -0,0 +1,199 @@
+import os
+
+# Runtime configuration. Every value can be overridden through an environment
+# variable of the same name.
+
+# Database. The async URL (aiosqlite) serves requests, the sync one is used
+# for schema creation and offline scripts.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./feedback.db")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Ollama
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30.0"))
+# Several Ollama backends: OLLAMA_BACKENDS is a comma-separated list of URLs,
+# or a JSON list of {"url", "models": {"sentiment"|"recovery"|"summary": model},
+# "roles": [...]} to run a different model per method. Empty means the one
+# backend at OLLAMA_BASE_URL running OLLAMA_MODEL. Each request goes to the
+# healthy backend with the fewest requests in flight. A backend is ejected
+# after LLM_BACKEND_EJECT_AFTER failed requests in a row or a failed health
+# check (every LLM_BACKEND_HEALTH_INTERVAL seconds), and re-admitted when a
+# check passes, at least LLM_BACKEND_EJECT_SECONDS later. With the interval at
+# 0 (no health checks) it is simply retried after LLM_BACKEND_EJECT_SECONDS.
+OLLAMA_BACKENDS = os.getenv("OLLAMA_BACKENDS", "")
+LLM_BACKEND_EJECT_AFTER = int(os.getenv("LLM_BACKEND_EJECT_AFTER", "3"))
+LLM_BACKEND_EJECT_SECONDS = float(os.getenv("LLM_BACKEND_EJECT_SECONDS", "10.0"))
+LLM_BACKEND_HEALTH_INTERVAL = float(os.getenv("LLM_BACKEND_HEALTH_INTERVAL", "5.0"))
+# How long Ollama keeps the model loaded after each request (Ollama duration syntax)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "5m")
+
+# Startup warm-up: one real generation before serving, so the first user
+# doesn't pay for loading the model. Failure only logs a warning.
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1") == "1"
+LLM_WARMUP_TIMEOUT = float(os.getenv("LLM_WARMUP_TIMEOUT", "120.0"))
+
+# Startup: INIT_DB_ON_STARTUP creates and migrates the schema when the app
+# starts; turn it off when `python database.py` runs as a deploy step instead.
+# With FAST_BOOT the app serves as soon as the schema is ready and checks,
+# loads (LangChain import) and warms up the LLM in the background; GET /ready
+# answers 503 until that is done, turns meanwhile load it on first use.
+INIT_DB_ON_STARTUP = os.getenv("INIT_DB_ON_STARTUP", "1") == "1"
+FAST_BOOT = os.getenv("FAST_BOOT", "0") == "1"
+
+# Keep the model resident during business hours: inside MODEL_KEEPALIVE_HOURS
+# (local "HH:MM-HH:MM", may cross midnight) on MODEL_KEEPALIVE_DAYS, the model
+# is reloaded whenever no generation was sent for MODEL_KEEPALIVE_INTERVAL
+# seconds. Keep the interval below OLLAMA_KEEP_ALIVE. Empty hours disable it.
+MODEL_KEEPALIVE_HOURS = os.getenv("MODEL_KEEPALIVE_HOURS", "")
+MODEL_KEEPALIVE_DAYS = os.getenv("MODEL_KEEPALIVE_DAYS", "mon,tue,wed,thu,fri")
+MODEL_KEEPALIVE_INTERVAL = float(os.getenv("MODEL_KEEPALIVE_INTERVAL", "240.0"))
+
+# Generation scheduling: at most LLM_MAX_CONCURRENCY generations run on each
+# backend at once (LLM_MAX_CONCURRENCY x backends in total); up to
+# LLM_MAX_QUEUE more wait by priority (interactive sentiment ahead of
+# background summaries/recovery). Requests over the queue limit or past their
+# queue timeout get the fallback immediately. When the backends of a role are
+# all busy or ejected, its requests wait for one inside their LLM timeout.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT_INTERACTIVE = float(os.getenv("LLM_QUEUE_TIMEOUT_INTERACTIVE", "5.0"))
+LLM_QUEUE_TIMEOUT_BACKGROUND = float(os.getenv("LLM_QUEUE_TIMEOUT_BACKGROUND", "60.0"))
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "8"))
+
+# Deadlines: each /analyze turn has ANALYZE_DEADLINE seconds (or the request's
+# deadline_ms; 0 disables). Its LLM queue wait, attempts and retries must fit
+# in that minus DEADLINE_RESERVE (kept for storing the turn), or the turn gets
+# the fallback sentiment. A call makes up to LLM_RETRIES attempts with backoff
+# LLM_RETRY_DELAY, doubling; a retry is skipped if the deadline has no room.
+# One attempt by default; set LLM_RETRIES to opt in to retries.
+ANALYZE_DEADLINE = float(os.getenv("ANALYZE_DEADLINE", "10.0"))
+DEADLINE_RESERVE = float(os.getenv("DEADLINE_RESERVE", "0.25"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))
+LLM_RETRY_DELAY = float(os.getenv("LLM_RETRY_DELAY", "2"))
+
+# Adaptive timeouts: each LLM method's attempt timeout is
+# LLM_TIMEOUT_MULTIPLIER x the LLM_TIMEOUT_PERCENTILE of its last
+# LLM_TIMEOUT_WINDOW successful attempts, between LLM_TIMEOUT_MIN and
+# LLM_TIMEOUT. It is LLM_TIMEOUT again after LLM_TIMEOUT_IDLE_RESET seconds
+# without a success; keep that below OLLAMA_KEEP_ALIVE, since the model may be
+# unloaded. LLM_HEDGE sends a second copy of interactive calls still running
+# after their method's p95, if an LLM slot is free; the first answer wins.
+LLM_ADAPTIVE_TIMEOUT = os.getenv("LLM_ADAPTIVE_TIMEOUT", "1") == "1"
+LLM_TIMEOUT_MIN = float(os.getenv("LLM_TIMEOUT_MIN", "2.0"))
+LLM_TIMEOUT_PERCENTILE = float(os.getenv("LLM_TIMEOUT_PERCENTILE", "0.99"))
+LLM_TIMEOUT_MULTIPLIER = float(os.getenv("LLM_TIMEOUT_MULTIPLIER", "3.0"))
+LLM_TIMEOUT_WINDOW = int(os.getenv("LLM_TIMEOUT_WINDOW", "200"))
+LLM_TIMEOUT_IDLE_RESET = float(os.getenv("LLM_TIMEOUT_IDLE_RESET", "240.0"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+
+# Circuit breaker: opens when at least CIRCUIT_MIN_CALLS LLM calls in the last
+# CIRCUIT_WINDOW seconds failed or timed out at CIRCUIT_FAILURE_RATE or more.
+# While open, calls fall back immediately; after CIRCUIT_OPEN_SECONDS up to
+# CIRCUIT_HALF_OPEN_PROBES probe calls decide whether it closes again.
+CIRCUIT_WINDOW = float(os.getenv("CIRCUIT_WINDOW", "30.0"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "15.0"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+# Sentiment micro-batching: concurrent analyze_sentiment calls arriving within
+# SENTIMENT_BATCH_MAX_WAIT seconds are scored in a single Ollama request.
+# Set SENTIMENT_BATCH_MAX_SIZE=1 to disable batching.
+SENTIMENT_BATCH_MAX_SIZE = int(os.getenv("SENTIMENT_BATCH_MAX_SIZE", "8"))
+SENTIMENT_BATCH_MAX_WAIT = float(os.getenv("SENTIMENT_BATCH_MAX_WAIT", "0.02"))
+
+# LLM result cache: in-process LRU in front of the `llm_cache` table.
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+
+# Local lexicon classifier tried before the LLM. Results with confidence below
+# the threshold (see calibrate_classifier.py) still go to the LLM.
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "1") == "1"
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.6"))
+LOCAL_CLASSIFIER_LEXICON = os.getenv("LOCAL_CLASSIFIER_LEXICON")  # optional JSON lexicon file
+
+# Near-duplicate reuse (near_duplicates.py): a text whose SimHash is within
+# NEAR_DUP_MAX_DISTANCE bits (0-7) of an LLM-scored one reuses its sentiment.
+# Each process keeps up to NEAR_DUP_MAX_ENTRIES signatures in memory.
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "1") == "1"
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3"))
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "1000000"))
+
+# Per-process cache of session state (current_step, nps_score), so a turn
+# doesn't re-read SurveySession. Entries expire after SESSION_CACHE_IDLE_TTL
+# seconds without a turn.
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+SESSION_CACHE_IDLE_TTL = int(os.getenv("SESSION_CACHE_IDLE_TTL", "1800"))
+
+# Turns of one session run one at a time per process. Across processes
+# (uvicorn --workers), a turn that loses the race for the session's row
+# version is re-run up to SESSION_CONFLICT_RETRIES times, after a jittered
+# backoff starting at SESSION_CONFLICT_BACKOFF seconds.
+SESSION_CONFLICT_RETRIES = int(os.getenv("SESSION_CONFLICT_RETRIES", "5"))
+SESSION_CONFLICT_BACKOFF = float(os.getenv("SESSION_CONFLICT_BACKOFF", "0.02"))
+
+# Deferred sentiment: turns whose reply doesn't depend on sentiment return
+# immediately and are scored by background workers via the durable
+# `sentiment_jobs` queue.
+DEFER_SENTIMENT = os.getenv("DEFER_SENTIMENT", "0") == "1"
+SENTIMENT_QUEUE_WORKERS = int(os.getenv("SENTIMENT_QUEUE_WORKERS", "2"))
+SENTIMENT_QUEUE_MAX_ATTEMPTS = int(os.getenv("SENTIMENT_QUEUE_MAX_ATTEMPTS", "5"))
+
+# Rolling ScaleDown summaries: each fold (previous summary + new turns) must fit
+# in this many prompt tokens; leave room for num_predict within num_ctx=2048.
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "1536"))
+
+# Interaction log: JSONL records written in batches by one background task.
+# Rotated at INTERACTION_LOG_MAX_BYTES or every INTERACTION_LOG_ROTATE_SECONDS
+# (0 disables time-based rotation); rotated files are gzipped. With several
+# worker processes, put "{pid}" in the path so each writes its own file.
+INTERACTION_LOG_PATH = os.getenv("INTERACTION_LOG_PATH", "feedback_log.jsonl")
+INTERACTION_LOG_FLUSH_INTERVAL = float(os.getenv("INTERACTION_LOG_FLUSH_INTERVAL", "1.0"))  # seconds
+INTERACTION_LOG_BATCH_SIZE = int(os.getenv("INTERACTION_LOG_BATCH_SIZE", "512"))
+INTERACTION_LOG_MAX_BYTES = int(os.getenv("INTERACTION_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+INTERACTION_LOG_ROTATE_SECONDS = int(os.getenv("INTERACTION_LOG_ROTATE_SECONDS", str(24 * 3600)))
+INTERACTION_LOG_COMPRESS = os.getenv("INTERACTION_LOG_COMPRESS", "1") == "1"
+
+# Log the per-stage breakdown of /analyze turns slower than this many seconds
+# (0 disables the slow-request log). Stage histograms are always at /metrics.
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0"))
+
+# Bulk ingestion (POST /ingest, ingest.py): at most INGEST_CONCURRENCY rows
+# wait on the LLM at once (LLM_MAX_CONCURRENCY x SENTIMENT_BATCH_MAX_SIZE
+# keeps every slot busy with full batches); results are inserted and
+# checkpointed every INGEST_BATCH_SIZE rows.
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "16"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+
+# Survey definitions: every *.json file in SURVEY_DIR is compiled at startup
+# and recompiled when it changes (checked every SURVEY_RELOAD_INTERVAL
+# seconds). A definition with id "default" replaces the built-in survey.
+SURVEY_DIR = os.getenv("SURVEY_DIR", "surveys")
+SURVEY_RELOAD_INTERVAL = float(os.getenv("SURVEY_RELOAD_INTERVAL", "5.0"))
+
+# Retention (retention.py): every RETENTION_INTERVAL seconds, sessions idle for
+# SESSION_IDLE_TIMEOUT seconds are closed, interactions of sessions that ended
+# more than ARCHIVE_AFTER_DAYS days ago are moved to ARCHIVE_DATABASE_PATH in
+# batches of RETENTION_BATCH_SIZE (with ARCHIVE_REQUIRE_SUMMARY, only turns
+# scaledown_job.py has folded into the session's summary), and freed
+# pages are returned to the OS VACUUM_SLICE_PAGES at a time for at most
+# VACUUM_BUDGET_SECONDS. RETENTION_PAUSE seconds between batches and slices
+# let turns take the write lock. 0 disables a step.
+# `python analytics.py rebuild` and `python keyword_index.py rebuild` replay
+# the archive too, so keep ARCHIVE_DATABASE_PATH (the rollups of archived
+# turns can't be rebuilt without it), and run them with the RETENTION_ENABLED
+# and SESSION_IDLE_TIMEOUT the app used: idle closes are inferred from gaps
+# between a session's turns.
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "0") == "1"
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "300"))
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", str(24 * 3600)))
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_DATABASE_PATH = os.getenv("ARCHIVE_DATABASE_PATH", "feedback_archive.db")
+ARCHIVE_REQUIRE_SUMMARY = os.getenv("ARCHIVE_REQUIRE_SUMMARY", "1") == "1"
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_PAUSE = float(os.getenv("RETENTION_PAUSE", "0.05"))
+VACUUM_SLICE_PAGES = int(os.getenv("VACUUM_SLICE_PAGES", "64"))
+VACUUM_BUDGET_SECONDS = float(os.getenv("VACUUM_BUDGET_SECONDS", "2.0"))
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import time
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import config
+import models
+
+# Sync engine: schema management and offline scripts
+engine = create_engine(config.DATABASE_URL, connect_args={"check_same_thread": False})
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine: request path. expire_on_commit=False so ORM objects stay
+# readable after commit without an implicit (blocking) refresh.
+async_engine = create_async_engine(config.ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # Lets retention.py hand freed pages back to the OS a slice at a time.
+    # Only takes effect on a new database; `python retention.py vacuum --full`
+    # converts an existing one.
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL lets readers proceed while a writer commits
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # NORMAL only fsyncs at checkpoints, which is durable enough under WAL
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+event.listen(engine, "connect", _set_sqlite_pragmas)
+event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+def _add_missing_columns():
+    """
+    create_all() only creates missing tables. Columns added to existing
+    models are applied here with ALTER TABLE ... ADD COLUMN (additive only).
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    ddl += f" DEFAULT {getattr(default, 'text', default)}"
+                print(f"Migrating: {ddl}")
+                conn.execute(text(ddl))
+
+def _archived_max_id():
+    if not os.path.exists(config.ARCHIVE_DATABASE_PATH):
+        return 0
+    archive = sqlite3.connect(config.ARCHIVE_DATABASE_PATH)
+    try:
+        return archive.execute("SELECT max(id) FROM archived_interactions").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0  # archive tables not created yet
+    finally:
+        archive.close()
+
+def _add_autoincrement():
+    """
+    SQLite can't add AUTOINCREMENT to an existing table, so an interactions
+    table from before it is rebuilt once (copy, drop, rename; indexes come
+    back in _add_missing_indexes). The sequence starts past every id handed
+    out so far, archived ones included.
+    """
+    table = models.Interaction.__table__
+    tmp = f"{table.name}_rebuild"
+    archived_max = _archived_max_id()
+    columns = ", ".join(column.name for column in table.columns)
+    create = str(CreateTable(table).compile(engine)).replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {tmp} ", 1)
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        isolation_level = conn.isolation_level
+        # The sqlite3 module commits DDL on its own; run the rebuild as one explicit transaction
+        conn.isolation_level = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)).fetchone()
+            if row is None or "AUTOINCREMENT" in row[0].upper():
+                conn.execute("COMMIT")
+                return
+            print(f"Migrating: rebuilding {table.name} with AUTOINCREMENT")
+            live_max = conn.execute(f"SELECT max(id) FROM {table.name}").fetchone()[0] or 0
+            conn.execute(create)
+            conn.execute(f"INSERT INTO {tmp} ({columns}) SELECT {columns} FROM {table.name}")
+            conn.execute(f"DROP TABLE {table.name}")
+            conn.execute(f"ALTER TABLE {tmp} RENAME TO {table.name}")
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table.name,))
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table.name, max(live_max, archived_max)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.isolation_level = isolation_level
+    finally:
+        raw.close()
+
+def _add_missing_indexes():
+    # create_all() skips the indexes of tables that already exist
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+def init_db(attempts=5):
+    # Several workers (uvicorn --workers) may run this at once. Every step is
+    # idempotent, so a step that lost a race to another process is re-run.
+    for attempt in range(attempts):
+        try:
+            _add_missing_columns()
+            _add_autoincrement()
+            models.Base.metadata.create_all(bind=engine)
+            _add_missing_indexes()
+            return
+        except (OperationalError, sqlite3.OperationalError) as e:
+            if attempt == attempts - 1:
+                raise
+            print(f"Schema setup raced another process, retrying: {getattr(e, 'orig', e)}")
+            time.sleep(0.2 * (attempt + 1))
+
+# `python database.py` creates and migrates the schema as a deploy step, for
+# apps started with INIT_DB_ON_STARTUP=0
+if __name__ == "__main__":
+    init_db()
+    print(f"Schema ready at {config.DATABASE_URL}")
@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+from sqlalchemy import select, func, tuple_
+from models import SurveySession, Interaction, SentimentJob
+
+# Streaming export of interactions joined with their session. Rows are read
+# in keyset-paginated pages, each in its own short read transaction, and
+# serialized one partition at a time, so memory stays flat however large the
+# tables are.
+
+FORMATS = ("ndjson", "csv", "columnar")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv", "columnar": "application/x-ndjson"}
+CURSOR_FILE = "export_cursor.json"
+
+COLUMNS = [
+    ("interaction_id", Interaction.id),
+    ("session_id", Interaction.session_id),
+    ("timestamp", Interaction.timestamp),
+    ("user_input", Interaction.user_input),
+    ("bot_response", Interaction.bot_response),
+    ("sentiment_label", Interaction.sentiment_label),
+    ("sentiment_score", Interaction.sentiment_score),
+    ("current_step", SurveySession.current_step),
+    ("nps_score", SurveySession.nps_score),
+    ("customer_segment", SurveySession.customer_segment),
+    ("session_start", SurveySession.start_time),
+    ("session_end", SurveySession.end_time),
+]
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+
+
+def _naive_utc(ts):
+    # Timestamps are stored as naive UTC
+    if ts is not None and ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+async def iter_rows(session_factory, start=None, end=None, after_id=None, page_size=5000, partition_size=1000):
+    """
+    Yields lists of row tuples (in COLUMN_NAMES order).
+
+    With a time range, pages are keyed on (timestamp, id) and read through
+    ix_interactions_timestamp; otherwise on id alone. `after_id` exports only
+    interactions newer than a previous export's last interaction_id.
+
+    Incremental pulls (with `after_id`) stop before the oldest interaction
+    whose deferred sentiment is still pending, and before rows committed
+    after the pull began, so each row goes out once and already scored; the
+    next pull continues from there. Rows whose job failed for good go out
+    with a null sentiment.
+    """
+    start, end = _naive_utc(start), _naive_utc(end)
+    by_time = start is not None or end is not None
+    last = None
+    before_id = await _incremental_bound(session_factory, after_id) if after_id is not None else None
+    while True:
+        stmt = (
+            select(*[column.label(name) for name, column in COLUMNS])
+            .outerjoin(SurveySession, SurveySession.session_id == Interaction.session_id)
+        )
+        if after_id is not None:
+            stmt = stmt.where(Interaction.id > after_id, Interaction.id < before_id)
+        if start is not None:
+            stmt = stmt.where(Interaction.timestamp >= start)
+        if end is not None:
+            stmt = stmt.where(Interaction.timestamp < end)
+        if by_time:
+            if last is not None:
+                stmt = stmt.where(tuple_(Interaction.timestamp, Interaction.id) > tuple_(*last))
+            stmt = stmt.order_by(Interaction.timestamp, Interaction.id)
+        else:
+            if last is not None:
+                stmt = stmt.where(Interaction.id > last[1])
+            stmt = stmt.order_by(Interaction.id)
+
+        rows = 0
+        async with session_factory() as db:
+            result = await db.stream(stmt.limit(page_size).execution_options(yield_per=partition_size))
+            async for partition in result.partitions():
+                rows += len(partition)
+                last = (partition[-1].timestamp, partition[-1].interaction_id)
+                yield partition
+        if rows < page_size:
+            return
+
+
+async def _incremental_bound(session_factory, after_id):
+    # One read transaction, so a row committed in between can't slip under the bound unscored
+    async with session_factory() as db:
+        pending = (await db.execute(
+            select(func.min(SentimentJob.interaction_id))
+            .where(SentimentJob.status == "pending", SentimentJob.interaction_id > after_id)
+        )).scalar()
+        newest = (await db.execute(select(func.max(Interaction.id)))).scalar() or 0
+    return pending if pending is not None else newest + 1
+
+
+def _value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+async def serialize(partitions, fmt="ndjson"):
+    """
+    Turns row partitions into text chunks:
+      ndjson   - one JSON object per interaction
+      csv      - header row, then one row per interaction
+      columnar - one JSON object per partition, mapping each column to an array
+    """
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMN_NAMES)
+        yield buffer.getvalue()
+    async for partition in partitions:
+        if fmt == "ndjson":
+            yield "".join(json.dumps(dict(zip(COLUMN_NAMES, map(_value, row)))) + "\n" for row in partition)
+        elif fmt == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([[_value(v) for v in row] for row in partition])
+            yield buffer.getvalue()
+        else:
+            columns = {name: [_value(row[i]) for row in partition] for i, name in enumerate(COLUMN_NAMES)}
+            yield json.dumps({"rows": len(partition), "columns": columns}) + "\n"
+
+
+def load_cursor(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("last_interaction_id")
+
+
+def save_cursor(path, last_interaction_id):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"last_interaction_id": last_interaction_id, "exported_at": datetime.datetime.utcnow().isoformat()}, f)
+    os.replace(tmp, path)
+
+
+async def export(fmt, output, start=None, end=None, after_id=None):
+    from database import AsyncSessionLocal
+
+    exported = 0
+    max_id = after_id
+
+    async def tracked():
+        nonlocal exported, max_id
+        async for partition in iter_rows(AsyncSessionLocal, start=start, end=end, after_id=after_id):
+            exported += len(partition)
+            max_id = max(max_id or 0, max(row.interaction_id for row in partition))
+            yield partition
+
+    async for chunk in serialize(tracked(), fmt):
+        output.write(chunk)
+    return exported, max_id
+
+
+async def _main(args):
+    from database import init_db
+
+    init_db()
+    after_id = args.after_id
+    if args.since_last:
+        # Start from 0 on the first run so pending rows are held back there too
+        after_id = load_cursor(args.cursor) or 0
+
+    output = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        exported, max_id = await export(args.format, output, start=args.start, end=args.end, after_id=after_id)
+    finally:
+        if args.output:
+            output.close()
+
+    if args.since_last and max_id is not None:
+        save_cursor(args.cursor, max_id)
+    print(f"Exported {exported} interactions (last interaction_id: {max_id}).", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream sessions joined with interactions as NDJSON, CSV or columnar JSON.")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    parser.add_argument("--start", type=datetime.datetime.fromisoformat, help="interactions at or after this UTC time")
+    parser.add_argument("--end", type=datetime.datetime.fromisoformat, help="interactions before this UTC time")
+    parser.add_argument("--after-id", type=int, help="only interactions with a larger interaction_id")
+    parser.add_argument("--since-last", action="store_true", help="continue from the cursor file and update it")
+    parser.add_argument("--cursor", default=CURSOR_FILE)
+    asyncio.run(_main(parser.parse_args()))
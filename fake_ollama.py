@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import threading
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+# Local stand-in for Ollama's chat API, for benchmarks and resilience tests.
+# Answers /api/chat (streaming and non-streaming) with plausible JSON for the
+# prompts LLMService sends, after a configurable latency. With load_time set,
+# the model has to be "loaded" first and stays resident for each request's
+# keep_alive, like Ollama; /api/generate without a prompt only loads it.
+# Settings can be changed at runtime through POST /_control.
+
+NEGATIVE_WORDS = ("bad", "slow", "crash", "terrible", "broken", "hate", "bug", "wait", "error", "worst")
+POSITIVE_WORDS = ("great", "love", "good", "fast", "excellent", "nice", "thanks", "easy", "best")
+
+
+class FakeOllamaSettings:
+    def __init__(self, latency=0.5, jitter=0.0, distribution="fixed", error_rate=0.0, parallel=0, spike_rate=0.0, spike_latency=5.0, down=False, load_time=0.0):
+        self.latency = latency              # mean seconds per generation
+        self.jitter = jitter                # stddev (normal) or spread (uniform)
+        self.distribution = distribution    # fixed, normal, uniform, exponential
+        self.error_rate = error_rate        # fraction of requests answered with HTTP 500
+        self.parallel = parallel            # generations served at once (0 = unlimited), like OLLAMA_NUM_PARALLEL
+        self.spike_rate = spike_rate        # fraction of requests that take spike_latency instead
+        self.spike_latency = spike_latency
+        self.down = down                    # answer everything with 503
+        self.load_time = load_time          # seconds to load a model that isn't resident (0 = always resident)
+
+    def sample_latency(self):
+        if self.spike_rate and random.random() < self.spike_rate:
+            return self.spike_latency
+        if self.distribution == "normal":
+            return max(0.0, random.gauss(self.latency, self.jitter))
+        if self.distribution == "uniform":
+            return max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter))
+        if self.distribution == "exponential":
+            return random.expovariate(1.0 / self.latency) if self.latency > 0 else 0.0
+        return self.latency
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _keep_alive_seconds(value, default=300.0):
+    # Ollama accepts durations like "5m"/"30s"/"1h" or plain seconds; negative keeps the model loaded forever
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        units = {"s": 1, "m": 60, "h": 3600}
+        value = value.strip()
+        seconds = float(value[:-1]) * units[value[-1]] if value[-1] in units else float(value)
+    return float("inf") if seconds < 0 else seconds
+
+
+def _sentiment(text):
+    lowered = text.lower()
+    if any(w in lowered for w in NEGATIVE_WORDS):
+        return {"score": -0.7, "label": "Frustrated", "keywords": [w for w in NEGATIVE_WORDS if w in lowered][:3]}
+    if any(w in lowered for w in POSITIVE_WORDS):
+        return {"score": 0.8, "label": "Delight", "keywords": [w for w in POSITIVE_WORDS if w in lowered][:3]}
+    return {"score": 0.0, "label": "Neutral", "keywords": []}
+
+
+def _answer(messages, json_format):
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+
+    if not json_format:
+        return "Reach out personally, apologize, and offer a priority follow-up."
+    if "Summarize" in system or "summary" in system.lower():
+        return json.dumps({"topics": ["service"], "key_pain_point": user[:60], "metrics": {}})
+    try:
+        items = json.loads(user)
+        if isinstance(items, list):
+            return json.dumps({"results": [{"id": item["id"], **_sentiment(item["text"])} for item in items]})
+    except (ValueError, TypeError, KeyError):
+        pass
+    return json.dumps(_sentiment(user))
+
+
+def create_app(settings: FakeOllamaSettings | None = None) -> FastAPI:
+    settings = settings or FakeOllamaSettings()
+    app = FastAPI()
+    app.state.settings = settings
+    # in_flight: requests open at the server, generating: inside a parallel slot
+    stats = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0, "generating": 0, "max_generating": 0, "loads": 0}
+    slots = {"semaphore": None, "size": None}
+    # model -> monotonic time it gets unloaded
+    resident = {}
+    load_lock = asyncio.Lock()
+
+    async def _ensure_loaded(body):
+        # Concurrent requests for a cold model wait for the same load
+        model = body.get("model")
+        if settings.load_time and resident.get(model, 0.0) <= time.monotonic():
+            async with load_lock:
+                if resident.get(model, 0.0) <= time.monotonic():
+                    stats["loads"] += 1
+                    await asyncio.sleep(settings.load_time)
+        resident[model] = time.monotonic() + _keep_alive_seconds(body.get("keep_alive"))
+
+    def _slot():
+        # Recreated when `parallel` changes through /_control
+        if settings.parallel and slots["size"] != settings.parallel:
+            slots["semaphore"] = asyncio.Semaphore(settings.parallel)
+            slots["size"] = settings.parallel
+        return slots["semaphore"] if settings.parallel else None
+
+    async def _generate(body):
+        stats["requests"] += 1
+        if settings.down:
+            stats["errors"] += 1
+            return None, JSONResponse({"error": "service unavailable"}, status_code=503)
+
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        semaphore = _slot()
+        try:
+            await _ensure_loaded(body)
+            if semaphore:
+                await semaphore.acquire()
+            stats["generating"] += 1
+            stats["max_generating"] = max(stats["max_generating"], stats["generating"])
+            try:
+                await asyncio.sleep(settings.sample_latency())
+            finally:
+                stats["generating"] -= 1
+                if semaphore:
+                    semaphore.release()
+        finally:
+            stats["in_flight"] -= 1
+
+        if settings.error_rate and random.random() < settings.error_rate:
+            stats["errors"] += 1
+            return None, JSONResponse({"error": "injected failure"}, status_code=500)
+        return _answer(body.get("messages", []), body.get("format") == "json"), None
+
+    @app.get("/")
+    def root():
+        if settings.down:
+            return JSONResponse("Ollama is down", status_code=503)
+        return "Ollama is running"
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        content, error = await _generate(body)
+        if error is not None:
+            return error
+
+        now = datetime.datetime.utcnow().isoformat() + "Z"
+        final = {"model": body.get("model"), "created_at": now, "message": {"role": "assistant", "content": ""},
+                 "done": True, "done_reason": "stop", "total_duration": 1, "prompt_eval_count": 1, "eval_count": 1}
+        if not body.get("stream", True):
+            final["message"]["content"] = content
+            return final
+
+        async def stream():
+            chunk = {"model": body.get("model"), "created_at": now, "message": {"role": "assistant", "content": content}, "done": False}
+            yield json.dumps(chunk) + "\n"
+            yield json.dumps(final) + "\n"
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        # Only the load-without-prompt form is supported (used to preload / keep a model resident)
+        body = await request.json()
+        if settings.down:
+            return JSONResponse({"error": "service unavailable"}, status_code=503)
+        if body.get("prompt"):
+            return JSONResponse({"error": "prompt generation is not supported by the fake"}, status_code=400)
+        await _ensure_loaded(body)
+        now = datetime.datetime.utcnow().isoformat() + "Z"
+        return {"model": body.get("model"), "created_at": now, "response": "", "done": True, "done_reason": "load"}
+
+    @app.get("/_stats")
+    def get_stats():
+        return {**stats, "settings": settings.as_dict()}
+
+    @app.post("/_control")
+    async def control(request: Request):
+        for key, value in (await request.json()).items():
+            if hasattr(settings, key):
+                setattr(settings, key, value)
+        return settings.as_dict()
+
+    return app
+
+
+class FakeOllamaServer:
+    """
+    Runs the fake server on a background thread, for use inside benchmark
+    scripts:
+
+        with FakeOllamaServer(port=11500, latency=0.2) as server:
+            service = LLMService(base_url=server.url)
+    """
+
+    def __init__(self, port=11500, host="127.0.0.1", **settings):
+        self.settings = FakeOllamaSettings(**settings)
+        self.url = f"http://{host}:{port}"
+        config = uvicorn.Config(create_app(self.settings), host=host, port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama chat API for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per generation")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--distribution", choices=["fixed", "normal", "uniform", "exponential"], default="fixed")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--parallel", type=int, default=0, help="concurrent generations (0 = unlimited)")
+    parser.add_argument("--spike-rate", type=float, default=0.0)
+    parser.add_argument("--spike-latency", type=float, default=5.0)
+    parser.add_argument("--load-time", type=float, default=0.0, help="seconds to load a model that isn't resident")
+    args = parser.parse_args()
+
+    settings = FakeOllamaSettings(
+        latency=args.latency, jitter=args.jitter, distribution=args.distribution, error_rate=args.error_rate,
+        parallel=args.parallel, spike_rate=args.spike_rate, spike_latency=args.spike_latency, load_time=args.load_time,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
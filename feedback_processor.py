@@ -1,206 +1,363 @@
+import asyncio
+import contextlib
 import datetime
+import random
 import re
-from sqlalchemy.orm import Session
+import time
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import SurveySession, Interaction
 from llm_service import LLMService
+from session_cache import SessionState
+from rolling_summary import fold_turns
+import survey_engine
+import analytics
+import keyword_index
+import near_duplicates
+import config
+import metrics
+
+# Process-wide count of which tier produced each turn's sentiment
+SENTIMENT_PATH_COUNTS = {"nps_regex": 0, "local_classifier": 0, "near_duplicate": 0, "llm": 0, "deferred": 0}
+
+SCORE_PATTERN = re.compile(r'\b(10|[0-9])\b')
+
+def score_sentiment(score: int) -> dict:
+    # Sentiment recorded for a bare 0-10 score, without asking the LLM
+    return {
+        'score': (score / 5.0) - 1.0, # Map 0-10 to -1..1 roughly, or just dummy
+        'label': 'Neutral',
+        'keywords': []
+    }
+
+class SessionConflictError(Exception):
+    """Another process changed the session since this turn read it."""
+
+def _lost_race(error) -> bool:
+    # SQLite reports write contention between processes that busy_timeout
+    # couldn't wait out as "database is locked"; like a version conflict,
+    # nothing was written and the turn can be re-run
+    return isinstance(error, SessionConflictError) or (
+        isinstance(error, OperationalError) and "database is locked" in str(error.orig)
+    )
+
+def sentiment_path_stats() -> dict:
+    total = sum(SENTIMENT_PATH_COUNTS.values())
+    skipped = SENTIMENT_PATH_COUNTS["nps_regex"] + SENTIMENT_PATH_COUNTS["local_classifier"] + SENTIMENT_PATH_COUNTS["near_duplicate"]
+    return {
+        **SENTIMENT_PATH_COUNTS,
+        "total": total,
+        "llm_skipped_fraction": round(skipped / total, 4) if total else 0.0,
+    }
 
 class FeedbackProcessor:
-    def __init__(self, llm_service: LLMService, db_session: Session):
+    def __init__(self, llm_service: LLMService, db_session: AsyncSession, classifier=None, session_cache=None, sentiment_queue=None, interaction_log=None, surveys=None, session_locks=None, near_duplicates=None):
         self.llm = llm_service
         self.db = db_session
+        # SurveyRegistry of compiled survey definitions
+        self.surveys = surveys if surveys is not None else survey_engine.default_registry()
+        # Optional LocalSentimentClassifier tried before the LLM
+        self.classifier = classifier
+        # Optional SessionStateCache shared across requests
+        self.session_cache = session_cache
+        # Optional SentimentQueue; when set, turns whose reply doesn't depend
+        # on sentiment return right away and are scored in the background
+        self.sentiment_queue = sentiment_queue
+        # Optional InteractionLog that each turn's record is appended to
+        self.interaction_log = interaction_log
+        # Optional SessionLocks shared across requests; serializes each session's turns
+        self.session_locks = session_locks
+        # Optional NearDuplicateIndex shared across requests; near-duplicates
+        # of LLM-scored texts reuse their result instead of calling the LLM
+        self.near_duplicates = near_duplicates
+
+    async def get_or_create_session(self, session_id: str, survey_id=None) -> SessionState:
+        """
+        Returns the session's state from the cache, or from the DB on a miss.
+        New sessions are not inserted here; the turn's single commit does it.
+        `survey_id` picks the survey of a new session; existing sessions keep theirs.
+        """
+        if self.session_cache is not None:
+            state = self.session_cache.get(session_id)
+            if state is not None:
+                return state
+
+        result = await self.db.execute(
+            select(
+                SurveySession.current_step, SurveySession.nps_score, SurveySession.customer_segment,
+                SurveySession.survey_id, SurveySession.version, SurveySession.end_time,
+            )
+            .where(SurveySession.session_id == session_id)
+        )
+        row = result.first()
+        # End the read transaction so no pooled connection is held while we await the LLM
+        await self.db.rollback()
+        if row is None:
+            # New session, start at the survey's initial state
+            survey = self.surveys.get(survey_id)
+            return SessionState(session_id=session_id, current_step=survey.initial_state, survey_id=survey.id, is_new=True)
+        return SessionState(
+            session_id=session_id, current_step=row.current_step, nps_score=row.nps_score,
+            customer_segment=row.customer_segment, survey_id=row.survey_id, version=row.version,
+            ended=row.end_time is not None,
+        )
+
+    async def process_response(self, user_input: str, session_id: str, customer_segment=None, survey_id=None, deadline=None):
+        """
+        Runs one turn. Turns of the same session wait for each other on the
+        per-session lock; a turn that loses the session's row (or the
+        database write lock) to another process is re-run from a fresh read,
+        at most SESSION_CONFLICT_RETRIES times, and then raises
+        SessionConflictError. `deadline` (time.monotonic()) bounds the LLM
+        call, leaving DEADLINE_RESERVE seconds to store the turn; past it the
+        turn gets the fallback sentiment.
+        """
+        lock = self.session_locks.hold(session_id) if self.session_locks is not None else contextlib.nullcontext()
+        async with lock:
+            for attempt in range(config.SESSION_CONFLICT_RETRIES + 1):
+                try:
+                    return await self._process_turn(user_input, session_id, customer_segment, survey_id, deadline)
+                except Exception as e:
+                    if not _lost_race(e):
+                        raise
+                    await self.db.rollback()
+                    if self.session_cache is not None:
+                        self.session_cache.invalidate(session_id)
+                    if attempt == config.SESSION_CONFLICT_RETRIES:
+                        metrics.SESSION_CONFLICTS.inc(outcome="exhausted")
+                        raise SessionConflictError(session_id) from e
+                    metrics.SESSION_CONFLICTS.inc(outcome="retried")
+                    await asyncio.sleep(config.SESSION_CONFLICT_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
 
-    def get_or_create_session(self, session_id: str) -> SurveySession:
-        session = self.db.query(SurveySession).filter(SurveySession.session_id == session_id).first()
-        if not session:
-            # New session, start at NPS_ASK
-            session = SurveySession(session_id=session_id, current_step="NPS_ASK")
-            self.db.add(session)
-            self.db.commit()
-            self.db.refresh(session)
-        return session
-
-    async def process_response(self, user_input: str, session_id: str, background_tasks=None):
+    async def _process_turn(self, user_input, session_id, customer_segment, survey_id, deadline=None):
         # 1. Get Session
-        session = self.get_or_create_session(session_id)
+        with metrics.stage("get_session"):
+            session = await self.get_or_create_session(session_id, survey_id)
+        survey = self.surveys.get(session.survey_id)
+        segment_changed = customer_segment is not None and customer_segment != session.customer_segment
+        if segment_changed:
+            session.customer_segment = customer_segment
         
-        # FIX: Check if session is already closed, if so, restart it
-        if session.current_step == "CLOSING":
-            session.current_step = "NPS_ASK"
+        # A finished session, or one closed for being idle (retention.py), restarts
+        restarted = False
+        if session.current_step in survey.terminal_states or session.ended:
+            session.current_step = survey.initial_state
             session.nps_score = None
-            session.end_time = None
-            # Ideally archive old interactions, but for now we append to same session or just restart flow
-            self.db.commit()
+            session.ended = False
+            restarted = True
         
         # 2. Analyze Sentiment (Optimized)
+        sentiment_started = time.perf_counter()
         sentiment_result = None
-        if session.current_step == "NPS_ASK":
+        path = None
+        if session.current_step in survey.scored_states:
             score = self.extract_score(user_input)
-            if score is not None:
+            if score is not None and survey.states[session.current_step].score_table[score] is not None:
                 # Fast path for NPS
-                sentiment_result = {
-                    'score': (score / 5.0) - 1.0, # Map 0-10 to -1..1 roughly, or just dummy
-                    'label': 'Neutral', 
-                    'keywords': []
-                }
+                sentiment_result = score_sentiment(score)
+                path = "nps_regex"
+                SENTIMENT_PATH_COUNTS[path] += 1
+        
+        if not sentiment_result and self.classifier is not None:
+            # Local tier: only confident results skip the LLM
+            local_result, confidence = self.classifier.classify(user_input)
+            if confidence >= self.classifier.threshold:
+                sentiment_result = local_result
+                path = "local_classifier"
+                SENTIMENT_PATH_COUNTS[path] += 1
+        
+        signature = near_duplicates.signature(user_input) if path != "nps_regex" else None
+        if not sentiment_result and self.near_duplicates is not None and signature is not None:
+            match = self.near_duplicates.lookup(user_input, signature)
+            if match is not None:
+                sentiment_result = match[0]
+                path = "near_duplicate"
+                SENTIMENT_PATH_COUNTS[path] += 1
+        
+        deferred = False
+        if not sentiment_result and self.sentiment_queue is not None and session.current_step not in survey.sentiment_states:
+            # Reply doesn't need it; a queue worker fills it in later
+            sentiment_result = {'score': None, 'label': None, 'keywords': []}
+            deferred = True
+            path = "deferred"
+            SENTIMENT_PATH_COUNTS[path] += 1
         
         if not sentiment_result:
-            sentiment_result = await self.llm.analyze_sentiment(user_input)
+            llm_deadline = deadline - config.DEADLINE_RESERVE if deadline is not None else None
+            sentiment_result = await self.llm.analyze_sentiment(user_input, deadline=llm_deadline)
+            path = "llm"
+            SENTIMENT_PATH_COUNTS[path] += 1
+        # A fallback is counted under "llm" but stored as "fallback", so near-duplicate lookup never reuses it
+        stored_path = "fallback" if sentiment_result.get('fallback') else path
+        metrics.observe_stage("sentiment", time.perf_counter() - sentiment_started)
         
         # 3. Log Interaction
+        now = datetime.datetime.utcnow()
         interaction = Interaction(
             session_id=session_id,
+            timestamp=now,
             user_input=user_input,
             sentiment_label=sentiment_result.get('label', 'Neutral'),
-            sentiment_score=sentiment_result.get('score', 0.0)
+            sentiment_score=sentiment_result.get('score', 0.0),
+            sentiment_path=stored_path,
+            simhash=signature[0] if signature else None,
         )
         self.db.add(interaction)
+        if deferred:
+            self.sentiment_queue.enqueue(self.db, interaction)
         
         # 4. Determine Next Response & State
-        next_step, bot_response = await self.run_state_machine(session, user_input, sentiment_result)
+        prev_step = session.current_step
+        with metrics.stage("state_machine"):
+            next_step, bot_response = self.run_state_machine(session, user_input, sentiment_result)
         
-        # 5. Update Session State
+        # 5. Update Session State and analytics rollups (all in one commit)
+        persist_started = time.perf_counter()
         session.current_step = next_step
+        session.ended = next_step in survey.terminal_states
+        end_time = now if session.ended else None
         interaction.bot_response = bot_response
-        self.db.commit()
+        if session.is_new:
+            # Idempotent create: if another process created it first, retry on top of its turn
+            result = await self.db.execute(
+                insert(SurveySession)
+                .values(
+                    session_id=session_id, start_time=now, current_step=next_step, nps_score=session.nps_score,
+                    customer_segment=session.customer_segment, survey_id=session.survey_id, version=0,
+                    last_activity=now, end_time=end_time,
+                )
+                .on_conflict_do_nothing(index_elements=["session_id"])
+            )
+        else:
+            values = {
+                "current_step": next_step, "nps_score": session.nps_score, "version": session.version + 1,
+                "last_activity": now,
+            }
+            if restarted or session.ended:
+                values["end_time"] = end_time
+            if segment_changed:
+                values["customer_segment"] = session.customer_segment
+            # Only applies if nobody wrote the session since we read it
+            result = await self.db.execute(
+                update(SurveySession)
+                .where(SurveySession.session_id == session_id, SurveySession.version == session.version)
+                .values(**values)
+            )
+            session.version += 1
+        if result.rowcount != 1:
+            raise SessionConflictError(session_id)
+        events = analytics.turn_events(
+            prev_step, next_step, session.is_new or restarted, self.extract_score(user_input), sentiment_result.get('label'),
+            survey.metric(prev_step), survey.initial_state,
+        )
+        await analytics.record(self.db, events, now, session.customer_segment)
+        if sentiment_result.get('keywords'):
+            await keyword_index.record(self.db, interaction, sentiment_result['keywords'], now, sentiment_result.get('score'))
+        metrics.observe_stage("persist", time.perf_counter() - persist_started)
+        try:
+            with metrics.stage("commit"):
+                await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            if self.session_cache is not None:
+                self.session_cache.invalidate(session_id)
+            raise
+        if self.session_cache is not None:
+            self.session_cache.put(session)
+        if deferred:
+            self.sentiment_queue.notify()
+        if stored_path == "llm" and self.near_duplicates is not None:
+            self.near_duplicates.add(signature, sentiment_result.get('label'), sentiment_result.get('score'),
+                                     interaction.keywords or (), interaction.id)
         
-        # 6. Background Tasks (Logging & Recovery)
-        if background_tasks:
-            # Prepare data for logging since we can't pass DB objects easily if session closes
-            log_data = {
+        # 6. Logging & Background Tasks
+        if self.interaction_log is not None:
+            # In-memory append; the log's writer task batches it to disk
+            self.interaction_log.write({
                 "timestamp": datetime.datetime.now().isoformat(),
                 "session_id": session_id,
                 "user_input": user_input,
                 "sentiment": sentiment_result.get('label'),
                 "score": sentiment_result.get('score'),
                 "bot_response": bot_response
-            }
-            background_tasks.add_task(self.log_to_file, log_data)
+            })
+
+        # No recovery suggestion: the frontend doesn't use it, so we skip the blocking call entirely.
 
-            # Check for recovery (conceptually) - we won't block for it
-            # If we really needed it, we'd add_task here. 
-            # Since frontend doesn't use it, we skip the blocking call entirely.
-        
         return {
             "message": bot_response,
             "sentiment": sentiment_result.get('label'),
             "recommendation": None, # Removed blocking call
-            "status": "success"
+            "status": "success",
+            "sentiment_path": path,
+            "transition": f"{prev_step}->{next_step}"
         }
 
-    def log_to_file(self, data: dict):
-        try:
-            with open("feedback_log.txt", "a", encoding="utf-8") as f:
-                f.write(str(data) + "\n")
-        except Exception as e:
-            print(f"Failed to write log: {e}")
-
-    async def run_state_machine(self, session, user_input, sentiment):
+    def run_state_machine(self, session, user_input, sentiment):
         """
-        Returns (next_state, bot_message) based on current_state + input
+        Returns (next_state, bot_message) based on current_state + input,
+        looked up in the session's compiled survey.
         """
-        import random
-        curr = session.current_step
-        
-        # Responses
-        responses = {
-            "DEEP_DIVE": [
-                "I'm sorry to hear that. Could you tell us what specifically went wrong?",
-                "That's disappointing. What was the main issue you faced?",
-                "We aim to do better. Can you share more details about what happened?"
-            ],
-            "REASONING": [
-                "Thank you. What is one thing we could do to improve?",
-                "Got it. Any specific suggestions for us?",
-                "Thanks for the score. How can we make your experience 10/10?"
-            ],
-            "FAVORITE_FEATURE": [
-                "That's wonderful! What did you enjoy the most?",
-                "Glad to hear it! What was the highlight for you?",
-                "Fantastic! What feature did you like best?"
-            ],
-            "CSAT_ASK_FRUSTRATED": [
-                "I understand your frustration and have flagged this for our team. To wrap up, how would you rate this chat experience (1-5)?",
-                "I'm sorry for the trouble. I've noted your issues. How would you rate this support chat (1-5)?",
-                "Your feedback is important. Before you go, please rate this chat (1-5)."
-            ],
-            "CSAT_ASK_NORMAL": [
-                "Thanks for sharing! How would you rate this chat experience (1-5)?",
-                "Appreciate the feedback! How satisfied were you with this chat (1-5)?",
-                "One last question: How would you rate this conversation (1-5)?"
-            ],
-            "CLOSING": [
-                "Thank you for your feedback! Have a great day.",
-                "All done! Thanks for your time.",
-                "Survey complete. We appreciate your input!"
-            ],
-            "NPS_RETRY": [
-                "I didn't catch that number. On a scale of 0-10, how likely are you to recommend us?",
-                "Could you please provide a number between 0 and 10?",
-                "Sorry, I need a score from 0 to 10. How likely are you to recommend us?"
-            ]
-        }
-        
-        # -- STATE: NPS_ASK (Waiting for score) --
-        if curr == "NPS_ASK":
-            score = self.extract_score(user_input)
-            if score is not None:
-                session.nps_score = score
-                if score <= 6:
-                    return "DEEP_DIVE", random.choice(responses["DEEP_DIVE"])
-                elif score <= 8:
-                    return "REASONING", random.choice(responses["REASONING"])
-                else:
-                    return "FAVORITE_FEATURE", random.choice(responses["FAVORITE_FEATURE"])
-            else:
-                # Invalid input, stay on NPS_ASK
-                return "NPS_ASK", random.choice(responses["NPS_RETRY"])
-
-        # -- STATE: DETAIL COLLECTION --
-        elif curr in ["DEEP_DIVE", "REASONING", "FAVORITE_FEATURE"]:
-            # Transition to CSAT regardless of answer, but use sentiment context
-            if sentiment.get('label') == 'Frustrated':
-                return "CSAT_ASK", random.choice(responses["CSAT_ASK_FRUSTRATED"])
-            
-            return "CSAT_ASK", random.choice(responses["CSAT_ASK_NORMAL"])
-
-        # -- STATE: CSAT_ASK --
-        elif curr == "CSAT_ASK":
-            # Just close
-            return "CLOSING", random.choice(responses["CLOSING"])
-
-        # -- STATE: CLOSING --
-        elif curr == "CLOSING":
-            return "CLOSING", "The survey is complete. Thank you!"
-
-        # Fallback
-        return "NPS_ASK", "How likely are you to recommend us (0-10)?"
+        survey = self.surveys.get(session.survey_id)
+        # Only states with score transitions need the regex
+        score = self.extract_score(user_input) if session.current_step in survey.scored_states else None
+        transition = survey.step(session.current_step, user_input, score, sentiment.get('label'))
+        if transition.set_nps:
+            session.nps_score = score
+        return transition.to, random.choice(transition.responses)
 
     def extract_score(self, text):
         # Match single number 0-10, or "10" at start/end/isolated
         # Also handles "I give it a 10" or "rate 5"
-        match = re.search(r'\b(10|[0-9])\b', text)
+        match = SCORE_PATTERN.search(text)
         if match:
             return int(match.group(1))
         return None
 
-    def should_trigger_recovery(self, session):
+    async def should_trigger_recovery(self, session):
         # Trigger if last 2 interactions were Frustrated
-        # Need to refresh interactions from DB or use the relationship
-        # self.db.refresh(session) # might be expensive, rely on lazy load
-        interactions = session.interactions
-        if len(interactions) < 2:
+        # Lazy loading session.interactions isn't available on AsyncSession, query the last 2 directly
+        result = await self.db.execute(
+            select(Interaction.sentiment_label)
+            .where(Interaction.session_id == session.session_id)
+            .order_by(Interaction.id.desc())
+            .limit(2)
+        )
+        recent = result.scalars().all()
+        if len(recent) < 2:
             return False
         
-        # Check last 2
-        recent = interactions[-2:] 
-        return all(i.sentiment_label == 'Frustrated' for i in recent)
+        return all(label == 'Frustrated' for label in recent)
 
-    async def scale_down_survey(self, session):
-        # Construct transcript
-        transcript = "\n".join([f"User: {i.user_input}\nBot: {i.bot_response}" for i in session.interactions])
-        
-        summary = await self.llm.compress_feedback(transcript)
-        session.summary_json = summary
-        self.db.add(session)
-        self.db.commit()
+    async def scale_down_survey(self, session, token_budget=None):
+        """
+        Incrementally summarizes the session: only interactions after the
+        summary watermark are folded into the existing summary_json, in
+        chunks that fit the token budget. Progress is committed per fold.
+        """
+        token_budget = token_budget or config.SUMMARY_TOKEN_BUDGET
+        result = await self.db.execute(
+            select(SurveySession.summary_json, SurveySession.summary_watermark).where(SurveySession.session_id == session.session_id)
+        )
+        summary, watermark = result.first()
+        result = await self.db.execute(
+            select(Interaction.id, Interaction.user_input, Interaction.bot_response)
+            .where(Interaction.session_id == session.session_id, Interaction.id > (watermark or 0))
+            .order_by(Interaction.id)
+        )
+        turns = result.all()
+        await self.db.rollback()
 
+        try:
+            async for summary, watermark in fold_turns(self.llm, summary, turns, token_budget):
+                await self.db.execute(
+                    update(SurveySession)
+                    .where(SurveySession.session_id == session.session_id)
+                    .values(summary_json=summary, summary_watermark=watermark)
+                )
+                await self.db.commit()
+        except Exception as e:
+            print(f"ScaleDown stopped at watermark {watermark}: {e}")
+        return summary
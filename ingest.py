@@ -0,0 +1,511 @@
+import argparse
+import asyncio
+import codecs
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+import traceback
+import uuid
+from collections import Counter, deque
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+from models import IngestJob, Interaction, InteractionKeyword, SentimentJob, SurveySession
+from feedback_processor import SCORE_PATTERN, score_sentiment
+from llm_scheduler import BACKGROUND
+import analytics
+import keyword_index
+import metrics
+import near_duplicates as near_dup
+
+# Bulk ingestion of historical feedback (survey exports, app-store reviews)
+# from NDJSON or CSV. Rows are scored with bounded concurrency (bare 0-10
+# scores and confident local-classifier results skip the LLM), inserted in
+# batches and checkpointed in the same commit, so an interrupted job resumes
+# where it stopped. Each job's rows go into one session ("import-<job id>")
+# that is not driven by a survey.
+#
+#   python ingest.py reviews.csv --segment smb > results.ndjson
+#   python ingest.py reviews.csv --job-id <id>      # resume
+
+FORMATS = ("ndjson", "csv")
+IMPORT_SURVEY_ID = "import"
+IMPORT_STEP = "IMPORTED"
+TEXT_FIELDS = ("text", "user_input", "feedback", "review")
+
+
+class IngestConflictError(Exception):
+    """The job is already running, or another process advanced its checkpoint."""
+
+
+def _pending(item):
+    return isinstance(item[2], asyncio.Task) and not item[2].done()
+
+
+def _naive_utc(ts):
+    # Timestamps are stored as naive UTC
+    if ts is not None and ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+async def iter_lines(chunks):
+    """Decodes an async stream of byte chunks into lines."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        if "\n" not in pending:
+            continue
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_records(lines, fmt):
+    """
+    Yields (row number, record dict) for each input record, or (row number,
+    error message) for one that can't be parsed. CSV needs a header row;
+    quoted fields may span lines.
+    """
+    number = 0
+    if fmt == "ndjson":
+        async for line in lines:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, f"invalid JSON: {e}"
+                continue
+            yield number, record if isinstance(record, dict) else "expected a JSON object"
+        return
+
+    header = None
+    buffer, quotes = [], 0
+    async for line in lines:
+        buffer.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            # Inside a quoted field that continues on the next line
+            continue
+        text = "\n".join(buffer)
+        buffer, quotes = [], 0
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        number += 1
+        yield number, dict(zip(header, values))
+    if buffer:
+        yield number + 1, "unterminated quoted field"
+
+
+def parse_record(record):
+    """Returns (text, timestamp, external id); raises ValueError for unusable rows."""
+    text = next((record[f] for f in TEXT_FIELDS if isinstance(record.get(f), str) and record[f].strip()), None)
+    if text is None:
+        raise ValueError(f"missing text (one of {', '.join(TEXT_FIELDS)})")
+    ts = record.get("timestamp") or None
+    if ts is not None:
+        try:
+            ts = _naive_utc(datetime.datetime.fromisoformat(str(ts).strip()))
+        except ValueError:
+            raise ValueError(f"invalid timestamp {ts!r}")
+    return text, ts, record.get("id")
+
+
+class BulkIngestor:
+    """
+    Runs ingest jobs against the database. Bare scores and confident local
+    classifier results are scored inline; at most `concurrency` rows wait on
+    the LLM at once (enough to fill LLM_MAX_CONCURRENCY slots with full
+    sentiment batches). Results come back in input order and are committed
+    every `batch_size` rows together with the job's checkpoint (rows_done).
+    Sentiment calls use the BACKGROUND priority, so live turns go first.
+    With a SentimentQueue, rows whose LLM call fails are stored unscored and
+    queued; without one they get the Neutral fallback, as live turns do.
+    With a NearDuplicateIndex, near-duplicates of LLM-scored texts (from
+    earlier turns or batches) reuse their result too.
+    """
+
+    def __init__(self, session_factory, llm_service, classifier=None, sentiment_queue=None, concurrency=16, batch_size=500,
+                 near_duplicates=None):
+        self.session_factory = session_factory
+        self.llm = llm_service
+        self.classifier = classifier
+        self.sentiment_queue = sentiment_queue
+        self.near_duplicates = near_duplicates
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.active = {}  # job id -> progress of jobs running in this process
+
+    async def open(self, job_id=None, fmt="ndjson", source=None, segment=None) -> dict:
+        """
+        Creates a job, or loads an existing one to resume it (a resumed job
+        keeps its original format and segment).
+        """
+        job_id = job_id or uuid.uuid4().hex
+        if job_id in self.active:
+            raise IngestConflictError(f"ingest job {job_id} is already running")
+        now = datetime.datetime.utcnow()
+        async with self.session_factory() as db:
+            session_id = f"import-{job_id}"
+            # Idempotent, in case another process creates the same job at once
+            await db.execute(
+                insert(SurveySession)
+                .values(session_id=session_id, start_time=now, last_activity=now, current_step=IMPORT_STEP,
+                        customer_segment=segment, survey_id=IMPORT_SURVEY_ID, version=0)
+                .on_conflict_do_nothing(index_elements=["session_id"])
+            )
+            await db.execute(
+                insert(IngestJob)
+                .values(id=job_id, source=source, format=fmt, session_id=session_id, status="running",
+                        rows_done=0, inserted=0, invalid=0, created_at=now, updated_at=now)
+                .on_conflict_do_nothing(index_elements=["id"])
+            )
+            await db.commit()
+            row = (await db.execute(
+                select(IngestJob, SurveySession.customer_segment)
+                .join(SurveySession, SurveySession.session_id == IngestJob.session_id)
+                .where(IngestJob.id == job_id)
+            )).one()
+        job, segment = row
+        return {
+            "job_id": job.id, "source": job.source, "format": job.format, "session_id": job.session_id,
+            "segment": segment, "status": job.status, "rows_done": job.rows_done,
+            "inserted": job.inserted, "invalid": job.invalid,
+        }
+
+    async def run(self, job, chunks):
+        """
+        Ingests the raw input `chunks` (async iterable of bytes) for a job
+        from open(). Yields, per committed batch, one result per row and a
+        progress record, then a final summary. Rows up to the job's
+        checkpoint are skipped.
+        """
+        if job["job_id"] in self.active:
+            raise IngestConflictError(f"ingest job {job['job_id']} is already running")
+        progress = self.active[job["job_id"]] = {
+            **job, "status": "running", "rows_this_run": 0, "paths": Counter(), "started": time.perf_counter(),
+        }
+        # Rows in input order; each is (row number, parsed row, outcome) where
+        # outcome is an error message, a (sentiment, path) pair or the LLM task
+        window = deque()
+        llm_slots = asyncio.Semaphore(self.concurrency)
+        batch = []
+        try:
+            async for number, record in iter_records(iter_lines(chunks), job["format"]):
+                if number <= job["rows_done"]:
+                    continue
+                window.append(await self._start(number, record, llm_slots))
+                # Take finished rows off the head; wait for it only when the window is full
+                while window and (len(window) >= self.batch_size or not _pending(window[0])):
+                    batch.append(await self._finish(window.popleft()))
+                    if len(batch) >= self.batch_size:
+                        for result in await self._commit(progress, batch):
+                            yield result
+                        batch = []
+            while window:
+                batch.append(await self._finish(window.popleft()))
+                if len(batch) >= self.batch_size:
+                    for result in await self._commit(progress, batch):
+                        yield result
+                    batch = []
+            for result in await self._commit(progress, batch, final=True):
+                yield result
+            yield {"summary": self._snapshot(progress)}
+        except IngestConflictError:
+            raise
+        except Exception:
+            # Committed batches stay; the job can be resumed from its checkpoint
+            await self._fail(progress)
+            raise
+        finally:
+            for _, _, outcome in window:
+                if isinstance(outcome, asyncio.Task):
+                    outcome.cancel()
+            self.active.pop(job["job_id"], None)
+
+    async def _fail(self, progress):
+        progress["status"] = "failed"
+        try:
+            async with self.session_factory() as db:
+                await db.execute(
+                    update(IngestJob)
+                    .where(IngestJob.id == progress["job_id"])
+                    .values(status="failed", updated_at=datetime.datetime.utcnow())
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"Ingest job {progress['job_id']} status update failed: {e}")
+
+    async def _start(self, number, record, llm_slots):
+        if isinstance(record, str):
+            return number, None, record
+        try:
+            parsed = parse_record(record)
+        except ValueError as e:
+            return number, None, str(e)
+        text = parsed[0]
+        # A row that is only a 0-10 score (an NPS column) takes the live NPS fast path
+        match = SCORE_PATTERN.fullmatch(text.strip())
+        if match:
+            return number, parsed, (score_sentiment(int(match.group(1))), "nps_regex")
+        if self.classifier is not None:
+            result, confidence = self.classifier.classify(text)
+            if confidence >= self.classifier.threshold:
+                return number, parsed, (result, "local_classifier")
+        if self.near_duplicates is not None:
+            found = self.near_duplicates.lookup(text)
+            if found is not None:
+                return number, parsed, (found[0], "near_duplicate")
+        # Stops reading input while `concurrency` rows already wait on the LLM
+        await llm_slots.acquire()
+        task = asyncio.ensure_future(self._analyze(text))
+        task.add_done_callback(lambda _: llm_slots.release())
+        return number, parsed, task
+
+    async def _finish(self, item):
+        number, parsed, outcome = item
+        if isinstance(outcome, str):
+            return {"row": number, "error": outcome}
+        sentiment, path = await outcome if isinstance(outcome, asyncio.Task) else outcome
+        text, ts, external_id = parsed
+        return {"row": number, "id": external_id, "text": text, "timestamp": ts, "sentiment": sentiment, "path": path}
+
+    async def _analyze(self, text):
+        if self.sentiment_queue is None:
+            return await self.llm.analyze_sentiment(text, priority=BACKGROUND), "llm"
+        try:
+            return await self.llm.analyze_sentiment(text, fallback=False, priority=BACKGROUND), "llm"
+        except Exception:
+            return {"score": None, "label": None, "keywords": []}, "deferred"
+
+    async def _commit(self, progress, batch, final=False):
+        now = datetime.datetime.utcnow()
+        rows = [r for r in batch if "error" not in r]
+        rows_done = batch[-1]["row"] if batch else progress["rows_done"]
+        values = {
+            "rows_done": rows_done,
+            "inserted": progress["inserted"] + len(rows),
+            "invalid": progress["invalid"] + len(batch) - len(rows),
+            "updated_at": now,
+            # A resumed job that had failed shows as running again
+            "status": "completed" if final else "running",
+        }
+
+        async with self.session_factory() as db:
+            ids = []
+            if rows:
+                indexed = [keyword_index.index_terms(r["sentiment"].get("keywords")) for r in rows]
+                signatures = [near_dup.signature(r["text"]) if r["path"] != "nps_regex" else None for r in rows]
+                stored_paths = ["fallback" if r["sentiment"].get("fallback") else r["path"] for r in rows]
+                result = await db.execute(
+                    insert(Interaction).returning(Interaction.id, sort_by_parameter_order=True),
+                    [{
+                        "session_id": progress["session_id"],
+                        "timestamp": r["timestamp"] or now,
+                        "user_input": r["text"],
+                        "bot_response": None,
+                        "sentiment_label": r["sentiment"].get("label"),
+                        "sentiment_score": r["sentiment"].get("score"),
+                        "keywords": normalized if r["path"] != "deferred" else None,
+                        "sentiment_path": stored_path,
+                        "simhash": sig[0] if sig else None,
+                    } for r, (normalized, _), sig, stored_path in zip(rows, indexed, signatures, stored_paths)],
+                )
+                ids = result.scalars().all()
+                postings = [{"keyword": term, "interaction_id": i} for i, (_, terms) in zip(ids, indexed) for term in terms]
+                if postings:
+                    await db.execute(insert(InteractionKeyword), postings)
+                deferred = [{"interaction_id": i} for i, r in zip(ids, rows) if r["path"] == "deferred"]
+                if deferred:
+                    await db.execute(insert(SentimentJob), deferred)
+                # Imported rows only count towards sentiment; deferred ones are counted by the queue
+                counts, keyword_counts = Counter(), {}
+                for r, (_, terms) in zip(rows, indexed):
+                    if r["sentiment"].get("label") is not None:
+                        analytics.rollup_counts(analytics.import_events(r["sentiment"]["label"]), r["timestamp"] or now,
+                                                progress["segment"], counts)
+                        keyword_index.rollup_counts(terms, r["timestamp"] or now, r["sentiment"].get("score"), keyword_counts)
+                await analytics.apply_counts(db, counts)
+                await keyword_index.apply_counts(db, keyword_counts)
+            # Keeps the idle-close pass from closing the import session mid-job
+            await db.execute(
+                update(SurveySession).where(SurveySession.session_id == progress["session_id"]).values(last_activity=now)
+            )
+            # Only advances from the checkpoint this run started at, so a
+            # second runner of the same job can't insert rows twice
+            result = await db.execute(
+                update(IngestJob)
+                .where(IngestJob.id == progress["job_id"], IngestJob.rows_done == progress["rows_done"])
+                .values(**values)
+            )
+            if result.rowcount != 1:
+                await db.rollback()
+                raise IngestConflictError(f"ingest job {progress['job_id']} was advanced by another process")
+            await db.commit()
+
+        progress.update(values)
+        progress["rows_this_run"] += len(batch)
+        if self.sentiment_queue is not None and any(r["path"] == "deferred" for r in rows):
+            self.sentiment_queue.notify()
+        if self.near_duplicates is not None and rows:
+            for i, r, (normalized, _), sig, stored_path in zip(ids, rows, indexed, signatures, stored_paths):
+                if stored_path == "llm":
+                    self.near_duplicates.add(sig, r["sentiment"].get("label"), r["sentiment"].get("score"), normalized, i)
+
+        results = []
+        interaction_ids = iter(ids)
+        for r in batch:
+            if "error" in r:
+                metrics.INGEST_ROWS.inc(path="invalid")
+                results.append(r)
+                continue
+            metrics.INGEST_ROWS.inc(path=r["path"])
+            progress["paths"][r["path"]] += 1
+            result = {"row": r["row"], "interaction_id": next(interaction_ids), "label": r["sentiment"].get("label"),
+                      "score": r["sentiment"].get("score"), "path": r["path"]}
+            if r["id"] is not None:
+                result["id"] = r["id"]
+            results.append(result)
+        results.append({"progress": self._snapshot(progress)})
+        return results
+
+    def _snapshot(self, progress):
+        elapsed = time.perf_counter() - progress["started"]
+        return {
+            "job_id": progress["job_id"],
+            "status": progress["status"],
+            "rows_done": progress["rows_done"],
+            "inserted": progress["inserted"],
+            "invalid": progress["invalid"],
+            "rows_this_run": progress["rows_this_run"],
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_sec": round(progress["rows_this_run"] / elapsed, 1) if elapsed else 0.0,
+            "paths": dict(progress["paths"]),
+        }
+
+    async def status(self, job_id):
+        """Live progress of a job running in this process, else its stored state (None if unknown)."""
+        if job_id in self.active:
+            return {**self._snapshot(self.active[job_id]), "active": True}
+        async with self.session_factory() as db:
+            job = await db.get(IngestJob, job_id)
+        if job is None:
+            return None
+        return {
+            "job_id": job.id, "status": job.status, "source": job.source, "format": job.format,
+            "session_id": job.session_id, "rows_done": job.rows_done, "inserted": job.inserted,
+            "invalid": job.invalid, "created_at": job.created_at.isoformat(),
+            "updated_at": job.updated_at.isoformat(), "active": False,
+        }
+
+
+async def serialize(results):
+    """NDJSON lines for a run(); a failure mid-job becomes a final error record."""
+    try:
+        async for result in results:
+            yield json.dumps(result, default=str) + "\n"
+    except IngestConflictError as e:
+        yield json.dumps({"error": str(e), "status": "conflict"}) + "\n"
+    except Exception as e:
+        print(f"Ingest job failed: {e}")
+        traceback.print_exc()
+        yield json.dumps({"error": f"{type(e).__name__}: {e}", "status": "failed"}) + "\n"
+
+
+async def read_file(path, chunk_size=64 * 1024):
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while chunk := f.read(chunk_size):
+            yield chunk
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+async def _main(args):
+    import config
+    from database import AsyncSessionLocal
+    from llm_cache import LLMCache
+    from llm_backends import pool_from_config
+    from llm_service import LLMService
+    from local_classifier import LocalSentimentClassifier
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    llm = LLMService(
+        model_name=config.OLLAMA_MODEL,
+        timeout=config.LLM_TIMEOUT,
+        pool=pool_from_config(),
+        batch_max_size=config.SENTIMENT_BATCH_MAX_SIZE,
+        batch_max_wait=config.SENTIMENT_BATCH_MAX_WAIT,
+        cache=LLMCache(AsyncSessionLocal, max_entries=config.LLM_CACHE_MAX_ENTRIES, ttl=config.LLM_CACHE_TTL),
+        keep_alive=config.OLLAMA_KEEP_ALIVE,
+    )
+    llm.pool.start(llm.check_connection)
+    classifier = None
+    if config.LOCAL_CLASSIFIER_ENABLED:
+        classifier = LocalSentimentClassifier(threshold=config.LOCAL_CLASSIFIER_THRESHOLD, lexicon_path=config.LOCAL_CLASSIFIER_LEXICON)
+    # --defer: the app's SentimentQueue (DEFER_SENTIMENT=1) scores rows the LLM failed on
+    queue = None
+    if args.defer:
+        from sentiment_queue import SentimentQueue
+        queue = SentimentQueue(AsyncSessionLocal, llm)
+    near_duplicates = None
+    if config.NEAR_DUP_ENABLED:
+        near_duplicates = near_dup.NearDuplicateIndex(max_distance=config.NEAR_DUP_MAX_DISTANCE, max_entries=config.NEAR_DUP_MAX_ENTRIES)
+        await near_duplicates.load(AsyncSessionLocal)
+    ingestor = BulkIngestor(AsyncSessionLocal, llm, classifier=classifier, sentiment_queue=queue,
+                            concurrency=args.concurrency, batch_size=args.batch_size, near_duplicates=near_duplicates)
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        job = await ingestor.open(args.job_id, fmt, source=os.path.basename(args.path), segment=args.segment)
+        print(f"Ingest job {job['job_id']} ({fmt}), resuming after row {job['rows_done']}" if job["rows_done"]
+              else f"Ingest job {job['job_id']} ({fmt})", file=sys.stderr)
+        async for result in ingestor.run(job, read_file(args.path)):
+            if "progress" in result:
+                p = result["progress"]
+                print(f"  {p['rows_done']} rows ({p['inserted']} inserted, {p['invalid']} invalid), "
+                      f"{p['rows_per_sec']} rows/s, paths {p['paths']}", file=sys.stderr)
+                continue
+            if "summary" in result:
+                p = result["summary"]
+                print(f"Done: {p['rows_this_run']} rows in {p['elapsed_seconds']}s this run, job {p['status']}.", file=sys.stderr)
+                continue
+            output.write(json.dumps(result, default=str) + "\n")
+    finally:
+        if args.output:
+            output.close()
+        await llm.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import feedback from NDJSON or CSV (resumable).")
+    parser.add_argument("path", help="input file, or - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--job-id", help="resume this job (default: start a new one)")
+    parser.add_argument("--segment", help="customer_segment of the imported rows")
+    parser.add_argument("--output", help="per-row results as NDJSON (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=None, help="rows waiting on the LLM at once (default: INGEST_CONCURRENCY)")
+    parser.add_argument("--batch-size", type=int, default=None, help="rows per commit (default: INGEST_BATCH_SIZE)")
+    parser.add_argument("--defer", action="store_true", help="queue rows whose LLM call fails for the sentiment queue")
+    args = parser.parse_args()
+
+    import config
+    from database import init_db
+
+    init_db()
+    args.concurrency = args.concurrency or config.INGEST_CONCURRENCY
+    args.batch_size = args.batch_size or config.INGEST_BATCH_SIZE
+    asyncio.run(_main(args))
@@ -0,0 +1,139 @@
+import asyncio
+import collections
+import datetime
+import gzip
+import json
+import os
+import shutil
+import time
+
+
+class InteractionLog:
+    """
+    Per-process JSONL log of interactions.
+
+    `write()` only appends the record to an in-memory queue, so it costs the
+    request path microseconds. One background task drains the queue every
+    `flush_interval` seconds (or as soon as `batch_size` records are waiting)
+    and writes each batch with a single write+flush to a file that stays open.
+    The file is rotated when it reaches `max_bytes` or is older than
+    `rotate_interval` seconds (0 disables time-based rotation); rotated files
+    are gzipped if `compress` is set.
+    When more than `max_queue` records are waiting, new ones are dropped and
+    counted rather than growing memory without bound.
+    """
+
+    def __init__(self, path="feedback_log.jsonl", flush_interval=1.0, batch_size=512,
+                 max_bytes=50 * 1024 * 1024, rotate_interval=24 * 3600, compress=True, max_queue=100000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self.max_queue = max_queue
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self.errors = 0
+        self._queue = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+
+    def write(self, record: dict):
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(record)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Drain everything still queued before closing the file
+        self._stopping = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        while self._queue:
+            await self._flush()
+        await asyncio.to_thread(self._close)
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "errors": self.errors,
+        }
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                await self._flush()
+
+    async def _flush(self):
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        data = "".join(json.dumps(record, default=str) + "\n" for record in batch)
+        try:
+            await asyncio.to_thread(self._write_batch, data)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Failed to write interaction log batch of {len(batch)}: {e}")
+
+    # The methods below run in a worker thread
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+        # Time-based rotation counts from when this process opened the file
+        self._opened_at = time.time()
+
+    def _close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write_batch(self, data: str):
+        if self._file is None:
+            self._open()
+        expired = self.rotate_interval and time.time() - self._opened_at >= self.rotate_interval
+        if self._size and (self._size >= self.max_bytes or expired):
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data.encode("utf-8"))
+
+    def _rotate(self):
+        self._close()
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        rotated = f"{self.path}.{stamp}"
+        n = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = f"{self.path}.{stamp}.{n}"
+            n += 1
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self.rotations += 1
+        self._open()
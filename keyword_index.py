@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+import datetime
+import math
+import re
+import unicodedata
+from sqlalchemy import select, update, delete, exists, func, case, literal, union_all
+from sqlalchemy.dialects.sqlite import insert
+from models import Interaction, InteractionKeyword, KeywordRollup
+from local_classifier import STOPWORDS
+from analytics import BUCKET_SIZES, bucket_start
+
+# Keyword persistence, an inverted index and per-keyword time buckets. Each
+# turn stores the normalized keywords of its sentiment result on the
+# Interaction, adds (term, interaction_id) postings and upserts its mentions
+# into keyword_rollups in the same commit. Search walks postings by primary
+# key and trending reads rollup rows only, so neither scans user_input.
+
+MAX_KEYWORDS = 8  # per interaction
+MAX_KEYWORD_LENGTH = 48
+SENTIMENT_WEIGHTS = ("negative", "positive", "any")
+WINDOW_STEPS = {"hour": datetime.timedelta(hours=1), "day": datetime.timedelta(days=1)}
+
+
+def normalize_keyword(keyword):
+    """
+    "The  Checkout-Page!" -> "checkout page". Returns None for keywords that
+    are empty, numeric or too long once normalized.
+    """
+    text = unicodedata.normalize("NFKC", str(keyword)).lower().replace("'", "").replace("’", "")
+    words = re.findall(r"[^\W_]+", text)
+    while words and words[0] in STOPWORDS:
+        words.pop(0)
+    while words and words[-1] in STOPWORDS:
+        words.pop()
+    phrase = " ".join(words)
+    if not phrase or phrase.isdigit() or len(phrase) > MAX_KEYWORD_LENGTH:
+        return None
+    return phrase
+
+
+def index_terms(keywords):
+    """
+    Returns (normalized keywords, index terms). Terms are the keywords plus
+    the content words of multi-word keywords, so "checkout" also finds
+    "checkout page".
+    """
+    normalized = []
+    for keyword in keywords or []:
+        phrase = normalize_keyword(keyword)
+        if phrase is not None and phrase not in normalized:
+            normalized.append(phrase)
+            if len(normalized) == MAX_KEYWORDS:
+                break
+    terms = dict.fromkeys(normalized)
+    for phrase in normalized:
+        if " " in phrase:
+            terms.update(dict.fromkeys(w for w in phrase.split() if len(w) > 2 and w not in STOPWORDS and not w.isdigit()))
+    return normalized, list(terms)
+
+
+def rollup_counts(terms, ts, score, counts=None) -> dict:
+    """(bucket, bucket_start, term) -> [mentions, scored mentions, sentiment sum]."""
+    counts = counts if counts is not None else {}
+    for bucket in BUCKET_SIZES:
+        start = bucket_start(ts, bucket)
+        for term in terms:
+            entry = counts.setdefault((bucket, start, term), [0, 0, 0.0])
+            entry[0] += 1
+            if score is not None:
+                entry[1] += 1
+                entry[2] += score
+    return counts
+
+
+_insert = insert(KeywordRollup)
+_UPSERT = _insert.on_conflict_do_update(
+    index_elements=["bucket", "bucket_start", "keyword"],
+    set_={
+        "count": KeywordRollup.count + _insert.excluded["count"],
+        "scored": KeywordRollup.scored + _insert.excluded["scored"],
+        "sentiment_sum": KeywordRollup.sentiment_sum + _insert.excluded["sentiment_sum"],
+    },
+)
+
+
+async def apply_counts(db, counts: dict):
+    """Upserts `counts` on the caller's session; applied when it commits."""
+    if not counts:
+        return
+    # Executed with a parameter list rather than .values([...]) so the
+    # statement compiles once, whatever the number of rows
+    await db.execute(_UPSERT, [
+        {"bucket": b, "bucket_start": start, "keyword": term, "count": n, "scored": scored, "sentiment_sum": total}
+        for (b, start, term), (n, scored, total) in counts.items()
+    ])
+
+
+async def record(db, interaction, keywords, ts, score):
+    """
+    Indexes a new `interaction` (not flushed yet) on the caller's session:
+    its keywords column, postings and rollups all land in the caller's commit.
+    """
+    normalized, terms = index_terms(keywords)
+    interaction.keywords = normalized
+    for term in terms:
+        db.add(InteractionKeyword(keyword=term, interaction=interaction))
+    await apply_counts(db, rollup_counts(terms, ts, score))
+
+
+async def record_existing(db, interaction_id, keywords, ts, score):
+    # For interactions scored after they were stored (deferred sentiment)
+    normalized, terms = index_terms(keywords)
+    await db.execute(update(Interaction).where(Interaction.id == interaction_id).values(keywords=normalized))
+    if terms:
+        await db.execute(
+            insert(InteractionKeyword)
+            .values([{"keyword": term, "interaction_id": interaction_id} for term in terms])
+            .on_conflict_do_nothing()
+        )
+    await apply_counts(db, rollup_counts(terms, ts, score))
+
+
+def _parse_query(q):
+    # Comma-separated keywords, all of which must match
+    terms = []
+    for part in (q or "").split(","):
+        term = normalize_keyword(part)
+        if term is not None and term not in terms:
+            terms.append(term)
+    return terms
+
+
+async def mentions(db, terms) -> dict:
+    """All-time mention count per term, from the daily rollups."""
+    result = await db.execute(
+        select(KeywordRollup.keyword, func.sum(KeywordRollup.count))
+        .where(KeywordRollup.keyword.in_(terms), KeywordRollup.bucket == "day")
+        .group_by(KeywordRollup.keyword)
+    )
+    counts = dict(result.all())
+    return {term: counts.get(term, 0) for term in terms}
+
+
+async def search(db, q, limit=50, before_id=None) -> dict:
+    """
+    Interactions indexed under every keyword in `q`, newest first. Pass
+    `next_before_id` back as `before_id` for the next page.
+    """
+    terms = _parse_query(q)
+    if not terms:
+        return {"terms": [], "mentions": {}, "results": [], "next_before_id": None}
+    counts = await mentions(db, terms)
+    if min(counts.values()) == 0:
+        return {"terms": terms, "mentions": counts, "results": [], "next_before_id": None}
+
+    # Walk the rarest term's postings; check the others by primary key
+    driver, *others = sorted(terms, key=counts.get)
+    posting = InteractionKeyword.__table__.alias("posting")
+    stmt = (
+        select(
+            Interaction.id, Interaction.session_id, Interaction.timestamp, Interaction.user_input,
+            Interaction.sentiment_label, Interaction.sentiment_score, Interaction.keywords,
+        )
+        .join(posting, posting.c.interaction_id == Interaction.id)
+        .where(posting.c.keyword == driver)
+    )
+    if before_id is not None:
+        stmt = stmt.where(posting.c.interaction_id < before_id)
+    for term in others:
+        stmt = stmt.where(exists().where(
+            InteractionKeyword.keyword == term, InteractionKeyword.interaction_id == posting.c.interaction_id
+        ))
+    rows = (await db.execute(stmt.order_by(posting.c.interaction_id.desc()).limit(limit))).all()
+    results = [
+        {
+            "interaction_id": row.id, "session_id": row.session_id, "timestamp": row.timestamp.isoformat(),
+            "user_input": row.user_input, "sentiment_label": row.sentiment_label,
+            "sentiment_score": row.sentiment_score, "keywords": row.keywords,
+        }
+        for row in rows
+    ]
+    return {
+        "terms": terms,
+        "mentions": counts,
+        "results": results,
+        "next_before_id": results[-1]["interaction_id"] if len(results) == limit else None,
+    }
+
+
+async def trending(db, bucket="hour", window=24, limit=20, min_count=3, sentiment="negative", now=None) -> dict:
+    """
+    Keywords mentioned more in the last `window` buckets than in the
+    `window` buckets before. The rise is scored like a Poisson z-score,
+    (recent - previous) / sqrt(previous + 1), and weighted by the keyword's
+    average sentiment: "negative" ranks rising complaints first (weight
+    1 - avg, so 0..2), "positive" rising praise, "any" ignores sentiment.
+    """
+    now = now or datetime.datetime.utcnow()
+    step = WINDOW_STEPS[bucket]
+    recent_start = bucket_start(now, bucket) - (window - 1) * step
+    previous_start = recent_start - window * step
+    is_recent = KeywordRollup.bucket_start >= recent_start
+    recent = func.sum(case((is_recent, KeywordRollup.count), else_=0)).label("recent")
+    result = await db.execute(
+        select(
+            KeywordRollup.keyword,
+            recent,
+            func.sum(case((is_recent, 0), else_=KeywordRollup.count)).label("previous"),
+            func.sum(case((is_recent, KeywordRollup.scored), else_=0)).label("scored"),
+            func.sum(case((is_recent, KeywordRollup.sentiment_sum), else_=0.0)).label("sentiment_sum"),
+        )
+        .where(KeywordRollup.bucket == bucket, KeywordRollup.bucket_start >= previous_start)
+        .group_by(KeywordRollup.keyword)
+        .having(recent >= min_count)
+    )
+
+    topics = []
+    for row in result:
+        rise = (row.recent - row.previous) / math.sqrt(row.previous + 1)
+        if rise <= 0:
+            continue
+        average = row.sentiment_sum / row.scored if row.scored else 0.0
+        weight = {"negative": 1 - average, "positive": 1 + average}.get(sentiment, 1.0)
+        topics.append({
+            "keyword": row.keyword,
+            "recent": row.recent,
+            "previous": row.previous,
+            "avg_sentiment": round(average, 3),
+            "score": round(rise * weight, 3),
+        })
+    topics.sort(key=lambda t: (-t["score"], t["keyword"]))
+    return {
+        "bucket": bucket,
+        "window": window,
+        "recent_start": recent_start.isoformat(),
+        "previous_start": previous_start.isoformat(),
+        "sentiment": sentiment,
+        "topics": topics[:limit],
+    }
+
+
+async def rebuild(session_factory, batch_size=5000, archive_path=None):
+    """
+    Recomputes postings and rollups from interactions.keywords in one
+    commit; run it with the app stopped. Rollups also count the archived
+    interactions in the archive database at `archive_path`; postings only
+    cover live ones, as after retention.py.
+    """
+    # Imported here: retention imports this module
+    from retention import attached_archive, attached_interactions
+
+    counts = {}
+    postings = []
+    interactions = 0
+    async with session_factory() as db, attached_archive(db, archive_path) as attached:
+        await db.execute(delete(InteractionKeyword))
+        rows = select(
+            Interaction.id, Interaction.timestamp, Interaction.sentiment_score, Interaction.keywords, literal(True).label("live"),
+        ).where(Interaction.keywords.is_not(None))
+        if attached:
+            archived = attached_interactions.c
+            rows = union_all(rows, select(
+                archived.id, archived.timestamp, archived.sentiment_score, archived.keywords, literal(False).label("live"),
+            ).where(archived.keywords.is_not(None)))
+        result = await db.stream(select(rows.subquery()).execution_options(yield_per=batch_size))
+        async for row in result:
+            _, terms = index_terms(row.keywords)
+            rollup_counts(terms, row.timestamp, row.sentiment_score, counts)
+            if row.live:
+                postings.extend({"keyword": term, "interaction_id": row.id} for term in terms)
+            interactions += 1
+            if len(postings) >= batch_size:
+                await db.execute(insert(InteractionKeyword), postings)
+                postings = []
+        await result.close()
+        if postings:
+            await db.execute(insert(InteractionKeyword), postings)
+
+        await db.execute(delete(KeywordRollup))
+        rows = list(counts.items())
+        for i in range(0, len(rows), batch_size):
+            await apply_counts(db, dict(rows[i:i + batch_size]))
+        await db.commit()
+    return interactions, len(counts)
+
+
+async def _main(args):
+    import config
+    from database import AsyncSessionLocal, init_db
+
+    init_db()
+    if args.command == "rebuild":
+        interactions, rows = await rebuild(AsyncSessionLocal, archive_path=config.ARCHIVE_DATABASE_PATH)
+        print(f"Re-indexed keywords of {interactions} interactions into {rows} rollup rows.")
+    elif args.command == "search":
+        async with AsyncSessionLocal() as db:
+            report = await search(db, args.query, limit=args.limit)
+        print(f"{report['terms']} mentions: {report['mentions']}")
+        for row in report["results"]:
+            print(f"  #{row['interaction_id']} {row['timestamp']} [{row['sentiment_label']}] {row['user_input'][:80]}")
+    else:
+        async with AsyncSessionLocal() as db:
+            report = await trending(db, bucket=args.bucket, window=args.window, limit=args.limit, sentiment=args.sentiment)
+        for topic in report["topics"]:
+            print(f"  {topic['keyword']:<24} {topic['previous']:>6} -> {topic['recent']:<6} sentiment {topic['avg_sentiment']:>6}  score {topic['score']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain and query the keyword index.")
+    parser.add_argument("command", choices=["rebuild", "search", "trending"])
+    parser.add_argument("query", nargs="?", default="", help="search: comma-separated keywords")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--bucket", choices=BUCKET_SIZES, default="day")
+    parser.add_argument("--window", type=int, default=7, help="trending: buckets compared with the ones before")
+    parser.add_argument("--sentiment", choices=SENTIMENT_WEIGHTS, default="negative")
+    asyncio.run(_main(parser.parse_args()))
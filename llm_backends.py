@@ -0,0 +1,254 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+import httpx
+import config
+from llm_scheduler import LLMOverloaded
+
+# What a backend can be asked to do, and the LLMService methods behind each
+ROLES = ("sentiment", "recovery", "summary")
+METHOD_ROLES = {
+    "analyze_sentiment": "sentiment",
+    "analyze_sentiment_batch": "sentiment",
+    "generate_recovery_action": "recovery",
+    "compress_feedback": "summary",
+    "update_summary": "summary",
+}
+
+
+class Backend:
+    """
+    One Ollama endpoint: the model it runs for each role, the roles it
+    serves and its own HTTP connection pool. LLMService.load() adds its
+    LangChain clients and chains (sentiment_chain, ...).
+    """
+
+    def __init__(self, url, models=None, roles=ROLES, default_model="llama3.2", max_connections=8):
+        self.url = url.rstrip("/")
+        unknown = (set(models or {}) | set(roles)) - set(ROLES)
+        if unknown:
+            raise ValueError(f"{self.url}: unknown role(s) {sorted(unknown)}, expected {list(ROLES)}")
+        self.models = {role: (models or {}).get(role, default_model) for role in ROLES}
+        self.roles = frozenset(roles)
+        self.transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+        self.http = httpx.AsyncClient(base_url=self.url, transport=self.transport)
+        self.outstanding = 0
+        self.ejected_at = None  # time.monotonic() of the ejection, None while in rotation
+        self.failures_in_row = 0
+        self.last_picked = 0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.latencies = deque(maxlen=200)  # seconds of recent successful requests
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_at is None
+
+    async def close(self):
+        await self.http.aclose()
+
+
+def parse_backends(spec, default_url, default_model, max_connections=8):
+    """
+    Backends from OLLAMA_BACKENDS: a comma-separated list of URLs, or a JSON
+    list of {"url", "models": {role: model}, "roles": [...]} objects. Empty
+    means the one backend at default_url.
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        entries = [{"url": default_url}]
+    elif spec.startswith("["):
+        entries = json.loads(spec)
+    else:
+        entries = [{"url": url.strip()} for url in spec.split(",") if url.strip()]
+    return [
+        Backend(entry["url"], models=entry.get("models"), roles=entry.get("roles", ROLES), default_model=default_model,
+                max_connections=max_connections)
+        for entry in entries
+    ]
+
+
+def pool_from_config():
+    """The BackendPool configured by OLLAMA_BACKENDS and LLM_BACKEND_*, shared by the app and the offline jobs."""
+    return BackendPool(
+        parse_backends(config.OLLAMA_BACKENDS, config.OLLAMA_BASE_URL, config.OLLAMA_MODEL, max_connections=config.LLM_HTTP_MAX_CONNECTIONS),
+        max_outstanding=config.LLM_MAX_CONCURRENCY,
+        eject_after=config.LLM_BACKEND_EJECT_AFTER,
+        eject_seconds=config.LLM_BACKEND_EJECT_SECONDS,
+        health_interval=config.LLM_BACKEND_HEALTH_INTERVAL,
+    )
+
+
+class BackendPool:
+    """
+    Routes each LLM request to the healthy backend serving its role with
+    the fewest requests in flight (least outstanding requests); ties go to
+    the one picked longest ago. With `max_outstanding`, a backend never has
+    more requests in flight than that; a request waits for one to finish.
+
+    A backend is ejected after `eject_after` failed requests in a row
+    (errors and timeouts; unparseable output still means it answered) or a
+    failed health check. Every `health_interval` seconds each backend is
+    probed with LLMService.check_connection; an ejected one is re-admitted
+    once a probe passes, no sooner than `eject_seconds` after its ejection.
+    Without health checks (health_interval=0, or start() not called) it is
+    re-admitted on the first request after `eject_seconds`, and ejected
+    again if it keeps failing. The last healthy backend of a role is never ejected: when all of them
+    fail, that is an outage for the circuit breaker to handle.
+    """
+
+    def __init__(self, backends, max_outstanding=None, eject_after=3, eject_seconds=10.0, health_interval=5.0):
+        if not backends:
+            raise ValueError("at least one LLM backend is required")
+        for role in ROLES:
+            if not any(role in backend.roles for backend in backends):
+                raise ValueError(f"no LLM backend serves {role!r}")
+        self.backends = list(backends)
+        self.max_outstanding = max_outstanding
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.transitions = deque(maxlen=50)
+        self._picks = itertools.count(1)
+        self._waiters = []  # futures of acquire() calls waiting for a backend to free up
+        self._task = None
+
+    def serving(self, role) -> list:
+        return [backend for backend in self.backends if role in backend.roles]
+
+    def model_key(self, role) -> str:
+        """The models answering `role`, for cache keys."""
+        return "+".join(sorted({backend.models[role] for backend in self.serving(role)}))
+
+    async def acquire(self, role, avoid=None, timeout=None) -> Backend:
+        """
+        Picks the backend for one request and counts it in flight; pair with
+        release(). `avoid` (a hedged request's first backend) is only picked
+        when no other backend can take the request. While every healthy
+        backend serving the role is at max_outstanding, waits for one to
+        free up, at most `timeout` seconds (then LLMOverloaded).
+        """
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while True:
+            backend = self._pick(role, avoid)
+            if backend is not None:
+                backend.last_picked = next(self._picks)
+                backend.outstanding += 1
+                backend.requests += 1
+                return backend
+            # Woken by every release(); nothing is handed over, so a cancelled wait needs no cleanup
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout=None if give_up is None else give_up - time.monotonic())
+            except asyncio.TimeoutError:
+                raise LLMOverloaded(f"Waited more than {timeout:.2f}s for a free {role} LLM backend") from None
+
+    def _pick(self, role, avoid):
+        if self._task is None:
+            self._readmit_expired()
+        candidates = [b for b in self.serving(role) if b.healthy]
+        if self.max_outstanding:
+            candidates = [b for b in candidates if b.outstanding < self.max_outstanding]
+        if avoid is not None and len(candidates) > 1:
+            candidates = [b for b in candidates if b is not avoid] or candidates
+        if not candidates:
+            return None
+        return min(candidates, key=lambda b: (b.outstanding, b.last_picked))
+
+    def _readmit_expired(self):
+        # No health checks: give ejected backends another chance after eject_seconds
+        now = time.monotonic()
+        for backend in self.backends:
+            if not backend.healthy and now - backend.ejected_at >= self.eject_seconds:
+                self._readmit(backend, f"{self.eject_seconds:g}s since ejection, no health checks")
+
+    def release(self, backend, ok, seconds=None):
+        """`ok` is True (answered), False (error/timeout) or None (cancelled, no verdict)."""
+        backend.outstanding -= 1
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        if ok:
+            backend.failures_in_row = 0
+            if seconds is not None:
+                backend.latencies.append(seconds)
+        elif ok is False:
+            backend.errors += 1
+            backend.failures_in_row += 1
+            if backend.failures_in_row >= self.eject_after:
+                self._eject(backend, f"{backend.failures_in_row} failed requests in a row")
+
+    async def check(self, probe):
+        """Runs `probe(backend) -> bool` on every backend concurrently and ejects or re-admits them."""
+        results = await asyncio.gather(*(probe(backend) for backend in self.backends), return_exceptions=True)
+        for backend, ok in zip(self.backends, results):
+            if ok is True:
+                if not backend.healthy and time.monotonic() - backend.ejected_at >= self.eject_seconds:
+                    self._readmit(backend, "health check passed")
+            elif backend.healthy:
+                self._eject(backend, "health check failed")
+
+    def _eject(self, backend, reason):
+        if not backend.healthy:
+            return
+        for role in backend.roles:
+            if not any(other.healthy for other in self.serving(role) if other is not backend):
+                # Keep it: nothing else could take its traffic
+                return
+        backend.ejected_at = time.monotonic()
+        backend.ejections += 1
+        self._transition(backend, "ejected", reason)
+
+    def _readmit(self, backend, reason):
+        backend.ejected_at = None
+        backend.failures_in_row = 0
+        self._transition(backend, "readmitted", reason)
+
+    def _transition(self, backend, event, reason):
+        print(f"LLM backend {backend.url} {event}: {reason}")
+        self.transitions.append({"at": time.time(), "backend": backend.url, "event": event, "reason": reason})
+
+    def start(self, probe):
+        if self._task is None and self.health_interval > 0:
+            self._task = asyncio.create_task(self._run(probe))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, probe):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check(probe)
+            except Exception as e:
+                print(f"WARNING: LLM backend health check failed: {e}")
+
+    async def close(self):
+        await self.stop()
+        await asyncio.gather(*(backend.close() for backend in self.backends))
+
+    def stats(self) -> dict:
+        backends = []
+        for backend in self.backends:
+            latencies = sorted(backend.latencies)
+            backends.append({
+                "url": backend.url,
+                "roles": sorted(backend.roles),
+                "models": {role: backend.models[role] for role in ROLES if role in backend.roles},
+                "healthy": backend.healthy,
+                "outstanding": backend.outstanding,
+                "max_outstanding": self.max_outstanding,
+                "requests": backend.requests,
+                "errors": backend.errors,
+                "ejections": backend.ejections,
+                "p50_seconds": round(latencies[len(latencies) // 2], 4) if latencies else None,
+            })
+        return {"backends": backends, "transitions": list(self.transitions)}
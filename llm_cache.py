@@ -0,0 +1,110 @@
+import datetime
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from sqlalchemy.dialects.sqlite import insert
+from models import LLMCacheEntry
+
+
+def normalize_text(text: str) -> str:
+    """
+    Case-, whitespace- and punctuation-insensitive form of a feedback text,
+    so "Great!!" and "  great " share a cache entry.
+    """
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def make_key(namespace: str, model_name: str, prompt_version: int, payload: str) -> str:
+    raw = f"{namespace}|{model_name}|v{prompt_version}|{payload}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache for deterministic (temperature=0) LLM results.
+
+    Tier 1 is an in-process LRU with TTL. Tier 2 is the `llm_cache` table in
+    the feedback database, so entries survive restarts. `session_factory`
+    must produce AsyncSessions so lookups never block the event loop.
+    """
+
+    def __init__(self, session_factory=None, max_entries=10000, ttl=7 * 24 * 3600):
+        self.session_factory = session_factory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._stats = {}
+
+    def _count(self, namespace, field):
+        counters = self._stats.setdefault(namespace, {"memory_hits": 0, "db_hits": 0, "misses": 0})
+        counters[field] += 1
+
+    def stats(self) -> dict:
+        report = {}
+        for namespace, counters in self._stats.items():
+            hits = counters["memory_hits"] + counters["db_hits"]
+            total = hits + counters["misses"]
+            report[namespace] = {**counters, "hit_rate": round(hits / total, 4) if total else 0.0}
+        report["memory_entries"] = len(self._entries)
+        return report
+
+    async def get(self, namespace: str, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count(namespace, "memory_hits")
+                return value
+            del self._entries[key]
+
+        if self.session_factory is not None:
+            value = await self._db_get(key)
+            if value is not None:
+                self._remember(key, value)
+                self._count(namespace, "db_hits")
+                return value
+
+        self._count(namespace, "misses")
+        return None
+
+    async def set(self, namespace: str, key: str, value: dict):
+        self._remember(key, value)
+        if self.session_factory is not None:
+            await self._db_set(namespace, key, value)
+
+    def _remember(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _db_get(self, key):
+        try:
+            async with self.session_factory() as db:
+                row = await db.get(LLMCacheEntry, key)
+                if row is None:
+                    return None
+                age = datetime.datetime.utcnow() - row.created_at
+                if age.total_seconds() > self.ttl:
+                    return None
+                return row.value
+        except Exception as e:
+            print(f"LLM Cache read failed: {e}")
+            return None
+
+    async def _db_set(self, namespace, key, value):
+        try:
+            # Upsert: workers in this and other processes may store the same key at once
+            stmt = insert(LLMCacheEntry).values(cache_key=key, namespace=namespace, value=value, created_at=datetime.datetime.utcnow())
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["cache_key"],
+                set_={"namespace": stmt.excluded.namespace, "value": stmt.excluded.value, "created_at": stmt.excluded.created_at},
+            )
+            async with self.session_factory() as db:
+                await db.execute(stmt)
+                await db.commit()
+        except Exception as e:
+            print(f"LLM Cache write failed: {e}")
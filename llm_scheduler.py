@@ -0,0 +1,120 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+
+# Priority classes, lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class LLMOverloaded(Exception):
+    """Raised when a request is shed instead of queued for a generation slot."""
+
+
+class PriorityLimiter:
+    """
+    Caps concurrent generations against Ollama and queues the rest by
+    priority.
+
+    Excess load is shed instead of piling up. A request is rejected when the
+    queue is full and nothing of lower priority can be evicted, or when it
+    waits longer than its class's queue timeout. Callers are expected to
+    return their fallback on LLMOverloaded right away.
+    """
+
+    def __init__(self, max_concurrent=2, max_queue=32, queue_timeouts=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeouts = queue_timeouts or {INTERACTIVE: 5.0, BACKGROUND: 60.0}
+        self._active = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._stats = {name: {"admitted": 0, "shed": 0, "timed_out": 0} for name in PRIORITY_NAMES.values()}
+
+    @asynccontextmanager
+    async def slot(self, priority=INTERACTIVE, timeout=None):
+        # `timeout` shortens the class's queue timeout, e.g. to a request's remaining deadline
+        await self._acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def try_acquire(self, priority=INTERACTIVE) -> bool:
+        """
+        Takes a slot only if one is free with nobody queued, without waiting
+        (for hedged requests, which must not queue). The caller releases it
+        with release().
+        """
+        if self._active >= self.max_concurrent or self._queued():
+            return False
+        self._active += 1
+        self._stats[PRIORITY_NAMES[priority]]["admitted"] += 1
+        return True
+
+    def release(self):
+        self._release()
+
+    def stats(self) -> dict:
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[PRIORITY_NAMES[priority]] += 1
+        return {"active": self._active, "max_concurrent": self.max_concurrent, "queued": queued, "classes": self._stats}
+
+    def _queued(self):
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+    async def _acquire(self, priority, timeout=None):
+        name = PRIORITY_NAMES[priority]
+        if self._active < self.max_concurrent and not self._queued():
+            self._active += 1
+            self._stats[name]["admitted"] += 1
+            return
+
+        if self._queued() >= self.max_queue and not self._evict_below(priority):
+            self._stats[name]["shed"] += 1
+            raise LLMOverloaded(f"LLM queue full ({self.max_queue} waiting)")
+
+        wait = self.queue_timeouts[priority] if timeout is None else max(0.0, min(timeout, self.queue_timeouts[priority]))
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            # A granted slot is handed over by _release(), which counts it active
+            await asyncio.wait_for(asyncio.shield(future), timeout=wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Granted at the same moment the timer fired; keep the slot
+                self._stats[name]["admitted"] += 1
+                return
+            future.cancel()
+            self._stats[name]["timed_out"] += 1
+            raise LLMOverloaded(f"Waited more than {wait:.2f}s for an LLM slot")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self._release()
+            else:
+                future.cancel()
+            raise
+        self._stats[name]["admitted"] += 1
+
+    def _evict_below(self, priority) -> bool:
+        # Drop the newest waiter of the lowest priority class below `priority`
+        candidates = [w for w in self._waiters if w[0] > priority and not w[2].done()]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda w: (w[0], w[1]))
+        victim[2].set_exception(LLMOverloaded("Evicted by higher-priority LLM request"))
+        self._stats[PRIORITY_NAMES[victim[0]]]["shed"] += 1
+        return True
+
+    def _release(self):
+        self._active -= 1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._active += 1
+                future.set_result(True)
+                return
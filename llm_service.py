@@ -1,9 +1,17 @@
-from langchain_ollama import ChatOllama
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from pydantic import BaseModel, Field
 import json
 import asyncio
+import hashlib
+import threading
+import time
+from batcher import MicroBatcher
+from llm_cache import make_key, normalize_text
+from llm_scheduler import INTERACTIVE, BACKGROUND, PRIORITY_NAMES, LLMOverloaded
+from circuit_breaker import CircuitOpenError
+from llm_backends import Backend, BackendPool, METHOD_ROLES
+from llm_timeouts import DeadlineExceeded, remaining
+from metrics import LLM_ATTEMPT_SECONDS, LLM_CALL_SECONDS, LLM_FALLBACKS, LLM_QUEUE_WAIT_SECONDS, timed
+import metrics
 
 class SentimentAnalysis(BaseModel):
     score: float = Field(description="Sentiment score between -1.0 and 1.0")
@@ -15,104 +23,602 @@ class ScaleDownSummary(BaseModel):
     key_pain_point: str = Field(description="Main issue or pain point identified")
     metrics: dict = Field(description="Inferred metrics like NPS or CSAT from text")
 
-import httpx
+# LangChain (langchain_ollama, langchain_core) is imported by LLMService.load()
+# on first use, not here: it takes seconds to import, and processes that only
+# need the state machine or the database never use it.
+class _NotLoaded(Exception):
+    pass
+
+# Replaced by langchain_core's OutputParserException on load(); no chain can
+# raise it before then
+OutputParserException = _NotLoaded
+
+SENTIMENT_LABELS = ("Frustrated", "Delight", "Neutral")
+
+SENTIMENT_SYSTEM_PROMPT = "Analyze the sentiment of the user's feedback. Return JSON with 'score' (-1.0 to 1.0), 'label' (Frustrated, Delight, Neutral), and 'keywords' (list)."
+SENTIMENT_BATCH_SYSTEM_PROMPT = (
+    "Analyze the sentiment of each numbered feedback item. Return JSON with 'results': a list containing one object per item, "
+    "each with 'id' (the item number), 'score' (-1.0 to 1.0), 'label' (Frustrated, Delight, Neutral), and 'keywords' (list)."
+)
+RECOVERY_SYSTEM_PROMPT = "The user is frustrated. Generate a short, empathetic recovery action or message for a support agent to take. Keep it under 20 words."
+COMPRESSION_SYSTEM_PROMPT = "Summarize the customer service transcript into a JSON object with 'topics', 'key_pain_point', and 'metrics'."
+SUMMARY_UPDATE_SYSTEM_PROMPT = (
+    "You maintain a running summary of a customer service conversation. Update the current summary with the new turns "
+    "and return the full updated summary as a JSON object with 'topics', 'key_pain_point', and 'metrics'."
+)
+
+# Bump when a prompt changes so cached results from the old prompt are ignored
+SENTIMENT_PROMPT_VERSION = 1
+COMPRESSION_PROMPT_VERSION = 1
+SUMMARY_UPDATE_PROMPT_VERSION = 1
+
+def failure_reason(error: BaseException) -> str:
+    """Metric label for why an LLM call failed."""
+    if isinstance(error, LLMOverloaded):
+        return "overloaded"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, DeadlineExceeded):
+        return "deadline"
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if isinstance(error, OutputParserException):
+        return "parse_error"
+    return "error"
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for llama-family tokenizers (~4 characters per token
+    for English). Good enough for budgeting and dry runs.
+    """
+    return (len(text) + 3) // 4
 
 class LLMService:
-    def __init__(self, model_name="llama3.2", timeout=30.0):
+    def __init__(self, model_name="llama3.2", timeout=30.0, batch_max_size=1, batch_max_wait=0.02, cache=None,
+                 base_url="http://127.0.0.1:11434", limiter=None, max_connections=8, breaker=None, keep_alive="5m",
+                 timeouts=None, retries=1, retry_delay=2.0, hedge=False, pool=None):
         # low temperature for deterministic JSON output
         self.model_name = model_name
         self.timeout = timeout
-        # hardcode base_url to avoid localhost issues
-        base_url = "http://127.0.0.1:11434"
-        # keep_alive="5m" keeps the model loaded for 5 minutes after request
-        self.llm_json = ChatOllama(model=model_name, format="json", temperature=0, timeout=timeout, base_url=base_url, num_predict=128, num_ctx=2048, keep_alive="5m")
-        self.llm_text = ChatOllama(model=model_name, temperature=0.7, timeout=timeout, base_url=base_url, num_predict=128, num_ctx=2048, keep_alive="5m")
-        
-    async def _retry_operation(self, operation, retries=1, delay=2):
+        # Optional LLMCache for results of the temperature=0 JSON calls
+        self.cache = cache
+        # Optional PriorityLimiter capping concurrent generations
+        self.limiter = limiter
+        # Optional CircuitBreaker shared by all LLM methods
+        self.breaker = breaker
+        # Optional AdaptiveTimeouts; without it every attempt gets `timeout`
+        self.timeouts = timeouts
+        # Attempts per call, with backoff retry_delay, 2 x retry_delay, ...
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # Send a second copy of interactive calls still running after their
+        # method's p95 (needs `timeouts` for the p95)
+        self.hedge = hedge
+        # How long Ollama keeps the model loaded after each request
+        self.keep_alive = keep_alive
+        # time.monotonic() of the last generation sent to Ollama (see ModelKeepAlive)
+        self.last_used = None
+        # The Ollama backends requests are routed to; without a pool, the one
+        # at base_url (defaults to 127.0.0.1 to avoid localhost issues), with
+        # health checks off. Each backend has its own HTTP connection pool,
+        # shared by its Ollama clients and health checks.
+        if pool is None:
+            pool = BackendPool([Backend(base_url, default_model=model_name, max_connections=max_connections)], health_interval=0)
+        self.pool = pool
+        self.batch_max_size = batch_max_size
+        # Seconds load() took, None until the LangChain stack is built
+        self.load_seconds = None
+        self._load_lock = threading.Lock()
+
+        # Optional micro-batching of concurrent sentiment calls into one generation
+        self.sentiment_batcher = None
+        if batch_max_size > 1:
+            self.sentiment_batcher = MicroBatcher(self._analyze_sentiment_batch, max_batch_size=batch_max_size, max_wait=batch_max_wait)
+
+    @property
+    def loaded(self) -> bool:
+        return self.load_seconds is not None
+
+    def load(self) -> float:
+        """
+        Imports LangChain and builds every backend's Ollama clients and
+        chains, once.
+        Thread-safe, so it can run in a worker thread (see load_async) while
+        the event loop serves requests. Returns the seconds it took.
+        """
+        with self._load_lock:
+            if self.load_seconds is not None:
+                return self.load_seconds
+            start = time.perf_counter()
+            self._build_chains()
+            self.load_seconds = time.perf_counter() - start
+            return self.load_seconds
+
+    async def load_async(self) -> float:
+        if self.load_seconds is not None:
+            return self.load_seconds
+        return await asyncio.to_thread(self.load)
+
+    def _build_chains(self):
+        global OutputParserException
+        from langchain_ollama import ChatOllama
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+        from langchain_core.exceptions import OutputParserException
+
+        timeout, keep_alive = self.timeout, self.keep_alive
+        for backend in self.pool.backends:
+            client_kwargs = {"transport": backend.transport}
+            models, url = backend.models, backend.url
+            # Chains are built once and shared by all calls; runnables hold no per-call state
+            if "sentiment" in backend.roles:
+                backend.llm_json = ChatOllama(model=models["sentiment"], format="json", temperature=0, timeout=timeout, base_url=url, num_predict=128, num_ctx=2048, keep_alive=keep_alive, async_client_kwargs=client_kwargs)
+                backend.sentiment_chain = ChatPromptTemplate.from_messages([
+                    ("system", SENTIMENT_SYSTEM_PROMPT),
+                    ("user", "{text}")
+                ]) | backend.llm_json | JsonOutputParser(pydantic_object=SentimentAnalysis)
+                if self.batch_max_size > 1:
+                    # ~48 output tokens per scored item
+                    backend.llm_json_batch = ChatOllama(model=models["sentiment"], format="json", temperature=0, timeout=timeout, base_url=url, num_predict=48 * self.batch_max_size, num_ctx=4096, keep_alive=keep_alive, async_client_kwargs=client_kwargs)
+                    backend.sentiment_batch_chain = ChatPromptTemplate.from_messages([
+                        ("system", SENTIMENT_BATCH_SYSTEM_PROMPT),
+                        ("user", "{items}")
+                    ]) | backend.llm_json_batch | JsonOutputParser()
+            if "recovery" in backend.roles:
+                backend.llm_text = ChatOllama(model=models["recovery"], temperature=0.7, timeout=timeout, base_url=url, num_predict=128, num_ctx=2048, keep_alive=keep_alive, async_client_kwargs=client_kwargs)
+                backend.recovery_chain = ChatPromptTemplate.from_messages([
+                    ("system", RECOVERY_SYSTEM_PROMPT),
+                    ("user", "Context: {context}")
+                ]) | backend.llm_text | StrOutputParser()
+            if "summary" in backend.roles:
+                backend.llm_summary = ChatOllama(model=models["summary"], format="json", temperature=0, timeout=timeout, base_url=url, num_predict=128, num_ctx=2048, keep_alive=keep_alive, async_client_kwargs=client_kwargs)
+                backend.compression_chain = ChatPromptTemplate.from_messages([
+                    ("system", COMPRESSION_SYSTEM_PROMPT),
+                    ("user", "{transcript}")
+                ]) | backend.llm_summary | JsonOutputParser(pydantic_object=ScaleDownSummary)
+                backend.summary_update_chain = ChatPromptTemplate.from_messages([
+                    ("system", SUMMARY_UPDATE_SYSTEM_PROMPT),
+                    ("user", "Current summary: {summary}\n\nNew turns:\n{transcript}")
+                ]) | backend.llm_summary | JsonOutputParser(pydantic_object=ScaleDownSummary)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def _attempt(self, operation, priority, method="llm", deadline=None):
+        """
+        One LLM call: checks the circuit breaker, waits for a generation slot
+        and enforces the timeout, then reports the outcome to the breaker.
+        Unparseable output still means Ollama answered, so it counts as a
+        success for the breaker. With a deadline, the queue wait and the
+        timeout are cut to what is left of it, and an attempt that is not
+        expected to finish in time is not made (DeadlineExceeded); neither
+        counts against the breaker.
+        """
+        if self.load_seconds is None:
+            # First call: import LangChain off the event loop
+            await self.load_async()
+        left = remaining(deadline)
+        if left is not None and left <= self._expected(method):
+            self._count(method, "deadline_skips")
+            raise DeadlineExceeded(f"{method}: {max(left, 0.0):.2f}s left of the deadline")
+        probe = self.breaker.allow() if self.breaker is not None else False
+        self.last_used = time.monotonic()
+        try:
+            if self.limiter is not None:
+                queued_at = time.perf_counter()
+                async with self.limiter.slot(priority, timeout=left):
+                    waited = time.perf_counter() - queued_at
+                    LLM_QUEUE_WAIT_SECONDS.observe(waited, priority=PRIORITY_NAMES[priority])
+                    metrics.record("llm_queue_wait", waited)
+                    result = await self._call(operation, priority, method, deadline)
+            else:
+                result = await self._call(operation, priority, method, deadline)
+        except (LLMOverloaded, DeadlineExceeded):
+            if self.breaker is not None and probe:
+                self.breaker.cancel_probe()
+            raise
+        except asyncio.TimeoutError:
+            if self.breaker is not None:
+                self.breaker.record_failure(probe, reason="timeout")
+            raise
+        except OutputParserException:
+            if self.breaker is not None:
+                self.breaker.record_success(probe)
+            raise
+        except Exception:
+            if self.breaker is not None:
+                self.breaker.record_failure(probe, reason="error")
+            raise
+        except BaseException:
+            # Cancelled by the caller: no verdict
+            if self.breaker is not None and probe:
+                self.breaker.cancel_probe()
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success(probe)
+        return result
+
+    async def _call(self, operation, priority, method, deadline):
+        """
+        Runs the operation on the backend the pool picks, under the method's
+        timeout cut short by the deadline, and records its latency. With
+        hedging on, an interactive call still running after the method's p95
+        gets a second copy (on another backend if there is one) if a
+        generation slot is free right away; the first answer wins and the
+        other copy is cancelled.
+        """
+        limit = self.timeouts.timeout(method) if self.timeouts is not None else self.timeout
+        left = remaining(deadline)
+        timeout = limit if left is None else max(0.0, min(limit, left))
+        # A timeout cut short by the deadline is the caller's, not the backend's
+        blame = timeout >= limit
+        role = METHOD_ROLES.get(method, "sentiment")
+        hedge_after = None
+        if self.hedge and self.timeouts is not None and priority == INTERACTIVE:
+            hedge_after = self.timeouts.hedge_delay(method)
+        try:
+            if hedge_after is None or hedge_after >= timeout:
+                result, elapsed = await self._on_backend(operation, role, timeout, blame)
+            else:
+                result, elapsed = await self._hedged(operation, priority, method, role, timeout, blame, hedge_after)
+        except asyncio.TimeoutError:
+            if not blame:
+                # The caller's budget ran out, not the LLM's
+                raise DeadlineExceeded(f"{method}: deadline reached after {timeout:.2f}s") from None
+            if self.timeouts is not None:
+                self.timeouts.record_timeout(method)
+            raise
+        if self.timeouts is not None:
+            self.timeouts.record(method, elapsed)
+        return result
+
+    async def _on_backend(self, operation, role, timeout, blame, avoid=None, picked=None):
+        """
+        One copy of a request, on the backend with the fewest requests in
+        flight for `role`; returns (result, seconds on the backend). Waiting
+        for a backend to free up counts against `timeout`. The outcome goes
+        to the pool: errors and (blamed) timeouts count towards ejecting the
+        backend, unparseable output does not.
+        """
+        queued_at = time.perf_counter()
+        backend = await self.pool.acquire(role, avoid, timeout=timeout)
+        if picked is not None:
+            picked.append(backend)
+        started = time.perf_counter()
+        ok = None
+        try:
+            # Enforce timeout with asyncio.wait_for, as underlying lib might hang
+            result = await asyncio.wait_for(operation(backend), timeout=max(0.0, timeout - (started - queued_at)))
+            ok = True
+            return result, time.perf_counter() - started
+        except asyncio.TimeoutError:
+            ok = False if blame else None
+            raise
+        except OutputParserException:
+            ok = True
+            raise
+        except Exception:
+            ok = False
+            raise
+        finally:
+            self.pool.release(backend, ok, time.perf_counter() - started)
+
+    async def _hedged(self, operation, priority, method, role, timeout, blame, hedge_after):
+        # Returns (result, seconds the winning copy took); each copy enforces its own timeout
+        give_up = time.perf_counter() + timeout
+        picked = []
+        first = asyncio.ensure_future(self._on_backend(operation, role, timeout, blame, picked=picked))
+        copies = [first]
+        hedge_slot = False
+        try:
+            done, pending = await asyncio.wait(copies, timeout=hedge_after)
+            if not done and (self.limiter is None or self.limiter.try_acquire(priority)):
+                hedge_slot = self.limiter is not None
+                self.timeouts.count(method, "hedges")
+                hedge = asyncio.ensure_future(self._on_backend(
+                    operation, role, max(0.0, give_up - time.perf_counter()), blame, avoid=picked[0] if picked else None,
+                ))
+                copies.append(hedge)
+                pending.add(hedge)
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.timeouts.count(method, "hedge_wins")
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in copies:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # retrieved, so a losing copy's error isn't logged as unhandled
+            if hedge_slot:
+                self.limiter.release()
+
+    def _expected(self, method) -> float:
+        return self.timeouts.expected(method) if self.timeouts is not None else 0.0
+
+    def _count(self, method, event):
+        if self.timeouts is not None:
+            self.timeouts.count(method, event)
+
+    async def _retry_operation(self, operation, retries=None, delay=None, priority=INTERACTIVE, method="llm", deadline=None):
         """
         Helper to retry async operations with exponential backoff.
+        Shed (LLMOverloaded), circuit-open and out-of-deadline requests are
+        not retried, and a retry is only made if the deadline leaves room for
+        the backoff plus a typical attempt. Each attempt is timed under
+        `method` with its outcome.
         """
+        retries = self.retries if retries is None else retries
+        delay = self.retry_delay if delay is None else delay
         last_exception = None
         for i in range(retries):
+            start = time.perf_counter()
+            outcome = "success"
             try:
                 if i > 0:
                     print(f"Retrying LLM operation ({i}/{retries})...")
-                # Enforce timeout with asyncio.wait_for, as underlying lib might hang
-                return await asyncio.wait_for(operation(), timeout=self.timeout)
+                return await self._attempt(operation, priority, method, deadline)
+            except (LLMOverloaded, CircuitOpenError, DeadlineExceeded) as e:
+                outcome = failure_reason(e)
+                raise
             except asyncio.TimeoutError:
-                last_exception = TimeoutError(f"Operation timed out after {self.timeout}s")
+                outcome = "timeout"
+                last_exception = TimeoutError(f"{method} timed out")
                 print(f"LLM Timeout (Attempt {i+1})")
             except Exception as e:
+                outcome = failure_reason(e)
                 last_exception = e
                 print(f"LLM Error (Attempt {i+1}): {e}")
+            except BaseException:
+                outcome = "cancelled"
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                LLM_ATTEMPT_SECONDS.observe(elapsed, method=method, outcome=outcome)
+                metrics.record("llm_attempt", elapsed, f"{method} #{i + 1} {outcome}")
             
             if i < retries - 1:
-                await asyncio.sleep(delay * (2 ** i))
+                backoff = delay * (2 ** i)
+                left = remaining(deadline)
+                if left is not None and left - backoff <= self._expected(method):
+                    self._count(method, "deadline_skips")
+                    print(f"Not retrying {method}: {max(left, 0.0):.2f}s left of the deadline")
+                    break
+                await asyncio.sleep(backoff)
                 
         raise last_exception
 
-    async def check_connection(self) -> bool:
+    async def check_connection(self, backend=None) -> bool:
         """
-        Verify connection to Ollama server.
+        Verify connection to Ollama: to `backend`, or to every backend (True
+        if any answers). Also the backend pool's health check.
         """
+        if backend is None:
+            results = await asyncio.gather(*(self.check_connection(b) for b in self.pool.backends))
+            return any(results)
         try:
             # Check if Ollama is running by hitting the root endpoint
-            async with httpx.AsyncClient() as client:
-                resp = await client.get("http://127.0.0.1:11434/", timeout=5.0)
-                return resp.status_code == 200
+            resp = await backend.http.get("/", timeout=5.0)
+            return resp.status_code == 200
         except Exception as e:
-            print(f"LLM Connection Check Failed: {e}")
+            if backend.healthy:
+                print(f"LLM Connection Check Failed ({backend.url}): {e}")
             return False
 
-    async def analyze_sentiment(self, text: str) -> dict:
-        parser = JsonOutputParser(pydantic_object=SentimentAnalysis)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Analyze the sentiment of the user's feedback. Return JSON with 'score' (-1.0 to 1.0), 'label' (Frustrated, Delight, Neutral), and 'keywords' (list)."),
-            ("user", "{text}")
-        ])
-        chain = prompt | self.llm_json | parser
-        
-        async def _run():
-            return await chain.ainvoke({"text": text})
+    async def warm_up(self, timeout=120.0) -> float:
+        """
+        Runs one real sentiment generation on every backend serving
+        sentiment, so their models are loaded (and the JSON path exercised)
+        before the first user arrives. Bypasses the cache, limiter, breaker
+        and pool; returns the seconds it took and raises on failure.
+        """
+        start = time.perf_counter()
+        await self.load_async()
+        await asyncio.wait_for(asyncio.gather(*(
+            backend.sentiment_chain.ainvoke({"text": "Thanks, the setup was easy."})
+            for backend in self.pool.serving("sentiment")
+        )), timeout=timeout)
+        self.last_used = time.monotonic()
+        return time.perf_counter() - start
+
+    async def keep_model_loaded(self) -> bool:
+        """
+        Asks every backend serving sentiment to (re)load its sentiment model
+        and keep it resident for keep_alive, without generating anything.
+        """
+        async def _ping(backend):
+            try:
+                resp = await backend.http.post("/api/generate", json={"model": backend.models["sentiment"], "keep_alive": self.keep_alive}, timeout=self.timeout)
+                return resp.status_code == 200
+            except Exception as e:
+                print(f"Model keep-alive failed ({backend.url}): {e}")
+                return False
+
+        return all(await asyncio.gather(*(_ping(backend) for backend in self.pool.serving("sentiment"))))
+
+    async def analyze_sentiment(self, text: str, fallback: bool = True, priority: int = INTERACTIVE, deadline: float | None = None) -> dict:
+        """
+        With fallback=False failures are raised instead of returning the
+        Neutral fallback, so queued work can be retried. `deadline` is a
+        time.monotonic() value the result is needed by; past it the call
+        falls back (or raises DeadlineExceeded).
+        """
+        with timed(LLM_CALL_SECONDS, method="analyze_sentiment", result="ok") as call:
+            cache_key = None
+            if self.cache is not None:
+                cache_key = make_key("sentiment", self.pool.model_key("sentiment"), SENTIMENT_PROMPT_VERSION, normalize_text(text))
+                cached = await self.cache.get("sentiment", cache_key)
+                if cached is not None:
+                    call["result"] = "cached"
+                    return cached
+
+            try:
+                if self.sentiment_batcher is not None:
+                    submitted = self.sentiment_batcher.submit((text, priority, deadline))
+                    if deadline is None:
+                        result = await submitted
+                    else:
+                        # The batch runs to its latest item's deadline; don't wait past ours
+                        try:
+                            result = await asyncio.wait_for(submitted, timeout=max(0.0, remaining(deadline)))
+                        except asyncio.TimeoutError:
+                            raise DeadlineExceeded("analyze_sentiment: deadline reached waiting for the batch") from None
+                else:
+                    result = await self._analyze_sentiment_once(text, priority, deadline)
+            except Exception as e:
+                print(f"LLM Sentiment Failed after retries: {e}")
+                if not fallback:
+                    call["result"] = "error"
+                    raise
+                call["result"] = "fallback"
+                LLM_FALLBACKS.inc(method="analyze_sentiment", reason=failure_reason(e))
+                # Fallback (never cached, and marked so it isn't reused as a near-duplicate result)
+                return {"score": 0.0, "label": "Neutral", "keywords": [], "fallback": True}
+
+            if cache_key is not None:
+                await self.cache.set("sentiment", cache_key, result)
+            return result
+
+    async def _analyze_sentiment_once(self, text: str, priority: int = INTERACTIVE, deadline: float | None = None) -> dict:
+        async def _run(backend):
+            return await backend.sentiment_chain.ainvoke({"text": text})
+
+        return await self._retry_operation(_run, priority=priority, method="analyze_sentiment", deadline=deadline)
+
+    async def _analyze_sentiment_batch(self, items: list[tuple[str, int, float | None]]) -> list:
+        """
+        Scores several (text, priority, deadline) items with one generation,
+        scheduled at the most urgent item's priority and bounded by the
+        latest deadline (none if any item has none). Returns one entry per
+        item: either the sentiment dict or an Exception for items that came
+        back malformed (the caller falls back to Neutral for those).
+        """
+        texts = [text for text, _, _ in items]
+        priority = min(p for _, p, _ in items)
+        deadlines = [d for _, _, d in items]
+        deadline = None if None in deadlines else max(deadlines)
+        if len(texts) == 1:
+            # Nothing to coalesce, the single-item prompt is cheaper
+            try:
+                return [await self._analyze_sentiment_once(texts[0], priority, deadline)]
+            except Exception as e:
+                return [e]
+
+        payload = json.dumps([{"id": i, "text": t} for i, t in enumerate(texts)])
+
+        async def _run(backend):
+            return await backend.sentiment_batch_chain.ainvoke({"items": payload})
 
         try:
-            return await self._retry_operation(_run)
+            response = await self._retry_operation(_run, priority=priority, method="analyze_sentiment_batch", deadline=deadline)
         except Exception as e:
-            print(f"LLM Sentiment Failed after retries: {e}")
-            # Fallback
-            return {"score": 0.0, "label": "Neutral", "keywords": []}
+            return [e] * len(texts)
+
+        by_id = {}
+        entries = response.get("results") if isinstance(response, dict) else response
+        for entry in entries if isinstance(entries, list) else []:
+            if isinstance(entry, dict) and isinstance(entry.get("id"), int):
+                by_id[entry["id"]] = entry
+
+        results = []
+        for i in range(len(texts)):
+            entry = by_id.get(i)
+            try:
+                results.append({
+                    "score": max(-1.0, min(1.0, float(entry["score"]))),
+                    "label": entry["label"] if entry["label"] in SENTIMENT_LABELS else "Neutral",
+                    "keywords": [str(k) for k in entry.get("keywords") or []],
+                })
+            except (TypeError, KeyError, ValueError):
+                results.append(ValueError(f"Malformed batch result for item {i}"))
+        return results
 
     async def generate_recovery_action(self, session_state: dict) -> str:
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "The user is frustrated. Generate a short, empathetic recovery action or message for a support agent to take. Keep it under 20 words."),
-            ("user", "Context: {context}")
-        ])
-        chain = prompt | self.llm_text | StrOutputParser()
-        
-        async def _run():
+        async def _run(backend):
             # Serialize session state safely
             clean_state = {k:v for k,v in session_state.items() if k != 'llm_service'} 
-            return await chain.ainvoke({"context": json.dumps(clean_state, default=str)})
+            return await backend.recovery_chain.ainvoke({"context": json.dumps(clean_state, default=str)})
 
         try:
-            return await self._retry_operation(_run)
+            return await self._retry_operation(_run, priority=BACKGROUND, method="generate_recovery_action")
         except Exception as e:
             print(f"LLM Recovery Failed after retries: {e}")
+            LLM_FALLBACKS.inc(method="generate_recovery_action", reason=failure_reason(e))
             return "Escalate to human agent immediately."
 
-    async def compress_feedback(self, transcript: str) -> dict:
-        parser = JsonOutputParser(pydantic_object=ScaleDownSummary)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Summarize the customer service transcript into a JSON object with 'topics', 'key_pain_point', and 'metrics'."),
-            ("user", "{transcript}")
-        ])
-        chain = prompt | self.llm_json | parser
-        
-        async def _run():
-            return await chain.ainvoke({"transcript": transcript})
+    async def compress_feedback(self, transcript: str, fallback: bool = True) -> dict:
+        """
+        With fallback=False failures are raised instead of returning the
+        placeholder summary, so batch jobs can tell them apart.
+        """
+        with timed(LLM_CALL_SECONDS, method="compress_feedback", result="ok") as call:
+            cache_key = None
+            if self.cache is not None:
+                cache_key = make_key("compression", self.pool.model_key("summary"), COMPRESSION_PROMPT_VERSION, hashlib.sha256(transcript.encode("utf-8")).hexdigest())
+                cached = await self.cache.get("compression", cache_key)
+                if cached is not None:
+                    call["result"] = "cached"
+                    return cached
 
-        try:
-            return await self._retry_operation(_run)
-        except Exception as e:
-            print(f"LLM Compression Failed after retries: {e}")
-            return {"topics": [], "key_pain_point": "Error processing", "metrics": {}}
+            try:
+                result = await self._compress_feedback_once(transcript)
+            except Exception as e:
+                print(f"LLM Compression Failed after retries: {e}")
+                if not fallback:
+                    call["result"] = "error"
+                    raise
+                call["result"] = "fallback"
+                LLM_FALLBACKS.inc(method="compress_feedback", reason=failure_reason(e))
+                return {"topics": [], "key_pain_point": "Error processing", "metrics": {}}
+
+            if cache_key is not None:
+                await self.cache.set("compression", cache_key, result)
+            return result
+
+    async def _compress_feedback_once(self, transcript: str) -> dict:
+        async def _run(backend):
+            return await backend.compression_chain.ainvoke({"transcript": transcript})
+
+        return await self._retry_operation(_run, priority=BACKGROUND, method="compress_feedback")
+
+    async def update_summary(self, summary: dict, transcript: str, fallback: bool = True) -> dict:
+        """
+        Folds new transcript turns into an existing ScaleDown summary, so the
+        LLM only sees the previous summary plus the new turns.
+        """
+        with timed(LLM_CALL_SECONDS, method="update_summary", result="ok") as call:
+            summary_text = json.dumps(summary, sort_keys=True, default=str)
+            cache_key = None
+            if self.cache is not None:
+                digest = hashlib.sha256((summary_text + "\n" + transcript).encode("utf-8")).hexdigest()
+                cache_key = make_key("summary_update", self.pool.model_key("summary"), SUMMARY_UPDATE_PROMPT_VERSION, digest)
+                cached = await self.cache.get("summary_update", cache_key)
+                if cached is not None:
+                    call["result"] = "cached"
+                    return cached
+
+            async def _run(backend):
+                return await backend.summary_update_chain.ainvoke({"summary": summary_text, "transcript": transcript})
+
+            try:
+                result = await self._retry_operation(_run, priority=BACKGROUND, method="update_summary")
+            except Exception as e:
+                print(f"LLM Summary Update Failed after retries: {e}")
+                if not fallback:
+                    call["result"] = "error"
+                    raise
+                call["result"] = "fallback"
+                LLM_FALLBACKS.inc(method="update_summary", reason=failure_reason(e))
+                # Keep the previous summary rather than losing it
+                return summary
+
+            if cache_key is not None:
+                await self.cache.set("summary_update", cache_key, result)
+            return result
@@ -0,0 +1,113 @@
+import time
+from collections import deque
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of an LLM attempt (or its retry) that can't finish before the caller's deadline."""
+
+
+def remaining(deadline):
+    """Seconds left until `deadline` (a time.monotonic() value); None when there is no deadline."""
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class AdaptiveTimeouts:
+    """
+    Per-method LLM attempt timeouts that follow observed latency.
+
+    Keeps the durations of the last `window` successful attempts of each
+    method. Once a method has `min_samples` of them, its attempt timeout is
+    `multiplier` x their `percentile`, clamped to [min_timeout, max_timeout].
+    Their p95 is the hedge delay and their p50 the expected attempt time,
+    which decides whether a retry still fits in a deadline.
+
+    Only successes are samples: occasional slow outliers that time out must
+    not drag the percentile up to the timeout itself. When latency really
+    goes up, attempts time out in a row instead; after `reset_after`
+    consecutive timeouts the method's samples are dropped and it starts
+    over from max_timeout. So does a method without a success for
+    `idle_reset` seconds, as the model may have been unloaded. With
+    enabled=False the timeout is always max_timeout; latency is still
+    tracked for hedging.
+    """
+
+    def __init__(self, max_timeout=30.0, min_timeout=2.0, percentile=0.99, multiplier=3.0, window=200, min_samples=20,
+                 idle_reset=240.0, reset_after=3, enabled=True):
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.window = window
+        self.min_samples = min_samples
+        self.idle_reset = idle_reset
+        self.reset_after = reset_after
+        self.enabled = enabled
+        self._samples = {}  # method -> deque of seconds
+        self._sorted = {}  # method -> sorted copy of its samples, dropped on record()
+        self._last_success = {}  # method -> monotonic time
+        self._timeouts_in_row = {}  # method -> consecutive timed-out attempts
+        self._counts = {}  # method -> {"timeouts", "hedges", "hedge_wins", "deadline_skips"}
+
+    def record(self, method, seconds):
+        """A successful attempt and how long it took."""
+        samples = self._samples.get(method)
+        if samples is None:
+            samples = self._samples[method] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self._sorted.pop(method, None)
+        self._last_success[method] = time.monotonic()
+        self._timeouts_in_row[method] = 0
+
+    def record_timeout(self, method):
+        self.count(method, "timeouts")
+        in_row = self._timeouts_in_row.get(method, 0) + 1
+        self._timeouts_in_row[method] = in_row
+        if in_row >= self.reset_after and method in self._samples:
+            # Latency moved up: relearn it from max_timeout
+            self._samples[method].clear()
+            self._sorted.pop(method, None)
+
+    def count(self, method, event):
+        counts = self._counts.get(method)
+        if counts is None:
+            counts = self._counts[method] = {"timeouts": 0, "hedges": 0, "hedge_wins": 0, "deadline_skips": 0}
+        counts[event] += 1
+
+    def quantile(self, method, q):
+        """The q-quantile of the method's recent attempts, or None while there are too few or they are stale."""
+        last = self._last_success.get(method)
+        if last is None or time.monotonic() - last > self.idle_reset:
+            return None
+        ordered = self._sorted.get(method)
+        if ordered is None:
+            samples = self._samples.get(method) or ()
+            if len(samples) < self.min_samples:
+                return None
+            ordered = self._sorted[method] = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def timeout(self, method) -> float:
+        observed = self.quantile(method, self.percentile) if self.enabled else None
+        if observed is None:
+            return self.max_timeout
+        return max(self.min_timeout, min(self.max_timeout, observed * self.multiplier))
+
+    def hedge_delay(self, method):
+        return self.quantile(method, 0.95)
+
+    def expected(self, method) -> float:
+        return self.quantile(method, 0.5) or 0.0
+
+    def stats(self) -> dict:
+        methods = {}
+        for method in sorted(set(self._samples) | set(self._counts)):
+            quantiles = {f"p{int(q * 100)}": self.quantile(method, q) for q in (0.5, 0.95, 0.99)}
+            methods[method] = {
+                "samples": len(self._samples.get(method) or ()),
+                **{name: round(value, 4) if value is not None else None for name, value in quantiles.items()},
+                "timeout": round(self.timeout(method), 3),
+                **self._counts.get(method, {"timeouts": 0, "hedges": 0, "hedge_wins": 0, "deadline_skips": 0}),
+            }
+        return {"adaptive": self.enabled, "min_timeout": self.min_timeout, "max_timeout": self.max_timeout, "methods": methods}
@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+# Load test: many concurrent virtual users run full survey flows against the
+# app and report throughput plus p50/p95/p99 per state transition and per
+# sentiment path. By default it starts its own app (uvicorn) and fake Ollama
+# (fake_ollama.py) on free ports with a throwaway database; pass --url to
+# target a running server instead.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Fewest requests in a transition/path group for its p95 to be compared
+MIN_SAMPLES = 100
+
+# Weighted survey scripts; each turn's text is what the user sends
+FLOWS = [
+    ("promoter", 3, ["10", "The speed was great and setup was easy", "5"]),
+    ("passive", 2, ["8", "It was fine but the docs could be clearer", "4"]),
+    ("detractor", 2, ["3", "Checkout kept crashing and support was slow to answer", "2"]),
+    ("nps_retry", 1, ["not sure yet", "9", "Love how simple the dashboard is", "5"]),
+    ("restart", 1, ["10", "Great onboarding emails", "5", "Hello?"]),
+]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # Nearest-rank
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 2) if values else None,
+        "p50_ms": round(1000 * percentile(values, 50), 2) if values else None,
+        "p95_ms": round(1000 * percentile(values, 95), 2) if values else None,
+        "p99_ms": round(1000 * percentile(values, 99), 2) if values else None,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Recorder:
+    def __init__(self):
+        self.by_transition = {}
+        self.by_path = {}
+        self.all = []
+        self.errors = 0
+        self.sessions = 0
+        self.recording = False
+
+    def add(self, transition, path, latency):
+        if not self.recording:
+            return
+        self.all.append(latency)
+        self.by_transition.setdefault(transition, []).append(latency)
+        self.by_path.setdefault(path, []).append(latency)
+
+
+async def virtual_user(client, base_url, recorder, deadline, run_id, user_id, unique_text, think_time):
+    names, weights = zip(*[(name, weight) for name, weight, _ in FLOWS])
+    scripts = {name: turns for name, _, turns in FLOWS}
+    n = 0
+    while time.perf_counter() < deadline:
+        flow = random.choices(names, weights)[0]
+        session_id = f"load-{run_id}-{user_id}-{n}"
+        n += 1
+        for text in scripts[flow]:
+            if unique_text and not text.isdigit():
+                # Unique wording per session, so the result cache doesn't flatter the LLM path
+                text = f"{text} ({session_id})"
+            start = time.perf_counter()
+            try:
+                resp = await client.post(f"{base_url}/analyze", json={"text": text, "session_id": session_id})
+                latency = time.perf_counter() - start
+                if resp.status_code != 200 or resp.json().get("status") != "success":
+                    raise RuntimeError(f"HTTP {resp.status_code}")
+            except Exception:
+                if recorder.recording:
+                    recorder.errors += 1
+                break
+            recorder.add(resp.headers.get("X-Survey-Transition", "unknown"), resp.headers.get("X-Sentiment-Path", "unknown"), latency)
+            if think_time:
+                await asyncio.sleep(random.expovariate(1.0 / think_time))
+        else:
+            if recorder.recording:
+                recorder.sessions += 1
+
+
+async def run_load(base_url, users, duration, warmup, unique_text, think_time):
+    recorder = Recorder()
+    run_id = int(time.time())
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        deadline = time.perf_counter() + warmup + duration
+        tasks = [
+            asyncio.create_task(virtual_user(client, base_url, recorder, deadline, run_id, u, unique_text, think_time))
+            for u in range(users)
+        ]
+        await asyncio.sleep(warmup)
+        recorder.recording = True
+        started = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def build_results(recorder, elapsed, config):
+    return {
+        "config": config,
+        "summary": {
+            "duration_s": round(elapsed, 2),
+            "requests": len(recorder.all),
+            "errors": recorder.errors,
+            "sessions_completed": recorder.sessions,
+            "throughput_rps": round(len(recorder.all) / elapsed, 2) if elapsed else 0.0,
+            **summarize(recorder.all),
+        },
+        "transitions": {k: summarize(v) for k, v in sorted(recorder.by_transition.items())},
+        "paths": {k: summarize(v) for k, v in sorted(recorder.by_path.items())},
+    }
+
+
+def print_results(results):
+    s = results["summary"]
+    print(f"\n{s['requests']} requests in {s['duration_s']}s: {s['throughput_rps']} req/s, "
+          f"{s['sessions_completed']} sessions completed, {s['errors']} errors")
+    for title, rows in (("Transition", results["transitions"]), ("Sentiment path", results["paths"])):
+        print(f"\n{title:<32} | {'count':>6} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+        print("-" * 75)
+        for name, row in rows.items():
+            print(f"{name:<32} | {row['count']:>6} | {row['p50_ms']:>8} | {row['p95_ms']:>8} | {row['p99_ms']:>8}")
+    print(f"{'overall':<32} | {s['count']:>6} | {s['p50_ms']:>8} | {s['p95_ms']:>8} | {s['p99_ms']:>8}")
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """
+    Returns a list of regressions: p95 of the overall run, each sentiment path
+    and each transition more than `tolerance` slower than the baseline, a
+    throughput drop of more than `tolerance`, or a higher error rate. Latency
+    changes under `min_delta_ms` and groups with fewer than MIN_SAMPLES
+    requests in either run are within run-to-run noise and ignored.
+    """
+    regressions = []
+
+    def check_latency(name, current, previous):
+        if not current or not previous or min(current["count"], previous["count"]) < MIN_SAMPLES:
+            return
+        if previous["p95_ms"] and current["p95_ms"]:
+            slower = current["p95_ms"] - previous["p95_ms"]
+            if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance) and slower >= min_delta_ms:
+                regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+
+    check_latency("overall", results["summary"], baseline["summary"])
+    for group in ("paths", "transitions"):
+        for name, row in results[group].items():
+            check_latency(f"{group[:-1]} {name}", row, baseline.get(group, {}).get(name))
+
+    before, after = baseline["summary"]["throughput_rps"], results["summary"]["throughput_rps"]
+    if before and after < before * (1 - tolerance):
+        regressions.append(f"throughput: {before} -> {after} req/s")
+
+    def error_rate(summary):
+        total = summary["requests"] + summary["errors"]
+        return summary["errors"] / total if total else 0.0
+
+    if error_rate(results["summary"]) > error_rate(baseline["summary"]) + 0.01:
+        regressions.append(f"error rate: {error_rate(baseline['summary']):.2%} -> {error_rate(results['summary']):.2%}")
+    return regressions
+
+
+def wait_until_up(url, process, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_stack(args, workdir):
+    """Starts fake Ollama and the app as subprocesses; returns (base_url, processes)."""
+    ollama_port, app_port = free_port(), free_port()
+    log = open(os.path.join(workdir, "server.log"), "w")
+    ollama = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "fake_ollama.py"), "--port", str(ollama_port),
+         "--latency", str(args.ollama_latency), "--jitter", str(args.ollama_jitter),
+         "--distribution", args.ollama_distribution, "--error-rate", str(args.ollama_error_rate),
+         "--parallel", str(args.ollama_parallel)],
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    processes = [ollama]
+    wait_until_up(f"http://127.0.0.1:{ollama_port}/", ollama)
+
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        "INTERACTION_LOG_PATH": os.path.join(workdir, "feedback_log.{pid}.jsonl"),
+    })
+    if not args.repeat_text:
+        # Per-session wording only differs in the appended id; don't let near-duplicate reuse hide the LLM path either
+        env["NEAR_DUP_ENABLED"] = "0"
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning",
+         "--workers", str(args.workers)],
+        cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    processes.append(app)
+    base_url = f"http://127.0.0.1:{app_port}"
+    wait_until_up(f"{base_url}/", app)
+    return base_url, processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent survey-flow load test with latency percentiles and baseline comparison.")
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before recording")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the started app")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between a user's turns")
+    parser.add_argument("--repeat-text", action="store_true", help="send identical texts so the result cache can hit")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ollama-latency", type=float, default=0.3)
+    parser.add_argument("--ollama-jitter", type=float, default=0.1)
+    parser.add_argument("--ollama-distribution", choices=["fixed", "normal", "uniform", "exponential"], default="normal")
+    parser.add_argument("--ollama-error-rate", type=float, default=0.0)
+    parser.add_argument("--ollama-parallel", type=int, default=4)
+    parser.add_argument("--output", default="loadtest_results.json")
+    parser.add_argument("--baseline", help="compare against this results file; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs. the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=250.0, help="ignore p95 slowdowns smaller than this")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        try:
+            base_url = args.url
+            if not base_url:
+                base_url, processes = start_stack(args, workdir)
+            print(f"Running {args.users} virtual users for {args.duration}s against {base_url} (warm-up {args.warmup}s)")
+            recorder, elapsed = asyncio.run(run_load(base_url, args.users, args.duration, args.warmup, not args.repeat_text, args.think_time))
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait(timeout=10)
+
+    results = build_results(recorder, elapsed, config)
+    print_results(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\nREGRESSION vs {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regression vs {args.baseline} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import json
+import math
+import re
+
+# Default lexicon tuned for product / support feedback. Weights roughly follow
+# VADER's -4..4 valence scale.
+DEFAULT_LEXICON = {
+    # positive
+    "great": 3.1, "good": 1.9, "love": 3.2, "loved": 2.9, "loving": 2.9, "awesome": 3.1,
+    "excellent": 3.2, "amazing": 2.8, "fantastic": 2.6, "perfect": 2.7, "wonderful": 2.7,
+    "nice": 1.8, "helpful": 1.9, "happy": 2.7, "glad": 2.0, "easy": 1.9, "fast": 1.5,
+    "quick": 1.5, "smooth": 1.8, "best": 3.2, "like": 1.5, "liked": 1.8, "enjoy": 2.2,
+    "enjoyed": 2.3, "friendly": 2.2, "thanks": 1.9, "thank": 1.5, "appreciate": 2.0,
+    "recommend": 1.9, "satisfied": 1.8, "pleased": 1.9, "reliable": 1.9, "intuitive": 1.9,
+    "solved": 1.6, "resolved": 1.6, "fixed": 1.3, "works": 1.0, "cool": 1.3, "brilliant": 2.8,
+    "superb": 3.1, "impressive": 2.4, "convenient": 1.9, "clean": 1.3, "polite": 1.8,
+    "ok": 0.9, "okay": 0.9, "fine": 0.8, "decent": 1.3,
+    # negative
+    "bad": -2.5, "terrible": -3.1, "awful": -3.1, "horrible": -3.3, "worst": -3.1,
+    "hate": -2.7, "hated": -3.0, "slow": -1.7, "crash": -2.2, "crashes": -2.2,
+    "crashed": -2.2, "crashing": -2.2, "bug": -1.6, "bugs": -1.6, "buggy": -2.0,
+    "broken": -2.3, "useless": -2.7, "annoying": -2.0, "annoyed": -2.0, "frustrating": -2.4,
+    "frustrated": -2.4, "disappointed": -2.3, "disappointing": -2.2, "poor": -2.1,
+    "rude": -2.4, "confusing": -1.6, "confused": -1.4, "expensive": -1.5, "problem": -1.7,
+    "problems": -1.7, "issue": -1.3, "issues": -1.3, "error": -1.6, "errors": -1.6,
+    "fail": -2.0, "failed": -2.3, "fails": -2.0, "failing": -2.1, "laggy": -1.8,
+    "lag": -1.5, "freezes": -2.0, "freeze": -1.8, "stuck": -1.7, "waste": -2.1,
+    "waiting": -0.9, "refund": -1.2, "cancel": -1.1, "unhappy": -2.4, "angry": -2.7,
+    "ridiculous": -2.2, "unacceptable": -2.9, "sucks": -2.6, "difficult": -1.6, "hard": -0.8,
+    "wrong": -1.9, "ugly": -2.2, "unusable": -2.8, "painful": -2.3,
+}
+
+NEGATORS = {
+    "not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "without",
+    "cannot", "cant", "dont", "doesnt", "didnt", "isnt", "wasnt", "arent", "werent",
+    "wont", "wouldnt", "shouldnt", "couldnt", "hardly", "barely",
+}
+
+INTENSIFIERS = {
+    "very": 0.3, "really": 0.3, "so": 0.2, "extremely": 0.5, "super": 0.4, "too": 0.2,
+    "absolutely": 0.4, "totally": 0.3, "incredibly": 0.5, "quite": 0.1, "slightly": -0.3,
+    "somewhat": -0.2, "kinda": -0.3, "bit": -0.3,
+}
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "i", "me", "my", "we", "our", "you", "your",
+    "it", "its", "is", "are", "was", "were", "be", "been", "to", "of", "in", "on", "at",
+    "for", "with", "this", "that", "there", "they", "them", "have", "has", "had", "do",
+    "does", "did", "just", "am", "as", "by", "from", "about", "when", "what", "which",
+    "will", "would", "can", "could", "all", "any", "some", "much", "more", "most", "also",
+    "thing", "things", "get", "got", "app", "im", "ive", "us", "he", "she",
+}
+
+NEGATION_WINDOW = 3
+NEGATION_FACTOR = -0.74  # "not good" is mildly negative, not the mirror of "good"
+NORMALIZATION_ALPHA = 15  # VADER's normalization constant
+LABEL_CUTOFF = 0.35
+
+
+def tokenize(text: str) -> list[str]:
+    # Fold contractions so "isn't" -> "isnt", then split on non-letters
+    text = text.lower().replace("'", "").replace("’", "")
+    return re.findall(r"[a-z]+", text)
+
+
+class LocalSentimentClassifier:
+    """
+    Lexicon-based sentiment classifier with negation handling.
+
+    Runs in microseconds and returns the same shape as
+    LLMService.analyze_sentiment plus a confidence in [0, 1]. Callers only
+    trust results whose confidence reaches `threshold`; everything else should
+    go to the LLM.
+    """
+
+    def __init__(self, threshold=0.6, lexicon_path=None):
+        self.threshold = threshold
+        self.lexicon = dict(DEFAULT_LEXICON)
+        self.negators = set(NEGATORS)
+        self.intensifiers = dict(INTENSIFIERS)
+        if lexicon_path:
+            self.load(lexicon_path)
+
+    def load(self, path: str):
+        """
+        Merge a JSON lexicon file of the form
+        {"words": {"word": weight}, "negators": [...], "intensifiers": {"word": boost}}.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.lexicon.update({k.lower(): float(v) for k, v in data.get("words", {}).items()})
+        self.negators.update(w.lower() for w in data.get("negators", []))
+        self.intensifiers.update({k.lower(): float(v) for k, v in data.get("intensifiers", {}).items()})
+
+    def classify(self, text: str) -> tuple[dict, float]:
+        tokens = tokenize(text)
+        valences = []
+        # Clauses after "but" dominate the overall sentiment
+        but_index = tokens.index("but") if "but" in tokens else None
+
+        for i, token in enumerate(tokens):
+            weight = self.lexicon.get(token)
+            if weight is None:
+                continue
+            if i > 0 and tokens[i - 1] in self.intensifiers:
+                boost = self.intensifiers[tokens[i - 1]]
+                weight += boost if weight > 0 else -boost
+            window = tokens[max(0, i - NEGATION_WINDOW):i]
+            if any(w in self.negators for w in window):
+                weight *= NEGATION_FACTOR
+            if but_index is not None:
+                weight *= 0.5 if i < but_index else 1.5
+            valences.append(weight)
+
+        keywords = [t for t in tokens if t not in STOPWORDS and t not in self.negators and t not in self.intensifiers and len(t) > 2]
+        keywords = list(dict.fromkeys(keywords))[:5]
+
+        if not valences:
+            return {"score": 0.0, "label": "Neutral", "keywords": keywords}, 0.0
+
+        total = sum(valences)
+        score = total / math.sqrt(total * total + NORMALIZATION_ALPHA)
+        if score >= LABEL_CUTOFF:
+            label = "Delight"
+        elif score <= -LABEL_CUTOFF:
+            label = "Frustrated"
+        else:
+            label = "Neutral"
+
+        # Confidence: how one-sided the evidence is, how much of the text the
+        # lexicon explains, and how far the score sits from a label boundary.
+        # Zero-weight words (possible in a custom lexicon) carry no evidence either way
+        agreement = abs(total) / (sum(abs(v) for v in valences) or 1.0)
+        content = [t for t in tokens if t not in STOPWORDS] or tokens
+        coverage = min(1.0, 2.0 * len(valences) / len(content))
+        margin = min(1.0, abs(abs(score) - LABEL_CUTOFF) / LABEL_CUTOFF)
+        confidence = agreement * (0.4 + 0.6 * coverage) * (0.5 + 0.5 * margin)
+
+        return {"score": round(score, 4), "label": label, "keywords": keywords}, round(confidence, 4)
@@ -1,21 +1,37 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-import models
+import config
+from database import AsyncSessionLocal, async_engine, init_db
 from llm_service import LLMService
-from feedback_processor import FeedbackProcessor
+from llm_backends import pool_from_config
+from llm_cache import LLMCache
+from llm_scheduler import PriorityLimiter, INTERACTIVE, BACKGROUND
+from circuit_breaker import CircuitBreaker
+from llm_timeouts import AdaptiveTimeouts
+from feedback_processor import FeedbackProcessor, SessionConflictError, sentiment_path_stats
+from local_classifier import LocalSentimentClassifier
+from session_cache import SessionStateCache, SessionLocks
+from sentiment_queue import SentimentQueue
+from interaction_log import InteractionLog
+from survey_engine import SurveyRegistry
+from model_keepalive import ModelKeepAlive
+from near_duplicates import NearDuplicateIndex
+from retention import RetentionWorker
+import analytics
+import export
+import ingest
+import keyword_index
+import metrics
+import near_duplicates
+import asyncio
+import datetime
+import os
+import time
 import uuid
 
-# Database Configuration
-DATABASE_URL = "sqlite:///./feedback.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Create Tables
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI()
 
 app.add_middleware(
@@ -26,42 +42,363 @@ app.add_middleware(
 )
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-# Service Singleton
-llm_service = LLMService() # uses default 120.0s
+# Service Singletons
+llm_cache = LLMCache(AsyncSessionLocal, max_entries=config.LLM_CACHE_MAX_ENTRIES, ttl=config.LLM_CACHE_TTL)
+llm_backends = pool_from_config()
+llm_limiter = PriorityLimiter(
+    # Admits up to every backend's share; the pool caps each backend at LLM_MAX_CONCURRENCY
+    max_concurrent=config.LLM_MAX_CONCURRENCY * len(llm_backends.backends),
+    max_queue=config.LLM_MAX_QUEUE,
+    queue_timeouts={INTERACTIVE: config.LLM_QUEUE_TIMEOUT_INTERACTIVE, BACKGROUND: config.LLM_QUEUE_TIMEOUT_BACKGROUND},
+)
+llm_breaker = CircuitBreaker(
+    window=config.CIRCUIT_WINDOW,
+    min_calls=config.CIRCUIT_MIN_CALLS,
+    failure_rate=config.CIRCUIT_FAILURE_RATE,
+    open_duration=config.CIRCUIT_OPEN_SECONDS,
+    half_open_max_calls=config.CIRCUIT_HALF_OPEN_PROBES,
+)
+llm_service = LLMService(
+    model_name=config.OLLAMA_MODEL,
+    timeout=config.LLM_TIMEOUT,
+    pool=llm_backends,
+    batch_max_size=config.SENTIMENT_BATCH_MAX_SIZE,
+    batch_max_wait=config.SENTIMENT_BATCH_MAX_WAIT,
+    cache=llm_cache,
+    limiter=llm_limiter,
+    breaker=llm_breaker,
+    keep_alive=config.OLLAMA_KEEP_ALIVE,
+    timeouts=AdaptiveTimeouts(
+        max_timeout=config.LLM_TIMEOUT, min_timeout=config.LLM_TIMEOUT_MIN, percentile=config.LLM_TIMEOUT_PERCENTILE,
+        multiplier=config.LLM_TIMEOUT_MULTIPLIER, window=config.LLM_TIMEOUT_WINDOW,
+        idle_reset=config.LLM_TIMEOUT_IDLE_RESET, enabled=config.LLM_ADAPTIVE_TIMEOUT,
+    ),
+    retries=config.LLM_RETRIES,
+    retry_delay=config.LLM_RETRY_DELAY,
+    hedge=config.LLM_HEDGE,
+)
+model_keepalive = ModelKeepAlive(llm_service, hours=config.MODEL_KEEPALIVE_HOURS, days=config.MODEL_KEEPALIVE_DAYS, interval=config.MODEL_KEEPALIVE_INTERVAL)
+# Seconds the startup warm-up generation took (None if skipped or failed)
+warmup_seconds = None
+# Startup progress reported by /ready; with FAST_BOOT the LLM is prepared in the background
+schema_ready = False
+llm_prepared = False
+llm_online = None
+llm_preparation = None
+session_cache = SessionStateCache(max_entries=config.SESSION_CACHE_MAX_ENTRIES, idle_ttl=config.SESSION_CACHE_IDLE_TTL)
+session_locks = SessionLocks()
+near_duplicate_index = None
+if config.NEAR_DUP_ENABLED:
+    near_duplicate_index = NearDuplicateIndex(max_distance=config.NEAR_DUP_MAX_DISTANCE, max_entries=config.NEAR_DUP_MAX_ENTRIES)
+sentiment_queue = None
+if config.DEFER_SENTIMENT:
+    sentiment_queue = SentimentQueue(AsyncSessionLocal, llm_service, workers=config.SENTIMENT_QUEUE_WORKERS, max_attempts=config.SENTIMENT_QUEUE_MAX_ATTEMPTS,
+                                     near_duplicates=near_duplicate_index)
+interaction_log = InteractionLog(
+    config.INTERACTION_LOG_PATH.replace("{pid}", str(os.getpid())),
+    flush_interval=config.INTERACTION_LOG_FLUSH_INTERVAL,
+    batch_size=config.INTERACTION_LOG_BATCH_SIZE,
+    max_bytes=config.INTERACTION_LOG_MAX_BYTES,
+    rotate_interval=config.INTERACTION_LOG_ROTATE_SECONDS,
+    compress=config.INTERACTION_LOG_COMPRESS,
+)
+surveys = SurveyRegistry(config.SURVEY_DIR, reload_interval=config.SURVEY_RELOAD_INTERVAL)
+local_classifier = None
+if config.LOCAL_CLASSIFIER_ENABLED:
+    local_classifier = LocalSentimentClassifier(threshold=config.LOCAL_CLASSIFIER_THRESHOLD, lexicon_path=config.LOCAL_CLASSIFIER_LEXICON)
+bulk_ingestor = ingest.BulkIngestor(
+    AsyncSessionLocal, llm_service, classifier=local_classifier, sentiment_queue=sentiment_queue,
+    concurrency=config.INGEST_CONCURRENCY, batch_size=config.INGEST_BATCH_SIZE, near_duplicates=near_duplicate_index,
+)
+near_duplicate_loader = None
+retention_worker = None
+if config.RETENTION_ENABLED:
+    retention_worker = RetentionWorker(
+        AsyncSessionLocal, async_engine, archive_path=config.ARCHIVE_DATABASE_PATH,
+        idle_timeout=config.SESSION_IDLE_TIMEOUT, archive_after_days=config.ARCHIVE_AFTER_DAYS,
+        require_summary=config.ARCHIVE_REQUIRE_SUMMARY, batch_size=config.RETENTION_BATCH_SIZE,
+        pause=config.RETENTION_PAUSE, vacuum_pages=config.VACUUM_SLICE_PAGES,
+        vacuum_budget=config.VACUUM_BUDGET_SECONDS, interval=config.RETENTION_INTERVAL, session_cache=session_cache,
+    )
 
-@app.on_event("startup")
-async def startup_event():
+async def load_near_duplicates():
+    # Runs in the background; until it finishes, lookups only see new results
+    try:
+        started = time.perf_counter()
+        entries = await near_duplicate_index.load(AsyncSessionLocal)
+        print(f"Near-duplicate index loaded {entries} signatures in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"WARNING: loading the near-duplicate index failed: {e}")
+
+async def prepare_llm():
+    global warmup_seconds, llm_prepared, llm_online
     print("Checking LLM Connection...")
-    if await llm_service.check_connection():
+    llm_online = await llm_service.check_connection()
+    if llm_online:
         print("LLM Service Online")
     else:
         print("WARNING: LLM Service Untouchable. Check Ollama is running.")
+    # Imports LangChain and builds the chains, otherwise the first turn does
+    await llm_service.load_async()
+    print(f"LLM stack loaded in {llm_service.load_seconds:.2f}s")
+    if llm_online and config.LLM_WARMUP:
+        # Load the model now rather than on the first user's turn
+        try:
+            warmup_seconds = await llm_service.warm_up(timeout=config.LLM_WARMUP_TIMEOUT)
+            print(f"LLM warmed up in {warmup_seconds:.2f}s")
+        except Exception as e:
+            print(f"WARNING: LLM warm-up failed ({type(e).__name__}: {e}); the first request will load the model")
+    llm_prepared = True
+
+@app.on_event("startup")
+async def startup_event():
+    global near_duplicate_loader, schema_ready, llm_preparation
+    if config.INIT_DB_ON_STARTUP:
+        # Off the event loop; create_all and the migrations are blocking
+        await asyncio.to_thread(init_db)
+    schema_ready = True
+    if config.FAST_BOOT:
+        llm_preparation = asyncio.create_task(prepare_llm())
+    else:
+        await prepare_llm()
+    llm_backends.start(llm_service.check_connection)
+    interaction_log.start()
+    surveys.start()
+    model_keepalive.start()
+    if near_duplicate_index is not None:
+        near_duplicate_loader = asyncio.create_task(load_near_duplicates())
+    if sentiment_queue:
+        sentiment_queue.start()
+    if retention_worker:
+        retention_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if retention_worker:
+        await retention_worker.stop()
+    if llm_preparation is not None:
+        llm_preparation.cancel()
+        await asyncio.gather(llm_preparation, return_exceptions=True)
+    if sentiment_queue:
+        await sentiment_queue.stop()
+    await model_keepalive.stop()
+    if near_duplicate_loader is not None:
+        near_duplicate_loader.cancel()
+        await asyncio.gather(near_duplicate_loader, return_exceptions=True)
+    await surveys.stop()
+    await interaction_log.stop()
+    await llm_service.close()
+
+class UploadStreamingResponse(StreamingResponse):
+    # StreamingResponse listens for the client disconnecting by reading from
+    # `receive` (ASGI spec < 2.4), which would swallow the request body an
+    # endpoint is still streaming in. A gone client shows up as
+    # ClientDisconnect while reading the body instead.
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
 
 class AnalyzeRequest(BaseModel):
     text: str
     session_id: str | None = None
+    customer_segment: str | None = None
+    # Survey definition for a new session (default: "default")
+    survey_id: str | None = None
+    # Latency budget for this turn (default ANALYZE_DEADLINE)
+    deadline_ms: int | None = None
 
 @app.get("/")
 def root():
     return {"status": "Feedback Bot Online", "mode": "State Machine"}
 
+@app.get("/ready")
+def ready(response: Response):
+    # Liveness is "/"; this answers 503 until the schema exists and the LLM
+    # stack has been loaded and warmed up (or found offline, so turns fall back)
+    is_ready = schema_ready and llm_prepared
+    if not is_ready:
+        response.status_code = 503
+    return {
+        "ready": is_ready,
+        "schema_ready": schema_ready,
+        "llm_loaded": llm_service.loaded,
+        "llm_load_seconds": llm_service.load_seconds,
+        "llm_online": llm_online,
+        "warmup_seconds": warmup_seconds,
+    }
+
+@app.get("/analytics")
+async def get_analytics(bucket: str = "day", start: datetime.datetime | None = None, end: datetime.datetime | None = None,
+                        segment: str | None = None, db: AsyncSession = Depends(get_db)):
+    # Served from the rollup tables; defaults to the last 30 buckets
+    if bucket not in analytics.BUCKET_SIZES:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(analytics.BUCKET_SIZES)}")
+    if start is None:
+        start = datetime.datetime.utcnow() - datetime.timedelta(**{f"{bucket}s": 29})
+    return await analytics.query(db, bucket=bucket, start=start, end=end, segment=segment)
+
+@app.get("/search")
+async def search_interactions(q: str, limit: int = 50, before_id: int | None = None, db: AsyncSession = Depends(get_db)):
+    # Comma-separated keywords, all required; pass next_before_id back as before_id for the next page
+    if not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    return await keyword_index.search(db, q, limit=limit, before_id=before_id)
+
+@app.get("/trending")
+async def trending_keywords(bucket: str = "hour", window: int = 24, limit: int = 20, min_count: int = 3,
+                            sentiment: str = "negative", db: AsyncSession = Depends(get_db)):
+    # Keywords rising in the last `window` buckets compared with the `window` before, from the keyword rollups
+    if bucket not in keyword_index.WINDOW_STEPS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(keyword_index.WINDOW_STEPS)}")
+    if sentiment not in keyword_index.SENTIMENT_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"sentiment must be one of {', '.join(keyword_index.SENTIMENT_WEIGHTS)}")
+    if not 1 <= window <= 366 or not 1 <= limit <= 500 or min_count < 1:
+        raise HTTPException(status_code=400, detail="window must be 1-366, limit 1-500 and min_count at least 1")
+    return await keyword_index.trending(db, bucket=bucket, window=window, limit=limit, min_count=min_count, sentiment=sentiment)
+
+@app.get("/duplicates")
+async def duplicate_clusters(start: datetime.datetime | None = None, end: datetime.datetime | None = None, min_size: int = 2,
+                             limit: int = 20, max_distance: int | None = None, db: AsyncSession = Depends(get_db)):
+    # Near-duplicate clusters by SimHash signature; defaults to the last 7 days
+    max_distance = config.NEAR_DUP_MAX_DISTANCE if max_distance is None else max_distance
+    if not 0 <= max_distance <= 7 or min_size < 2 or not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="max_distance must be 0-7, min_size at least 2 and limit 1-500")
+    if start is None:
+        start = datetime.datetime.utcnow() - datetime.timedelta(days=7)
+    return await near_duplicates.report(db, start=start, end=end, min_size=min_size, limit=limit, max_distance=max_distance)
+
+@app.get("/export")
+def export_interactions(format: str = "ndjson", start: datetime.datetime | None = None, end: datetime.datetime | None = None,
+                        after_id: int | None = None):
+    # Streams pages straight from the DB; pass the last interaction_id back as after_id for incremental pulls
+    # (those hold back rows whose deferred sentiment is still pending, see export.iter_rows)
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    rows = export.iter_rows(AsyncSessionLocal, start=start, end=end, after_id=after_id)
+    return StreamingResponse(export.serialize(rows, format), media_type=export.MEDIA_TYPES[format])
+
+@app.post("/ingest")
+async def ingest_feedback(request: Request, format: str | None = None, job_id: str | None = None,
+                          segment: str | None = None, source: str | None = None):
+    # Raw NDJSON or CSV body; per-row results and progress stream back as NDJSON.
+    # Re-send the same file with the returned job_id to resume an interrupted job.
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if format not in ingest.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(ingest.FORMATS)}")
+    try:
+        job = await bulk_ingestor.open(job_id, format, source=source, segment=segment)
+    except ingest.IngestConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    results = bulk_ingestor.run(job, request.stream())
+    return UploadStreamingResponse(ingest.serialize(results), media_type="application/x-ndjson", headers={"X-Ingest-Job-Id": job["job_id"]})
+
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    status = await bulk_ingestor.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"unknown ingest job {job_id!r}")
+    return status
+
+@app.get("/surveys")
+def list_surveys():
+    return surveys.stats()
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/cache")
+def cache_stats():
+    return llm_cache.stats()
+
+@app.get("/stats/llm-scheduler")
+def llm_scheduler_stats():
+    return llm_limiter.stats()
+
+@app.get("/stats/llm-timeouts")
+def llm_timeouts_stats():
+    return {**llm_service.timeouts.stats(), "hedge": llm_service.hedge, "retries": llm_service.retries}
+
+@app.get("/stats/llm-backends")
+def llm_backends_stats():
+    return llm_backends.stats()
+
+@app.get("/stats/circuit-breaker")
+def circuit_breaker_stats():
+    return llm_breaker.stats()
+
+@app.get("/stats/session-cache")
+def session_cache_stats():
+    return session_cache.stats()
+
+@app.get("/stats/session-locks")
+def session_locks_stats():
+    return session_locks.stats()
+
+@app.get("/stats/model-keepalive")
+def model_keepalive_stats():
+    return {**model_keepalive.stats(), "warmup_seconds": warmup_seconds}
+
+@app.get("/stats/sentiment-queue")
+async def sentiment_queue_stats():
+    if not sentiment_queue:
+        return {"enabled": False}
+    return {"enabled": True, **await sentiment_queue.stats()}
+
+@app.get("/stats/near-duplicates")
+def near_duplicate_stats():
+    if near_duplicate_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **near_duplicate_index.stats()}
+
+@app.get("/stats/retention")
+def retention_stats():
+    if retention_worker is None:
+        return {"enabled": False}
+    return {"enabled": True, **retention_worker.stats()}
+
+@app.get("/stats/interaction-log")
+def interaction_log_stats():
+    return interaction_log.stats()
+
+@app.get("/stats/sentiment-paths")
+def sentiment_paths():
+    return sentiment_path_stats()
+
 @app.post("/analyze")
-async def analyze_feedback(request: AnalyzeRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def analyze_feedback(request: AnalyzeRequest, response: Response, db: AsyncSession = Depends(get_db)):
+    # The turn's latency budget runs from arrival, so lock and queue waits count
+    budget = request.deadline_ms / 1000 if request.deadline_ms else config.ANALYZE_DEADLINE
+    deadline = time.monotonic() + budget if budget > 0 else None
     # Ensure session_id
     if not request.session_id:
         request.session_id = str(uuid.uuid4())
+    if request.survey_id is not None and request.survey_id not in surveys:
+        raise HTTPException(status_code=400, detail=f"unknown survey_id {request.survey_id!r}")
         
-    processor = FeedbackProcessor(llm_service, db)
+    processor = FeedbackProcessor(
+        llm_service, db, classifier=local_classifier, session_cache=session_cache,
+        sentiment_queue=sentiment_queue, interaction_log=interaction_log, surveys=surveys,
+        session_locks=session_locks, near_duplicates=near_duplicate_index,
+    )
+    trace = metrics.start_trace()
+    path, status = "none", "success"
     
     try:
-        result = await processor.process_response(request.text, request.session_id, background_tasks)
+        result = await processor.process_response(
+            request.text, request.session_id,
+            customer_segment=request.customer_segment, survey_id=request.survey_id, deadline=deadline,
+        )
+        path = result["sentiment_path"]
+        # Which sentiment tier answered and which step transition happened (used by loadtest.py)
+        response.headers["X-Sentiment-Path"] = result["sentiment_path"]
+        response.headers["X-Survey-Transition"] = result["transition"]
         
         return {
             "session_id": request.session_id,
@@ -70,9 +407,25 @@ async def analyze_feedback(request: AnalyzeRequest, background_tasks: Background
             "recommendation": result["recommendation"],
             "status": "success"
         }
+    except SessionConflictError:
+        # Other workers kept winning this session's row; nothing was written
+        status = "conflict"
+        response.status_code = 409
+        return {
+            "session_id": request.session_id,
+            "message": "Your previous message is still being processed. Please try again.",
+            "status": "error"
+        }
     except Exception as e:
+        status = "error"
         print(f"Error processing feedback: {e}")
         return {
             "message": "I'm having trouble connecting right now. Please try again.",
             "status": "error"
-        }
\ No newline at end of file
+        }
+    finally:
+        elapsed = trace.elapsed()
+        metrics.TURN_SECONDS.observe(elapsed, path=path, status=status)
+        if config.SLOW_REQUEST_SECONDS and elapsed >= config.SLOW_REQUEST_SECONDS:
+            metrics.SLOW_TURNS.inc()
+            print(f"Slow turn {elapsed * 1000:.0f}ms (session {request.session_id}, path {path}, {status}): {trace.format()}")
\ No newline at end of file
@@ -0,0 +1,176 @@
+import bisect
+import contextvars
+import time
+from contextlib import contextmanager
+
+# In-process counters and histograms rendered in the Prometheus text format
+# by GET /metrics, plus a per-turn trace of stage timings for the slow-request
+# log. Metrics are only updated from the event loop thread, so no locking.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+TURN_SECONDS = REGISTRY.histogram(
+    "feedback_turn_seconds", "End-to-end /analyze latency by sentiment path.", ["path", "status"])
+STAGE_SECONDS = REGISTRY.histogram(
+    "feedback_stage_seconds", "Time spent in each stage of a turn.", ["stage"])
+SLOW_TURNS = REGISTRY.counter(
+    "feedback_slow_turns_total", "Turns slower than SLOW_REQUEST_SECONDS.")
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "llm_call_seconds", "LLMService method latency including cache, queueing and retries.", ["method", "result"])
+LLM_ATTEMPT_SECONDS = REGISTRY.histogram(
+    "llm_attempt_seconds", "Latency of each LLM attempt made by _retry_operation.", ["method", "outcome"])
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "llm_queue_wait_seconds", "Time spent waiting for a generation slot.", ["priority"])
+LLM_FALLBACKS = REGISTRY.counter(
+    "llm_fallbacks_total", "LLM calls answered with the fallback value.", ["method", "reason"])
+SESSION_CONFLICTS = REGISTRY.counter(
+    "feedback_session_conflicts_total", "Turns that lost their session's row version to another process.", ["outcome"])
+INGEST_ROWS = REGISTRY.counter(
+    "feedback_ingest_rows_total", "Bulk-ingested rows by sentiment path (or invalid).", ["path"])
+
+
+class TurnTrace:
+    """Stage timings collected for one turn, for the slow-request log."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []  # (name, seconds, detail)
+
+    def add(self, name, seconds, detail=None):
+        self.stages.append((name, seconds, detail))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def format(self) -> str:
+        parts = []
+        for name, seconds, detail in self.stages:
+            parts.append(f"{name}={seconds * 1000:.1f}ms" + (f" ({detail})" if detail else ""))
+        return ", ".join(parts)
+
+
+_current_trace = contextvars.ContextVar("turn_trace", default=None)
+
+
+def start_trace() -> TurnTrace:
+    trace = TurnTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def record(name, seconds, detail=None):
+    """Adds an entry to the current turn's trace, if one is being collected."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds, detail)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """
+    Observes the block's duration in `histogram`. Yields the label dict so
+    the block can fill in labels it only learns while running (e.g. result).
+    """
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def observe_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    record(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Times a block as a turn stage: histogram plus trace entry."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
@@ -0,0 +1,121 @@
+import asyncio
+import datetime
+import time
+
+# Keeps the Ollama model resident during business hours. Ollama unloads a
+# model keep_alive after its last request, and the next request then pays the
+# whole load time. Inside the configured window, ModelKeepAlive reloads the
+# model (a generate request without a prompt) whenever the app has sent no
+# generation for `interval` seconds. Outside the window it does nothing, so the
+# model unloads overnight as usual.
+
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def parse_hours(hours):
+    """"08:00-18:00" -> (datetime.time(8), datetime.time(18)); empty -> None."""
+    if not hours or not hours.strip():
+        return None
+    try:
+        start, end = (datetime.time.fromisoformat(part.strip()) for part in hours.split("-"))
+    except ValueError:
+        raise ValueError(f"Keep-alive hours must look like 08:00-18:00, got {hours!r}")
+    if start == end:
+        raise ValueError(f"Keep-alive window {hours!r} is empty")
+    return start, end
+
+
+def parse_days(days):
+    """"mon,tue" -> {0, 1} (datetime.weekday() numbers)."""
+    result = set()
+    for name in days.split(","):
+        name = name.strip().lower()[:3]
+        if not name:
+            continue
+        if name not in DAY_NAMES:
+            raise ValueError(f"Unknown keep-alive day {name!r}, use {','.join(DAY_NAMES)}")
+        result.add(DAY_NAMES.index(name))
+    return result
+
+
+class ModelKeepAlive:
+    def __init__(self, llm_service, hours="08:00-18:00", days="mon,tue,wed,thu,fri", interval=240.0, now=datetime.datetime.now):
+        self.llm_service = llm_service
+        self.window = parse_hours(hours)
+        self.days = parse_days(days)
+        self.interval = interval
+        self._now = now  # local wall clock, replaceable for tests
+        self.pings = 0
+        self.failures = 0
+        self.last_ping = None
+        self._task = None
+
+    @property
+    def enabled(self):
+        return self.window is not None and bool(self.days)
+
+    def in_window(self, moment=None) -> bool:
+        if not self.enabled:
+            return False
+        moment = moment or self._now()
+        start, end = self.window
+        clock = moment.time()
+        if start < end:
+            return moment.weekday() in self.days and start <= clock < end
+        # Crosses midnight: the early-morning part belongs to the previous day's window
+        if clock >= start:
+            return moment.weekday() in self.days
+        if clock < end:
+            return (moment.weekday() - 1) % 7 in self.days
+        return False
+
+    def due(self) -> bool:
+        if not self.in_window():
+            return False
+        last_used = self.llm_service.last_used
+        return last_used is None or time.monotonic() - last_used >= self.interval
+
+    async def tick(self) -> bool:
+        """Reloads the model if it is due; returns whether a ping was sent."""
+        if not self.due():
+            return False
+        ok = await self.llm_service.keep_model_loaded()
+        if ok:
+            self.pings += 1
+            self.last_ping = time.time()
+            self.llm_service.last_used = time.monotonic()
+        else:
+            self.failures += 1
+        return True
+
+    def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        # Check often enough that the model never sits idle much past the interval
+        check_every = min(30.0, max(self.interval / 4, 0.05))
+        while True:
+            await asyncio.sleep(check_every)
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Model keep-alive tick failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "window": f"{self.window[0]:%H:%M}-{self.window[1]:%H:%M}" if self.window else None,
+            "days": [DAY_NAMES[d] for d in sorted(self.days)],
+            "interval": self.interval,
+            "in_window": self.in_window(),
+            "pings": self.pings,
+            "failures": self.failures,
+            "last_ping": self.last_ping,
+        }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Float
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, JSON, Float, Index
 from sqlalchemy.orm import relationship, declarative_base
 import datetime
 
@@ -9,24 +9,151 @@ class SurveySession(Base):
     
     session_id = Column(String, primary_key=True, index=True)
     start_time = Column(DateTime, default=datetime.datetime.utcnow)
+    # Set when the session reaches a terminal state or is closed for being idle (retention.py)
     end_time = Column(DateTime, nullable=True)
+    # Time of the session's latest turn
+    last_activity = Column(DateTime, nullable=True)
     current_step = Column(String, default="INIT")
     nps_score = Column(Integer, nullable=True)
     customer_segment = Column(String, nullable=True)
+    # Survey definition the session follows (survey_engine); NULL means "default"
+    survey_id = Column(String, nullable=True)
+    # Bumped by every turn; a turn only commits if the version it read is
+    # still current, so concurrent workers can't overwrite each other
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     # Store the compressed summary here (ScaleDown data)
     summary_json = Column(JSON, nullable=True)
+    # Id of the last interaction folded into summary_json
+    summary_watermark = Column(Integer, nullable=True)
+    # Aggregate counts of the interactions moved to the archive database
+    # (retention.py); their content is covered by summary_json
+    archive_stats = Column(JSON, nullable=True)
     
     interactions = relationship("Interaction", back_populates="session")
+    
+    __table_args__ = (
+        # Open sessions by idleness, for the retention worker
+        Index("ix_survey_sessions_open", "end_time", "last_activity"),
+    )
 
 class Interaction(Base):
     __tablename__ = "interactions"
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, ForeignKey("survey_sessions.session_id"))
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    session_id = Column(String, ForeignKey("survey_sessions.session_id"), index=True)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     user_input = Column(String)
     bot_response = Column(String)
     sentiment_label = Column(String) # Frustrated, Delight, Neutral
     sentiment_score = Column(Float) 
+    # Normalized keywords from sentiment analysis (see keyword_index.py)
+    keywords = Column(JSON, nullable=True)
+    # Which tier produced the sentiment (nps_regex, local_classifier, llm,
+    # near_duplicate, fallback, deferred); only "llm" results are reused
+    sentiment_path = Column(String, nullable=True)
+    # 64-bit SimHash of user_input (see near_duplicates.py), NULL for texts too short to compare
+    simhash = Column(BigInteger, nullable=True)
     
     session = relationship("SurveySession", back_populates="interactions")
+    
+    # Ids are never reused once the newest rows are archived: the archive, the
+    # export cursor and summary_watermark all rely on them only growing
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class InteractionKeyword(Base):
+    __tablename__ = "interaction_keywords"
+    
+    # Inverted index: keyword term -> interactions mentioning it. Clustered on
+    # (keyword, interaction_id), so one term's postings are a single range scan
+    keyword = Column(String, primary_key=True)
+    interaction_id = Column(Integer, ForeignKey("interactions.id"), primary_key=True)
+    
+    interaction = relationship("Interaction")
+    
+    __table_args__ = {"sqlite_with_rowid": False}
+
+class KeywordRollup(Base):
+    __tablename__ = "keyword_rollups"
+    
+    # Mentions of each keyword term per hour/day bucket, for trending topics
+    bucket = Column(String, primary_key=True) # hour, day
+    bucket_start = Column(DateTime, primary_key=True)
+    keyword = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+    scored = Column(Integer, default=0) # mentions with a sentiment score
+    sentiment_sum = Column(Float, default=0.0)
+    
+    __table_args__ = (Index("ix_keyword_rollups_keyword", "keyword", "bucket", "bucket_start"),)
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+    
+    # sha256 of namespace + model + prompt version + normalized input
+    cache_key = Column(String, primary_key=True)
+    namespace = Column(String) # sentiment, compression
+    value = Column(JSON)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class SentimentJob(Base):
+    __tablename__ = "sentiment_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    interaction_id = Column(Integer, ForeignKey("interactions.id"))
+    status = Column(String, default="pending") # pending, failed
+    attempts = Column(Integer, default=0)
+    # Not claimable before this time (lease expiry or retry backoff)
+    available_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    
+    interaction = relationship("Interaction")
+    
+    __table_args__ = (Index("ix_sentiment_jobs_status_available", "status", "available_at"),)
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+    
+    # One bulk import (see ingest.py); its rows go into session_id
+    id = Column(String, primary_key=True)
+    source = Column(String, nullable=True) # file name or label given by the uploader
+    format = Column(String) # ndjson, csv
+    session_id = Column(String, ForeignKey("survey_sessions.session_id"))
+    status = Column(String, default="running") # running, completed
+    # Input records consumed and committed; a resumed job skips this many
+    rows_done = Column(Integer, nullable=False, default=0, server_default="0")
+    inserted = Column(Integer, nullable=False, default=0, server_default="0")
+    invalid = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class AnalyticsRollup(Base):
+    __tablename__ = "analytics_rollups"
+    
+    # Counters per (bucket size, segment, bucket start, metric, key), kept up
+    # to date by each turn's commit; see analytics.py
+    bucket = Column(String, primary_key=True) # hour, day
+    segment = Column(String, primary_key=True) # customer_segment, "*" for all
+    bucket_start = Column(DateTime, primary_key=True)
+    metric = Column(String, primary_key=True) # turns, started, funnel, nps, csat, sentiment
+    key = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+
+# Tables of the archive database (ARCHIVE_DATABASE_PATH), kept apart from Base
+# so init_db() never creates them in the live database
+ArchiveBase = declarative_base()
+
+class ArchivedInteraction(ArchiveBase):
+    __tablename__ = "archived_interactions"
+    
+    # Same id and columns as the interaction it was moved from
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, index=True)
+    timestamp = Column(DateTime, index=True)
+    user_input = Column(String)
+    bot_response = Column(String)
+    sentiment_label = Column(String)
+    sentiment_score = Column(Float)
+    keywords = Column(JSON, nullable=True)
+    sentiment_path = Column(String, nullable=True)
+    simhash = Column(BigInteger, nullable=True)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,324 @@
+import argparse
+import array
+import asyncio
+import datetime
+import functools
+import hashlib
+import sys
+import time
+from collections import Counter
+from sqlalchemy import select, update
+from models import Interaction
+from local_classifier import DEFAULT_LEXICON, INTENSIFIERS, NEGATORS, STOPWORDS, tokenize
+
+# Near-duplicate detection with 64-bit SimHash signatures. A text's signature
+# is the SimHash of the character trigrams of its content words (stopwords and
+# filler dropped, suffixes stripped), so "app crashes on login" and "the app
+# crashed at login!!" get the same signature, and small wording changes only
+# flip a few bits. NearDuplicateIndex keeps the signatures of LLM-scored interactions in
+# memory, split into max_distance + 1 bands: two signatures within
+# max_distance bits agree exactly on at least one band, so a lookup is one
+# dict probe per band plus a popcount per candidate.
+
+BITS = 64
+MASK = (1 << BITS) - 1
+MIN_WORDS = 2  # shorter texts are left to the exact cache
+MAX_TEXT_CHARS = 2000
+MAX_BUCKET = 256  # signatures kept per band value; the oldest are dropped
+# Words that change neither the topic nor the sentiment of a complaint; on top
+# of the classifier's stopwords and intensifiers they are left out of signatures
+FILLER = {
+    "again", "today", "still", "now", "yet", "please", "pls", "fix", "hi", "hello", "hey", "honestly", "ugh",
+    "well", "ok", "okay", "guys", "team", "thanks", "thank", "lol",
+}
+
+# byte -> its 8 bits spread into 16-bit lanes, so summing spread hashes counts
+# every bit position at once (one big-int addition per feature)
+_SPREAD_BYTE = [sum(1 << (16 * j) for j in range(8) if b >> j & 1) for b in range(256)]
+
+
+@functools.lru_cache(maxsize=65536)
+def _spread(feature):
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return sum(_SPREAD_BYTE[(h >> (8 * k)) & 0xFF] << (128 * k) for k in range(8))
+
+
+def _signed(fingerprint):
+    # SQLite integers are signed 64-bit
+    return fingerprint - (1 << BITS) if fingerprint >> (BITS - 1) else fingerprint
+
+
+_IGNORED = STOPWORDS | FILLER | set(INTENSIFIERS)
+
+
+def _stem(word):
+    # Crude suffix stripping, enough to make "crashes"/"crashed"/"crashing" one feature
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix) and not word.endswith("ss"):
+            return word[:-len(suffix)]
+    return word
+
+
+def signature(text):
+    """
+    Returns (simhash, polarity) for `text`, or None if it has fewer than
+    MIN_WORDS content words. Polarity packs whether the text is negated and
+    how many positive/negative lexicon words it has; near-duplicates must
+    agree on it, so "is working" never reuses the result of "is not working".
+    """
+    tokens = tokenize(text[:MAX_TEXT_CHARS])
+    words = ["not" if t in NEGATORS else _stem(t) for t in tokens if t not in _IGNORED]
+    if len(words) < MIN_WORDS:
+        return None
+    features = {f" {w} "[i:i + 3] for w in words for i in range(len(w))}
+    lanes = array.array("H", sum(_spread(f) for f in features).to_bytes(BITS * 2, sys.byteorder))
+    half = len(features) / 2
+    fingerprint = 0
+    for bit, count in enumerate(lanes):
+        if count > half:
+            fingerprint |= 1 << bit
+    negated = any(t in NEGATORS for t in tokens)
+    positive = sum(1 for t in tokens if DEFAULT_LEXICON.get(t, 0) > 0)
+    negative = sum(1 for t in tokens if DEFAULT_LEXICON.get(t, 0) < 0)
+    return _signed(fingerprint), int(negated) | min(positive, 3) << 1 | min(negative, 3) << 3
+
+
+def distance(a, b):
+    return ((a ^ b) & MASK).bit_count()
+
+
+def _bands(max_distance):
+    # (shift, mask) of max_distance + 1 bands covering all 64 bits
+    count = max_distance + 1
+    width = BITS // count
+    return [(i * width, (1 << (BITS - i * width if i == count - 1 else width)) - 1) for i in range(count)]
+
+
+class NearDuplicateIndex:
+    """
+    In-memory SimHash index of past sentiment results. `lookup` returns the
+    stored result of the closest signature within `max_distance` bits (and
+    the same polarity); `add` records a new one. Holds at most `max_entries`
+    distinct signatures and forgets the oldest first.
+    """
+
+    def __init__(self, max_distance=3, max_entries=1_000_000):
+        if not 0 <= max_distance <= 7:
+            raise ValueError("max_distance must be between 0 and 7 bits")
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.bands = _bands(max_distance)
+        self._buckets = [{} for _ in self.bands]  # per band: band value -> [simhash, ...]
+        self._entries = {}  # simhash -> (polarity, label, score, keywords, interaction_id), oldest first
+        self.loaded = False
+        self._stats = {"hits": 0, "misses": 0, "skipped": 0, "evicted": 0}
+        self._lookup_seconds = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, text, sig=None):
+        """
+        Returns (sentiment dict, distance, interaction_id) of the nearest
+        stored result, or None. Pass `sig` when the caller already computed
+        signature(text).
+        """
+        started = time.perf_counter()
+        sig = sig or signature(text)
+        if sig is None:
+            self._stats["skipped"] += 1
+            return None
+        fingerprint, polarity = sig
+        best = None
+        for (shift, mask), buckets in zip(self.bands, self._buckets):
+            for candidate in buckets.get((fingerprint >> shift) & mask, ()):
+                d = distance(fingerprint, candidate)
+                if d <= self.max_distance and (best is None or d < best[0]):
+                    entry = self._entries[candidate]
+                    if entry[0] == polarity:
+                        best = (d, entry)
+        self._lookup_seconds += time.perf_counter() - started
+        if best is None:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        d, (_, label, score, keywords, interaction_id) = best
+        return {"score": score, "label": label, "keywords": list(keywords)}, d, interaction_id
+
+    def add(self, sig, label, score, keywords=(), interaction_id=None):
+        if sig is None or label is None:
+            return
+        fingerprint, polarity = sig
+        if fingerprint in self._entries:
+            # Same signature: keep the latest result, now the youngest entry
+            del self._entries[fingerprint]
+        else:
+            for (shift, mask), buckets in zip(self.bands, self._buckets):
+                bucket = buckets.setdefault((fingerprint >> shift) & mask, [])
+                bucket.append(fingerprint)
+                if len(bucket) > MAX_BUCKET:
+                    del bucket[0]
+            while len(self._entries) >= self.max_entries:
+                self._evict(next(iter(self._entries)))
+        self._entries[fingerprint] = (polarity, label, score, tuple(keywords or ()), interaction_id)
+
+    def _evict(self, fingerprint):
+        del self._entries[fingerprint]
+        self._stats["evicted"] += 1
+        for (shift, mask), buckets in zip(self.bands, self._buckets):
+            key = (fingerprint >> shift) & mask
+            bucket = buckets.get(key)
+            if bucket is not None and fingerprint in bucket:
+                bucket.remove(fingerprint)
+                if not bucket:
+                    del buckets[key]
+
+    async def load(self, session_factory, batch_size=10000):
+        """Fills the index with the newest LLM-scored interactions."""
+        async with session_factory() as db:
+            newest = await db.scalar(
+                select(Interaction.id)
+                .where(Interaction.sentiment_path == "llm", Interaction.simhash.is_not(None))
+                .order_by(Interaction.id.desc()).offset(self.max_entries - 1).limit(1)
+            )
+            result = await db.stream(
+                select(Interaction.id, Interaction.user_input, Interaction.simhash, Interaction.sentiment_label,
+                       Interaction.sentiment_score, Interaction.keywords)
+                .where(Interaction.sentiment_path == "llm", Interaction.simhash.is_not(None),
+                       Interaction.id >= (newest or 0))
+                .order_by(Interaction.id)
+                .execution_options(yield_per=batch_size)
+            )
+            async for row in result:
+                # Polarity isn't stored; it's cheap to recompute from the text
+                sig = signature(row.user_input)
+                if sig is not None:
+                    self.add((row.simhash, sig[1]), row.sentiment_label, row.sentiment_score, row.keywords or (), row.id)
+        self.loaded = True
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            "loaded": self.loaded,
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_lookup_us": round(self._lookup_seconds / lookups * 1e6, 1) if lookups else 0.0,
+        }
+
+
+def cluster_signatures(rows, max_distance=3):
+    """
+    Groups (id, simhash) pairs into near-duplicate clusters; returns lists of
+    ids, largest first. Identical signatures are merged first, then distinct
+    ones within `max_distance` bits via the same banding as the index.
+    """
+    by_signature = {}
+    for interaction_id, fingerprint in rows:
+        by_signature.setdefault(fingerprint, []).append(interaction_id)
+    parent = {f: f for f in by_signature}
+
+    def root(f):
+        while parent[f] != f:
+            parent[f] = parent[parent[f]]
+            f = parent[f]
+        return f
+
+    for shift, mask in _bands(max_distance):
+        buckets = {}
+        for fingerprint in by_signature:
+            bucket = buckets.setdefault((fingerprint >> shift) & mask, [])
+            for other in bucket[-MAX_BUCKET:]:
+                if distance(fingerprint, other) <= max_distance:
+                    parent[root(fingerprint)] = root(other)
+            bucket.append(fingerprint)
+
+    clusters = {}
+    for fingerprint, ids in by_signature.items():
+        clusters.setdefault(root(fingerprint), []).extend(ids)
+    return sorted(clusters.values(), key=len, reverse=True)
+
+
+async def report(db, start=None, end=None, min_size=2, limit=20, max_distance=3) -> dict:
+    """Near-duplicate clusters among interactions in [start, end), largest first."""
+    stmt = select(Interaction.id, Interaction.simhash).where(Interaction.simhash.is_not(None))
+    if start is not None:
+        stmt = stmt.where(Interaction.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(Interaction.timestamp < end)
+    rows = (await db.execute(stmt)).all()
+    clusters = [ids for ids in cluster_signatures(rows, max_distance) if len(ids) >= min_size]
+
+    details = []
+    for ids in clusters[:limit]:
+        members = (await db.execute(
+            select(Interaction.id, Interaction.timestamp, Interaction.user_input, Interaction.sentiment_label)
+            .where(Interaction.id.in_(ids))
+        )).all()
+        texts = Counter(m.user_input for m in members)
+        details.append({
+            "size": len(ids),
+            "text": texts.most_common(1)[0][0],
+            "variants": [t for t, _ in texts.most_common(5)],
+            "labels": dict(Counter(m.sentiment_label for m in members)),
+            "first_seen": min(m.timestamp for m in members).isoformat(),
+            "last_seen": max(m.timestamp for m in members).isoformat(),
+            "interaction_ids": sorted(ids)[-10:],
+        })
+    return {
+        "interactions": len(rows),
+        "clusters": len(clusters),
+        "duplicated_interactions": sum(len(ids) for ids in clusters),
+        "max_distance": max_distance,
+        "top": details,
+    }
+
+
+async def backfill(session_factory, batch_size=5000):
+    """Computes missing signatures of stored interactions (for the cluster report)."""
+    updated, last_id = 0, 0
+    while True:
+        async with session_factory() as db:
+            rows = (await db.execute(
+                select(Interaction.id, Interaction.user_input)
+                .where(Interaction.id > last_id, Interaction.simhash.is_(None))
+                .order_by(Interaction.id).limit(batch_size)
+            )).all()
+            if not rows:
+                return updated
+            for row in rows:
+                sig = signature(row.user_input or "")
+                if sig is not None:
+                    await db.execute(update(Interaction).where(Interaction.id == row.id).values(simhash=sig[0]))
+                    updated += 1
+            await db.commit()
+            last_id = rows[-1].id
+
+
+async def _main(args):
+    from database import AsyncSessionLocal, init_db
+
+    init_db()
+    if args.command == "backfill":
+        updated = await backfill(AsyncSessionLocal)
+        print(f"Computed signatures of {updated} interactions.")
+        return
+    start = datetime.datetime.utcnow() - datetime.timedelta(days=args.days) if args.days else None
+    async with AsyncSessionLocal() as db:
+        result = await report(db, start=start, min_size=args.min_size, limit=args.limit, max_distance=args.max_distance)
+    print(f"{result['clusters']} clusters covering {result['duplicated_interactions']} of {result['interactions']} interactions")
+    for cluster in result["top"]:
+        print(f"  {cluster['size']:>6}  {cluster['labels']}  {cluster['text'][:80]!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate signatures and cluster report.")
+    parser.add_argument("command", choices=["backfill", "report"])
+    parser.add_argument("--days", type=int, default=7, help="report: look back this many days (0 = all)")
+    parser.add_argument("--min-size", type=int, default=2)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--max-distance", type=int, default=3)
+    asyncio.run(_main(parser.parse_args()))
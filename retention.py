@@ -0,0 +1,429 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import os
+import time
+from sqlalchemy import MetaData, create_engine, select, update, delete, func, or_, bindparam, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from models import ArchiveBase, ArchivedInteraction, Interaction, InteractionKeyword, SentimentJob, SurveySession
+from ingest import IMPORT_SURVEY_ID
+from keyword_index import index_terms
+
+# Retention and compaction, run by RetentionWorker every RETENTION_INTERVAL
+# seconds (or once with `python retention.py run`):
+#
+#   1. close sessions idle for longer than the idle timeout (end_time is set
+#      to their last turn; their next turn restarts the survey)
+#   2. move the interactions of sessions that ended before the archive cutoff
+#      to the archive database, folding their counts into the session's
+#      archive_stats (their content is in summary_json)
+#   3. hand freed pages back to the OS with incremental vacuum
+#
+# Every step works in small batches with a pause in between, so a turn never
+# waits long for the write lock. Archiving is two commits, archive database
+# first: a pass that dies in between leaves rows in both databases, and the
+# next pass finds them archived unchanged and deletes them. An archived row
+# whose id matches but whose content differs stops the pass
+# (ArchiveConflictError) and the live row stays.
+#
+#   python retention.py run                 # one pass with the configured limits
+#   python retention.py stats               # database size and free pages
+#   python retention.py vacuum --full       # enable incremental vacuum on an existing database (app stopped)
+#
+# The analytics and keyword rebuilds replay archived rows too, by attaching the
+# archive database to their connection (attached_archive).
+
+ARCHIVE_COLUMNS = (
+    "id", "session_id", "timestamp", "user_input", "bot_response", "sentiment_label",
+    "sentiment_score", "keywords", "sentiment_path", "simhash",
+)
+INCREMENTAL = 2  # PRAGMA auto_vacuum value
+ARCHIVE_SCHEMA = "archive"
+# archived_interactions as seen from a live connection inside attached_archive()
+attached_interactions = ArchivedInteraction.__table__.to_metadata(MetaData(), schema=ARCHIVE_SCHEMA)
+
+
+class ArchiveConflictError(Exception):
+    """An archived interaction has the id of a live one but different content."""
+
+
+def open_archive(path):
+    """Creates the archive tables if needed; returns (engine, session factory)."""
+    sync_engine = create_engine(f"sqlite:///{path}")
+    ArchiveBase.metadata.create_all(bind=sync_engine)
+    sync_engine.dispose()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+
+def merge_stats(stats, rows) -> dict:
+    """Adds archived interaction rows of one session to its archive_stats."""
+    stats = dict(stats or {})
+    sentiment = dict(stats.get("sentiment") or {})
+    count = stats.get("interactions", 0)
+    scored = stats.get("scored", 0)
+    score_sum = stats.get("score_sum", 0.0)
+    first, last = stats.get("first"), stats.get("last")
+    for row in rows:
+        count += 1
+        ts = row.timestamp.isoformat() if row.timestamp else None
+        if ts:
+            first = min(first, ts) if first else ts
+            last = max(last, ts) if last else ts
+        if row.sentiment_label:
+            sentiment[row.sentiment_label] = sentiment.get(row.sentiment_label, 0) + 1
+        if row.sentiment_score is not None:
+            scored += 1
+            score_sum += row.sentiment_score
+    return {
+        "interactions": count, "first": first, "last": last, "sentiment": sentiment,
+        "scored": scored, "score_sum": round(score_sum, 6),
+        "avg_sentiment": round(score_sum / scored, 3) if scored else None,
+    }
+
+
+@contextlib.asynccontextmanager
+async def attached_archive(db, path):
+    """
+    Attaches the archive database at `path` to `db`'s connection, so queries
+    can read attached_interactions next to the live tables. Yields False,
+    attaching nothing, when there is no archive yet.
+    """
+    if not path or not os.path.exists(path):
+        yield False
+        return
+    await db.execute(text(f"ATTACH DATABASE :path AS {ARCHIVE_SCHEMA}"), {"path": path})
+    try:
+        yield True
+    finally:
+        # The connection goes back to the pool: detach outside the transaction
+        await db.rollback()
+        await db.execute(text(f"DETACH DATABASE {ARCHIVE_SCHEMA}"))
+
+
+async def database_size(engine) -> dict:
+    async with engine.connect() as conn:
+        pragma = lambda name: conn.exec_driver_sql(f"PRAGMA {name}")
+        page_size = (await pragma("page_size")).scalar()
+        pages = (await pragma("page_count")).scalar()
+        free = (await pragma("freelist_count")).scalar()
+        mode = (await pragma("auto_vacuum")).scalar()
+    return {
+        "bytes": pages * page_size, "free_bytes": free * page_size,
+        "incremental_vacuum": mode == INCREMENTAL,
+    }
+
+
+# One statement per session: with `session_id IN (...)` the planner may walk
+# ix_survey_sessions_open instead, scanning every idle session while holding
+# the write lock
+_sessions = SurveySession.__table__
+_close_session = (
+    update(_sessions)
+    .where(_sessions.c.session_id == bindparam("b_session_id"), _sessions.c.end_time.is_(None),
+           _sessions.c.last_activity < bindparam("b_cutoff"))
+    .values(end_time=_sessions.c.last_activity, version=_sessions.c.version + 1)
+)
+
+_update_stats = (
+    update(_sessions)
+    .where(_sessions.c.session_id == bindparam("b_session_id"))
+    .values(archive_stats=bindparam("b_stats"))
+)
+
+
+class RetentionWorker:
+    def __init__(self, session_factory, engine, archive_path="feedback_archive.db", idle_timeout=86400.0,
+                 archive_after_days=90.0, require_summary=True, batch_size=500, pause=0.05,
+                 vacuum_pages=64, vacuum_budget=2.0, interval=300.0, session_cache=None):
+        self.session_factory = session_factory
+        self.engine = engine
+        self.archive_path = archive_path
+        self.idle_timeout = idle_timeout
+        self.archive_after_days = archive_after_days
+        self.require_summary = require_summary
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.vacuum_budget = vacuum_budget
+        self.interval = interval
+        self.session_cache = session_cache
+        self._archive = None  # (engine, session factory), opened on first use
+        self._task = None
+        self.passes = 0
+        self.failures = 0
+        self.sessions_closed = 0
+        self.interactions_archived = 0
+        self.pages_vacuumed = 0
+        self.last_pass = None
+        self.last_error = None
+
+    async def close_idle_sessions(self, now) -> int:
+        """Sets end_time on open sessions whose last turn is older than the idle timeout."""
+        cutoff = now - datetime.timedelta(seconds=self.idle_timeout)
+        await self._backfill_last_activity(now)
+        closed = 0
+        while True:
+            async with self.session_factory() as db:
+                ids = (await db.execute(
+                    select(SurveySession.session_id)
+                    .where(SurveySession.end_time.is_(None), SurveySession.last_activity < cutoff)
+                    .limit(self.batch_size)
+                )).scalars().all()
+                if not ids:
+                    return closed
+                # Re-checked under the write lock; the version bump makes a turn
+                # that read the session before this update retry on fresh state
+                result = await db.execute(_close_session, [{"b_session_id": session_id, "b_cutoff": cutoff} for session_id in ids])
+                await db.commit()
+            closed += result.rowcount
+            if self.session_cache is not None:
+                for session_id in ids:
+                    self.session_cache.invalidate(session_id)
+            await asyncio.sleep(self.pause)
+
+    async def _backfill_last_activity(self, now):
+        # Sessions from before last_activity existed: use their latest turn
+        latest = (
+            select(func.max(Interaction.timestamp))
+            .where(Interaction.session_id == SurveySession.session_id)
+            .scalar_subquery()
+        )
+        while True:
+            async with self.session_factory() as db:
+                ids = (await db.execute(
+                    select(SurveySession.session_id)
+                    .where(SurveySession.end_time.is_(None), SurveySession.last_activity.is_(None))
+                    .limit(self.batch_size)
+                )).scalars().all()
+                if not ids:
+                    return
+                await db.execute(
+                    update(SurveySession)
+                    .where(SurveySession.session_id.in_(ids), SurveySession.last_activity.is_(None))
+                    .values(last_activity=func.coalesce(latest, SurveySession.start_time, now))
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            await asyncio.sleep(self.pause)
+
+    def _archivable(self, cutoff, after):
+        stmt = (
+            select(*[getattr(Interaction, column) for column in ARCHIVE_COLUMNS])
+            .join(SurveySession, SurveySession.session_id == Interaction.session_id)
+            .where(Interaction.timestamp < cutoff, SurveySession.end_time < cutoff)
+        )
+        if self.require_summary:
+            stmt = stmt.where(or_(
+                Interaction.id <= func.coalesce(SurveySession.summary_watermark, 0),
+                SurveySession.survey_id == IMPORT_SURVEY_ID,
+            ))
+        if after is not None:
+            # Resume after the previous batch, skipping rows that were not eligible
+            ts, interaction_id = after
+            stmt = stmt.where(Interaction.timestamp >= ts, or_(Interaction.timestamp > ts, Interaction.id > interaction_id))
+        # Oldest first: walks ix_interactions_timestamp, with no sort
+        return stmt.order_by(Interaction.timestamp, Interaction.id).limit(self.batch_size)
+
+    async def archive(self, now) -> int:
+        """Moves interactions of sessions that ended before the cutoff to the archive database."""
+        cutoff = now - datetime.timedelta(days=self.archive_after_days)
+        if self._archive is None:
+            self._archive = open_archive(self.archive_path)
+        _, archive_factory = self._archive
+        archived = 0
+        after = None
+        while True:
+            async with self.session_factory() as db:
+                rows = (await db.execute(self._archivable(cutoff, after))).all()
+                await db.rollback()
+            if not rows:
+                return archived
+            after = (rows[-1].timestamp, rows[-1].id)
+            archived_at = datetime.datetime.utcnow()
+
+            # 1. Copy into the archive; rows of a retried batch are already there
+            async with archive_factory() as archive_db:
+                existing = {
+                    row.id: row for row in (await archive_db.execute(
+                        select(*[getattr(ArchivedInteraction, column) for column in ARCHIVE_COLUMNS])
+                        .where(ArchivedInteraction.id.in_([row.id for row in rows]))
+                    )).all()
+                }
+                for row in rows:
+                    if row.id in existing and tuple(existing[row.id]) != tuple(row):
+                        await archive_db.rollback()
+                        raise ArchiveConflictError(
+                            f"interaction {row.id} is already archived with different content; it stays live"
+                        )
+                fresh = [{**row._asdict(), "archived_at": archived_at} for row in rows if row.id not in existing]
+                if fresh:
+                    await archive_db.execute(insert(ArchivedInteraction.__table__), fresh)
+                await archive_db.commit()
+
+            # 2. Delete from the live database and fold the counts into the sessions
+            ids = [row.id for row in rows]
+            async with self.session_factory() as db:
+                # Takes the write lock first, so another pass can't count the same rows
+                await db.execute(delete(SentimentJob).where(SentimentJob.interaction_id.in_(ids)))
+                # Postings are keyed (keyword, interaction_id): probe the batch's
+                # terms x ids instead of scanning for the ids
+                terms = set()
+                for keywords in {tuple(row.keywords) for row in rows if row.keywords}:
+                    terms.update(index_terms(keywords)[1])
+                if terms:
+                    await db.execute(delete(InteractionKeyword).where(
+                        InteractionKeyword.keyword.in_(terms), InteractionKeyword.interaction_id.in_(ids)
+                    ))
+                present = set((await db.execute(select(Interaction.id).where(Interaction.id.in_(ids)))).scalars())
+                rows = [row for row in rows if row.id in present]
+                if rows:
+                    await db.execute(delete(Interaction).where(Interaction.id.in_(ids)))
+                    by_session = {}
+                    for row in rows:
+                        by_session.setdefault(row.session_id, []).append(row)
+                    current = dict((await db.execute(
+                        select(SurveySession.session_id, SurveySession.archive_stats)
+                        .where(SurveySession.session_id.in_(list(by_session)))
+                    )).all())
+                    await db.execute(_update_stats, [
+                        {"b_session_id": session_id, "b_stats": merge_stats(current.get(session_id), session_rows)}
+                        for session_id, session_rows in by_session.items()
+                    ])
+                await db.commit()
+            archived += len(rows)
+            await asyncio.sleep(self.pause)
+
+    async def vacuum(self, budget=None) -> int:
+        """
+        Frees up to `budget` seconds' worth of pages, VACUUM_SLICE_PAGES per
+        write transaction. Returns the number of pages freed; 0 when the
+        database was not created with auto_vacuum=INCREMENTAL.
+        """
+        deadline = time.monotonic() + (self.vacuum_budget if budget is None else budget)
+        freed = 0
+        async with self.engine.connect() as conn:
+            if (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar() != INCREMENTAL:
+                return 0
+            # The pragma frees one page per step, and the sqlite3 module steps a
+            # statement without result columns only once; executescript runs it
+            # to completion
+            driver = (await conn.get_raw_connection()).driver_connection
+            while time.monotonic() < deadline:
+                free = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+                await conn.commit()
+                if not free:
+                    break
+                await driver.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages})")
+                freed += min(free, self.vacuum_pages)
+                await asyncio.sleep(self.pause)
+            # Copy the truncation into the database file without waiting on readers
+            await driver.executescript("PRAGMA wal_checkpoint(PASSIVE)")
+        return freed
+
+    async def run_once(self, now=None) -> dict:
+        now = now or datetime.datetime.utcnow()
+        started = time.perf_counter()
+        report = {"sessions_closed": 0, "interactions_archived": 0, "pages_vacuumed": 0}
+        if self.idle_timeout:
+            report["sessions_closed"] = await self.close_idle_sessions(now)
+        if self.archive_after_days:
+            report["interactions_archived"] = await self.archive(now)
+        if self.vacuum_pages and self.vacuum_budget:
+            report["pages_vacuumed"] = await self.vacuum()
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        report.update(await database_size(self.engine))
+        self.passes += 1
+        self.sessions_closed += report["sessions_closed"]
+        self.interactions_archived += report["interactions_archived"]
+        self.pages_vacuumed += report["pages_vacuumed"]
+        self.last_pass = {"at": now.isoformat(), **report}
+        return report
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._archive is not None:
+            await self._archive[0].dispose()
+            self._archive = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Retention pass failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "idle_timeout": self.idle_timeout,
+            "archive_after_days": self.archive_after_days,
+            "archive_path": self.archive_path,
+            "passes": self.passes,
+            "failures": self.failures,
+            "sessions_closed": self.sessions_closed,
+            "interactions_archived": self.interactions_archived,
+            "pages_vacuumed": self.pages_vacuumed,
+            "last_pass": self.last_pass,
+            "last_error": self.last_error,
+        }
+
+
+def full_vacuum(engine):
+    """Rewrites the whole database with auto_vacuum=INCREMENTAL. Blocks all writers."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+
+async def _main(args):
+    import config
+    from database import AsyncSessionLocal, async_engine, engine, init_db
+
+    init_db()
+    if args.command == "vacuum" and args.full:
+        before = await database_size(async_engine)
+        await async_engine.dispose()
+        started = time.perf_counter()
+        full_vacuum(engine)
+        after = await database_size(async_engine)
+        print(f"VACUUM took {time.perf_counter() - started:.1f}s: {before['bytes'] / 2**20:.1f} MB -> "
+              f"{after['bytes'] / 2**20:.1f} MB, incremental vacuum {'on' if after['incremental_vacuum'] else 'off'}")
+        return
+    worker = RetentionWorker(
+        AsyncSessionLocal, async_engine, archive_path=config.ARCHIVE_DATABASE_PATH,
+        idle_timeout=config.SESSION_IDLE_TIMEOUT, archive_after_days=config.ARCHIVE_AFTER_DAYS,
+        require_summary=config.ARCHIVE_REQUIRE_SUMMARY, batch_size=config.RETENTION_BATCH_SIZE,
+        pause=config.RETENTION_PAUSE, vacuum_pages=config.VACUUM_SLICE_PAGES, vacuum_budget=config.VACUUM_BUDGET_SECONDS,
+    )
+    if args.command == "run":
+        report = await worker.run_once()
+        print(f"Closed {report['sessions_closed']} idle sessions, archived {report['interactions_archived']} "
+              f"interactions, vacuumed {report['pages_vacuumed']} pages in {report['seconds']}s")
+    elif args.command == "vacuum":
+        pages = await worker.vacuum(budget=args.budget)
+        print(f"Vacuumed {pages} pages")
+    await worker.stop()
+    size = await database_size(async_engine)
+    print(f"Database: {size['bytes'] / 2**20:.1f} MB, {size['free_bytes'] / 2**20:.1f} MB free, "
+          f"incremental vacuum {'on' if size['incremental_vacuum'] else 'off (run: python retention.py vacuum --full)'}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Close idle sessions, archive old interactions and vacuum the database.")
+    parser.add_argument("command", choices=["run", "vacuum", "stats"])
+    parser.add_argument("--full", action="store_true", help="vacuum: rewrite the database with incremental vacuum enabled")
+    parser.add_argument("--budget", type=float, default=30.0, help="vacuum: seconds to spend freeing pages")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,75 @@
+import json
+from llm_service import estimate_tokens, COMPRESSION_SYSTEM_PROMPT, SUMMARY_UPDATE_SYSTEM_PROMPT
+
+# Upper bound for a summary's size, set by num_predict of the JSON model
+SUMMARY_MAX_TOKENS = 128
+# Role markers, "Current summary:" / "New turns:" framing
+PROMPT_FRAMING_TOKENS = 16
+
+
+def format_turn(user_input, bot_response) -> str:
+    return f"User: {user_input}\nBot: {bot_response}"
+
+
+def build_transcript(interactions) -> str:
+    return "\n".join([format_turn(i.user_input, i.bot_response) for i in interactions])
+
+
+def _overhead(summary) -> int:
+    if summary is None:
+        return estimate_tokens(COMPRESSION_SYSTEM_PROMPT) + PROMPT_FRAMING_TOKENS
+    summary_tokens = max(estimate_tokens(json.dumps(summary, default=str)), SUMMARY_MAX_TOKENS)
+    return estimate_tokens(SUMMARY_UPDATE_SYSTEM_PROMPT) + summary_tokens + PROMPT_FRAMING_TOKENS
+
+
+def plan_folds(summary, turns, budget: int) -> list[tuple[list, str]]:
+    """
+    Splits `turns` ((id, user_input, bot_response) rows, ordered by id) into
+    consecutive chunks whose fold prompt stays within `budget` tokens.
+    Returns [(chunk_rows, transcript)]. A single turn too large for the
+    budget is truncated rather than skipped.
+    """
+    folds = []
+    chunk, lines, used = [], [], 0
+    # After the first fold there is always a summary of at most SUMMARY_MAX_TOKENS
+    available = budget - _overhead(summary)
+
+    for row in turns:
+        line = format_turn(row[1], row[2])
+        tokens = estimate_tokens(line) + 1
+        if tokens > available:
+            line = line[:max(0, available - 1) * 4]
+            tokens = estimate_tokens(line) + 1
+        if chunk and used + tokens > available:
+            folds.append((chunk, "\n".join(lines)))
+            chunk, lines, used = [], [], 0
+            available = budget - _overhead({})
+        chunk.append(row)
+        lines.append(line)
+        used += tokens
+
+    if chunk:
+        folds.append((chunk, "\n".join(lines)))
+    return folds
+
+
+def estimate_fold_tokens(summary, turns, budget: int) -> int:
+    """Input tokens the folds for `turns` will send, for dry runs."""
+    total = 0
+    for i, (_, transcript) in enumerate(plan_folds(summary, turns, budget)):
+        total += _overhead(summary if i == 0 else {}) + estimate_tokens(transcript)
+    return total
+
+
+async def fold_turns(llm, summary, turns, budget: int):
+    """
+    Folds new turns into `summary` (None for a session never summarized),
+    one budget-sized chunk at a time. Yields (summary, watermark) after each
+    fold so callers can persist progress; LLM failures propagate.
+    """
+    for chunk, transcript in plan_folds(summary, turns, budget):
+        if summary is None:
+            summary = await llm.compress_feedback(transcript, fallback=False)
+        else:
+            summary = await llm.update_summary(summary, transcript, fallback=False)
+        yield summary, chunk[-1][0]
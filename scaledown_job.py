@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from itertools import groupby
+from sqlalchemy import select, update, func, or_
+import config
+from database import AsyncSessionLocal, init_db
+from llm_backends import pool_from_config
+from llm_cache import LLMCache
+from llm_service import LLMService
+from models import SurveySession, Interaction
+from rolling_summary import fold_turns, plan_folds, estimate_fold_tokens, SUMMARY_MAX_TOKENS
+from survey_engine import default_registry
+from ingest import IMPORT_SURVEY_ID
+
+# Offline ScaleDown job: folds the turns of finished sessions (in a terminal
+# state of their survey, e.g. CLOSING, or closed for being idle) that are not
+# yet in their summary_json (past the summary watermark) into the summary.
+# retention.py only archives turns that are folded in.
+#
+#   python scaledown_job.py                 # run (resumes from the checkpoint)
+#   python scaledown_job.py --dry-run       # report sessions and token volume only
+#   python scaledown_job.py --reset-checkpoint
+
+CHECKPOINT_FILE = "scaledown_checkpoint.json"
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"last_session_id": "", "summarized": 0, "failed": 0}
+
+def save_checkpoint(path, checkpoint):
+    # Write-then-rename so a kill mid-write never corrupts the checkpoint
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+async def next_chunk(db, after_session_id, chunk_size):
+    """
+    Returns [(session_id, summary, new_turns)] for the next chunk of finished
+    sessions with turns past their watermark, ordered by session_id. New
+    turns for the whole chunk come from one interactions query instead of a
+    lazy load per session.
+    """
+    watermark = func.coalesce(SurveySession.summary_watermark, 0)
+    has_new_turns = (
+        select(Interaction.id)
+        .where(Interaction.session_id == SurveySession.session_id, Interaction.id > watermark)
+        .exists()
+    )
+    result = await db.execute(
+        select(SurveySession.session_id, SurveySession.summary_json)
+        .where(
+            or_(SurveySession.current_step.in_(default_registry().terminal_states()), SurveySession.end_time.is_not(None)),
+            # Bulk imports are not conversations; retention.py archives them unsummarized
+            SurveySession.survey_id.is_distinct_from(IMPORT_SURVEY_ID),
+            has_new_turns, SurveySession.session_id > after_session_id,
+        )
+        .order_by(SurveySession.session_id)
+        .limit(chunk_size)
+    )
+    sessions = result.all()
+    if not sessions:
+        return []
+
+    result = await db.execute(
+        select(Interaction.session_id, Interaction.id, Interaction.user_input, Interaction.bot_response)
+        .join(SurveySession, SurveySession.session_id == Interaction.session_id)
+        .where(Interaction.session_id.in_([s.session_id for s in sessions]), Interaction.id > watermark)
+        .order_by(Interaction.session_id, Interaction.id)
+    )
+    turns = {
+        sid: [(r.id, r.user_input, r.bot_response) for r in rows]
+        for sid, rows in groupby(result.all(), key=lambda r: r.session_id)
+    }
+    await db.rollback()
+    return [(s.session_id, s.summary_json, turns.get(s.session_id, [])) for s in sessions]
+
+async def dry_run(chunk_size, budget):
+    sessions = 0
+    folds = 0
+    input_tokens = 0
+    last = ""
+    async with AsyncSessionLocal() as db:
+        while True:
+            chunk = await next_chunk(db, last, chunk_size)
+            if not chunk:
+                break
+            for _, summary, turns in chunk:
+                folds += len(plan_folds(summary, turns, budget))
+                input_tokens += estimate_fold_tokens(summary, turns, budget)
+            sessions += len(chunk)
+            last = chunk[-1][0]
+
+    print(f"Sessions to summarize: {sessions} ({folds} LLM calls at a {budget}-token budget)")
+    print(f"Estimated input tokens: {input_tokens:,} (avg {input_tokens // max(sessions, 1):,} per session)")
+    print(f"Estimated output tokens: <= {folds * SUMMARY_MAX_TOKENS:,}")
+
+async def run(chunk_size, concurrency, checkpoint_path, budget):
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint["last_session_id"]:
+        print(f"Resuming after session {checkpoint['last_session_id']} ({checkpoint['summarized']} summarized so far)")
+
+    llm = LLMService(
+        model_name=config.OLLAMA_MODEL,
+        timeout=config.LLM_TIMEOUT,
+        pool=pool_from_config(),
+        cache=LLMCache(AsyncSessionLocal, max_entries=config.LLM_CACHE_MAX_ENTRIES, ttl=config.LLM_CACHE_TTL),
+    )
+    llm.pool.start(llm.check_connection)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize(session_id, summary, turns):
+        # Returns the last successful (summary, watermark), and whether a fold failed
+        latest = None
+        async with semaphore:
+            try:
+                async for latest in fold_turns(llm, summary, turns, budget):
+                    pass
+                return session_id, latest, False
+            except Exception:
+                return session_id, latest, True
+
+    start = time.time()
+    done = 0
+    try:
+        while True:
+            async with AsyncSessionLocal() as db:
+                chunk = await next_chunk(db, checkpoint["last_session_id"], chunk_size)
+                if not chunk:
+                    break
+
+                results = await asyncio.gather(*[summarize(sid, summary, turns) for sid, summary, turns in chunk])
+                # One commit per chunk; partial progress of failed sessions is kept
+                for sid, latest, _ in results:
+                    if latest is not None:
+                        summary, watermark = latest
+                        await db.execute(
+                            update(SurveySession)
+                            .where(SurveySession.session_id == sid)
+                            .values(summary_json=summary, summary_watermark=watermark)
+                        )
+                await db.commit()
+
+            failed = sum(1 for _, _, f in results if f)
+            checkpoint["last_session_id"] = chunk[-1][0]
+            checkpoint["summarized"] += len(chunk) - failed
+            checkpoint["failed"] += failed
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            done += len(chunk)
+            elapsed = time.time() - start
+            print(f"  {done} sessions in {elapsed:.1f}s ({done / elapsed * 60:.1f} sessions/min), "
+                  f"{failed} failed in this chunk")
+    finally:
+        await llm.close()
+
+    elapsed = time.time() - start
+    rate = done / elapsed * 60 if elapsed else 0.0
+    print(f"Done: {done} sessions in {elapsed:.1f}s ({rate:.1f} sessions/min). "
+          f"Totals: {checkpoint['summarized']} summarized, {checkpoint['failed']} failed.")
+    # Finished cleanly: the next run starts over and retries failures
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold new turns of closed survey sessions into their summaries (ScaleDown).")
+    parser.add_argument("--dry-run", action="store_true", help="only report sessions and expected token volume")
+    parser.add_argument("--chunk-size", type=int, default=50, help="sessions per query and per commit")
+    parser.add_argument("--concurrency", type=int, default=2, help="concurrent compress_feedback calls")
+    parser.add_argument("--token-budget", type=int, default=config.SUMMARY_TOKEN_BUDGET, help="max prompt tokens per fold")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--reset-checkpoint", action="store_true")
+    args = parser.parse_args()
+
+    init_db()
+    if args.reset_checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    if args.dry_run:
+        asyncio.run(dry_run(args.chunk_size, args.token_budget))
+    else:
+        asyncio.run(run(args.chunk_size, args.concurrency, args.checkpoint, args.token_budget))
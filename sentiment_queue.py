@@ -0,0 +1,200 @@
+import asyncio
+import datetime
+from sqlalchemy import select, update, delete, func
+from models import SentimentJob, Interaction, SurveySession
+from llm_scheduler import BACKGROUND
+import analytics
+import keyword_index
+import near_duplicates as near_dup
+
+
+class SentimentQueue:
+    """
+    Durable work queue for sentiment analysis that a turn's reply doesn't
+    depend on.
+
+    Jobs live in the `sentiment_jobs` table and are inserted in the same
+    commit as their Interaction. Workers claim jobs with a lease (a single
+    UPDATE ... RETURNING, so claims are atomic across workers and processes),
+    fill in Interaction.sentiment_label/score and delete the job. A job whose
+    worker dies is claimed again once its lease expires, so delivery is
+    at-least-once; failures are retried with backoff up to `max_attempts`.
+    """
+
+    def __init__(self, session_factory, llm_service, workers=2, batch_size=8, lease=120, max_attempts=5, poll_interval=1.0, near_duplicates=None):
+        self.session_factory = session_factory
+        self.llm = llm_service
+        # Optional NearDuplicateIndex that results are added to once stored
+        self.near_duplicates = near_duplicates
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        # Jobs finished by another run after their lease expired mid-call
+        self.duplicates = 0
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+
+    def enqueue(self, db, interaction: Interaction):
+        """
+        Stages a job for `interaction` on the caller's session; it becomes
+        visible to workers when the caller commits.
+        """
+        db.add(SentimentJob(interaction=interaction))
+
+    def notify(self):
+        # Wake idle workers right after a commit instead of waiting for the next poll
+        self._wakeup.set()
+
+    def start(self):
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        print(f"Sentiment queue started with {self.workers} workers")
+
+    async def stop(self):
+        # In-flight jobs keep their lease and are picked up again after restart
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def stats(self) -> dict:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(SentimentJob.status, func.count(), func.min(SentimentJob.created_at)).group_by(SentimentJob.status)
+            )
+            rows = {status: (count, oldest) for status, count, oldest in result}
+
+        depth, oldest = rows.get("pending", (0, None))
+        lag = (datetime.datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+        return {
+            "depth": depth,
+            "lag_seconds": round(lag, 3),
+            "dead_letters": rows.get("failed", (0, None))[0],
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "duplicates": self.duplicates,
+            "workers": len(self._tasks),
+        }
+
+    async def _worker(self, worker_id: int):
+        while True:
+            try:
+                jobs = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Sentiment worker {worker_id} claim failed: {e}")
+                jobs = []
+
+            if not jobs:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Concurrent calls coalesce in the LLMService batcher when enabled
+            await asyncio.gather(*[self._process(*job) for job in jobs])
+
+    async def _claim(self):
+        now = datetime.datetime.utcnow()
+        async with self.session_factory() as db:
+            candidates = (
+                select(SentimentJob.id)
+                .where(SentimentJob.status == "pending", SentimentJob.available_at <= now)
+                .order_by(SentimentJob.id)
+                .limit(self.batch_size)
+            )
+            result = await db.execute(
+                update(SentimentJob)
+                .where(SentimentJob.id.in_(candidates.scalar_subquery()))
+                .values(available_at=now + datetime.timedelta(seconds=self.lease), attempts=SentimentJob.attempts + 1)
+                .returning(SentimentJob.id, SentimentJob.interaction_id, SentimentJob.attempts)
+                .execution_options(synchronize_session=False)
+            )
+            claimed = result.all()
+            await db.commit()
+            if not claimed:
+                return []
+
+            texts = await db.execute(
+                select(Interaction.id, Interaction.user_input).where(Interaction.id.in_([c.interaction_id for c in claimed]))
+            )
+            text_by_id = dict(texts.all())
+            await db.rollback()
+        return [(c.id, c.interaction_id, c.attempts, text_by_id.get(c.interaction_id)) for c in claimed]
+
+    async def _process(self, job_id, interaction_id, attempts, text):
+        if text is None:
+            # Interaction is gone; nothing to fill in
+            await self._finish(job_id)
+            return
+
+        try:
+            result = await self.llm.analyze_sentiment(text, fallback=False, priority=BACKGROUND)
+        except Exception as e:
+            await self._retry_or_fail(job_id, attempts, e)
+            return
+
+        try:
+            async with self.session_factory() as db:
+                # Claim the job's completion first: if its lease expired during the
+                # LLM call, another run may have finished it, and the rollups must
+                # only be counted once
+                finished = await db.execute(delete(SentimentJob).where(SentimentJob.id == job_id))
+                if finished.rowcount != 1:
+                    await db.rollback()
+                    self.duplicates += 1
+                    return
+                label = result.get("label", "Neutral")
+                row = (await db.execute(
+                    select(Interaction.timestamp, SurveySession.customer_segment)
+                    .join(SurveySession, SurveySession.session_id == Interaction.session_id)
+                    .where(Interaction.id == interaction_id)
+                )).first()
+                await db.execute(
+                    update(Interaction)
+                    .where(Interaction.id == interaction_id)
+                    .values(sentiment_label=label, sentiment_score=result.get("score", 0.0), sentiment_path="llm")
+                )
+                if row is not None:
+                    # The turn's commit skipped the sentiment counter; count it in the bucket of the turn
+                    await analytics.record(db, [("sentiment", label)], row.timestamp, row.customer_segment)
+                    await keyword_index.record_existing(db, interaction_id, result.get("keywords"), row.timestamp, result.get("score", 0.0))
+                await db.commit()
+            self.processed += 1
+            if self.near_duplicates is not None:
+                self.near_duplicates.add(near_dup.signature(text), label, result.get("score", 0.0),
+                                         result.get("keywords") or (), interaction_id)
+        except Exception as e:
+            await self._retry_or_fail(job_id, attempts, e)
+
+    async def _finish(self, job_id):
+        async with self.session_factory() as db:
+            await db.execute(delete(SentimentJob).where(SentimentJob.id == job_id))
+            await db.commit()
+
+    async def _retry_or_fail(self, job_id, attempts, error):
+        values = {"last_error": str(error)[:500]}
+        if attempts >= self.max_attempts:
+            values["status"] = "failed"
+            self.failed += 1
+            print(f"Sentiment job {job_id} failed permanently: {error}")
+        else:
+            backoff = min(300, 2 * (2 ** (attempts - 1)))
+            values["available_at"] = datetime.datetime.utcnow() + datetime.timedelta(seconds=backoff)
+            self.retried += 1
+        try:
+            async with self.session_factory() as db:
+                await db.execute(update(SentimentJob).where(SentimentJob.id == job_id).values(**values))
+                await db.commit()
+        except Exception as e:
+            # Lease expiry will make the job visible again
+            print(f"Sentiment job {job_id} status update failed: {e}")
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+
+
+@dataclass
+class SessionState:
+    """
+    The part of a SurveySession a turn needs. `is_new` marks sessions that
+    have not been inserted yet; they are created in the turn's commit.
+    `version` is the row version the state was read at (optimistic locking).
+    `ended` is set once the session has an end_time.
+    """
+    session_id: str
+    current_step: str = "NPS_ASK"
+    nps_score: int | None = None
+    customer_segment: str | None = None
+    survey_id: str | None = None
+    version: int = 0
+    is_new: bool = False
+    ended: bool = False
+
+
+class SessionStateCache:
+    """
+    Per-process LRU of SessionState keyed by session_id, with idle expiry.
+
+    get() hands out copies, so a turn that fails before committing never
+    leaves half-applied state behind; put() is called after the commit.
+    """
+
+    def __init__(self, max_entries=10000, idle_ttl=1800):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self._entries = OrderedDict()  # session_id -> (last_used, SessionState)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id: str) -> SessionState | None:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            last_used, state = entry
+            if time.monotonic() - last_used <= self.idle_ttl:
+                self.hits += 1
+                return replace(state)
+            del self._entries[session_id]
+        self.misses += 1
+        return None
+
+    def put(self, state: SessionState):
+        self._entries[state.session_id] = (time.monotonic(), replace(state, is_new=False))
+        self._entries.move_to_end(state.session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, session_id: str):
+        self._entries.pop(session_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SessionLocks:
+    """
+    Per-session asyncio locks, so a process runs each session's turns one at
+    a time in arrival order (asyncio.Lock wakes waiters FIFO). A lock exists
+    only while a turn holds or waits for it. Other processes are kept out by
+    the optimistic version check on SurveySession instead.
+    """
+
+    def __init__(self):
+        self._locks = {}  # session_id -> [Lock, holders + waiters]
+        self.acquired = 0
+        self.contended = 0
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        elif entry[1]:
+            self.contended += 1
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                self.acquired += 1
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[session_id]
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._locks),
+            "acquired": self.acquired,
+            "contended": self.contended,
+        }
@@ -0,0 +1,377 @@
+import asyncio
+import json
+import os
+import re
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+# Survey flows as data. A definition lists states, each with ordered
+# transitions and the response pools they answer with; it is validated and
+# compiled once into immutable lookup tables, so a turn is a few index/dict
+# lookups plus random.choice. Definitions in SURVEY_DIR are hot-reloaded.
+#
+# Transition conditions (checked in this order within a state, first match
+# wins; a transition without a condition is the state's default):
+#   "score": [lo, hi]       number 0-10 extracted from the input, inclusive
+#   "match": "<regex>"      case-insensitive search in the input
+#   "sentiment": [labels]   the turn's sentiment label
+# "set_nps": true stores the extracted score as the session's nps_score.
+# An optional top-level "unknown_state" transition answers sessions whose
+# step the definition doesn't have (e.g. "INIT"); without it they are treated
+# as being in the initial state.
+
+DEFAULT_SURVEY_ID = "default"
+MAX_SCORE = 10
+
+DEFAULT_SURVEY = {
+    "id": "default",
+    "initial_state": "NPS_ASK",
+    "unknown_state": {"to": "NPS_ASK", "say": "NPS_PROMPT"},
+    "states": {
+        "NPS_ASK": {
+            "metric": "nps",
+            "transitions": [
+                {"score": [0, 6], "to": "DEEP_DIVE", "say": "DEEP_DIVE", "set_nps": True},
+                {"score": [7, 8], "to": "REASONING", "say": "REASONING", "set_nps": True},
+                {"score": [9, 10], "to": "FAVORITE_FEATURE", "say": "FAVORITE_FEATURE", "set_nps": True},
+                {"to": "NPS_ASK", "say": "NPS_RETRY"},
+            ],
+        },
+        "DEEP_DIVE": {"transitions": [
+            {"sentiment": ["Frustrated"], "to": "CSAT_ASK", "say": "CSAT_ASK_FRUSTRATED"},
+            {"to": "CSAT_ASK", "say": "CSAT_ASK_NORMAL"},
+        ]},
+        "REASONING": {"transitions": [
+            {"sentiment": ["Frustrated"], "to": "CSAT_ASK", "say": "CSAT_ASK_FRUSTRATED"},
+            {"to": "CSAT_ASK", "say": "CSAT_ASK_NORMAL"},
+        ]},
+        "FAVORITE_FEATURE": {"transitions": [
+            {"sentiment": ["Frustrated"], "to": "CSAT_ASK", "say": "CSAT_ASK_FRUSTRATED"},
+            {"to": "CSAT_ASK", "say": "CSAT_ASK_NORMAL"},
+        ]},
+        "CSAT_ASK": {
+            "metric": "csat",
+            "transitions": [{"to": "CLOSING", "say": "CLOSING"}],
+        },
+        "CLOSING": {
+            "terminal": True,
+            "transitions": [{"to": "CLOSING", "say": "COMPLETE"}],
+        },
+    },
+    "responses": {
+        "DEEP_DIVE": [
+            "I'm sorry to hear that. Could you tell us what specifically went wrong?",
+            "That's disappointing. What was the main issue you faced?",
+            "We aim to do better. Can you share more details about what happened?"
+        ],
+        "REASONING": [
+            "Thank you. What is one thing we could do to improve?",
+            "Got it. Any specific suggestions for us?",
+            "Thanks for the score. How can we make your experience 10/10?"
+        ],
+        "FAVORITE_FEATURE": [
+            "That's wonderful! What did you enjoy the most?",
+            "Glad to hear it! What was the highlight for you?",
+            "Fantastic! What feature did you like best?"
+        ],
+        "CSAT_ASK_FRUSTRATED": [
+            "I understand your frustration and have flagged this for our team. To wrap up, how would you rate this chat experience (1-5)?",
+            "I'm sorry for the trouble. I've noted your issues. How would you rate this support chat (1-5)?",
+            "Your feedback is important. Before you go, please rate this chat (1-5)."
+        ],
+        "CSAT_ASK_NORMAL": [
+            "Thanks for sharing! How would you rate this chat experience (1-5)?",
+            "Appreciate the feedback! How satisfied were you with this chat (1-5)?",
+            "One last question: How would you rate this conversation (1-5)?"
+        ],
+        "CLOSING": [
+            "Thank you for your feedback! Have a great day.",
+            "All done! Thanks for your time.",
+            "Survey complete. We appreciate your input!"
+        ],
+        "NPS_RETRY": [
+            "I didn't catch that number. On a scale of 0-10, how likely are you to recommend us?",
+            "Could you please provide a number between 0 and 10?",
+            "Sorry, I need a score from 0 to 10. How likely are you to recommend us?"
+        ],
+        "COMPLETE": [
+            "The survey is complete. Thank you!"
+        ],
+        "NPS_PROMPT": [
+            "How likely are you to recommend us (0-10)?"
+        ]
+    }
+}
+
+
+class SurveyDefinitionError(ValueError):
+    pass
+
+
+Transition = namedtuple("Transition", ["to", "responses", "set_nps"])
+
+CompiledState = namedtuple("CompiledState", [
+    "name",
+    "terminal",
+    "metric",           # "nps", "csat" or None: what a score given here is counted as
+    "score_table",      # tuple indexed by score 0..MAX_SCORE -> Transition or None
+    "match_rules",      # tuple of (compiled regex, Transition)
+    "sentiment_table",  # read-only {label: Transition}
+    "default",          # Transition
+])
+
+
+class CompiledSurvey:
+    def __init__(self, survey_id, initial_state, states, unknown_state=None, source=None):
+        self.id = survey_id
+        self.initial_state = initial_state
+        self.unknown_state = unknown_state
+        self.states = MappingProxyType(states)
+        self.source = source
+        self.terminal_states = frozenset(name for name, state in states.items() if state.terminal)
+        # States whose reply can depend on the sentiment label
+        self.sentiment_states = frozenset(name for name, state in states.items() if state.sentiment_table)
+        # States where a number in the input decides the transition (NPS fast path)
+        self.scored_states = frozenset(name for name, state in states.items() if any(state.score_table))
+
+    def metric(self, state_name):
+        state = self.states.get(state_name)
+        return state.metric if state is not None else None
+
+    def step(self, state_name, text, score, sentiment_label) -> Transition:
+        state = self.states.get(state_name)
+        if state is None:
+            # e.g. a state a reloaded definition no longer has
+            if self.unknown_state is not None:
+                return self.unknown_state
+            state = self.states[self.initial_state]
+        if score is not None and 0 <= score <= MAX_SCORE:
+            transition = state.score_table[score]
+            if transition is not None:
+                return transition
+        for pattern, transition in state.match_rules:
+            if pattern.search(text):
+                return transition
+        transition = state.sentiment_table.get(sentiment_label)
+        if transition is not None:
+            return transition
+        return state.default
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "initial_state": self.initial_state,
+            "states": sorted(self.states),
+            "terminal_states": sorted(self.terminal_states),
+            "source": self.source,
+        }
+
+
+def compile_survey(definition: dict, source=None) -> CompiledSurvey:
+    """Validates a survey definition and builds its lookup tables."""
+    def fail(message):
+        raise SurveyDefinitionError(f"{source or definition.get('id', '<survey>')}: {message}")
+
+    if not isinstance(definition, dict):
+        fail("definition must be a JSON object")
+    survey_id = definition.get("id")
+    states = definition.get("states")
+    responses = definition.get("responses")
+    initial = definition.get("initial_state")
+    if not isinstance(survey_id, str) or not survey_id:
+        fail("'id' must be a non-empty string")
+    if not isinstance(states, dict) or not states:
+        fail("'states' must be a non-empty object")
+    if not isinstance(responses, dict):
+        fail("'responses' must be an object")
+    if initial not in states:
+        fail(f"initial_state {initial!r} is not a state")
+
+    pools = {}
+    for key, pool in responses.items():
+        if not isinstance(pool, list) or not pool or not all(isinstance(r, str) and r for r in pool):
+            fail(f"response pool {key!r} must be a non-empty list of strings")
+        pools[key] = tuple(pool)
+
+    def transition_for(rule, where):
+        if not isinstance(rule, dict):
+            fail(f"{where} must be an object")
+        if rule.get("to") not in states:
+            fail(f"{where}: unknown target state {rule.get('to')!r}")
+        if rule.get("say") not in pools:
+            fail(f"{where}: unknown response pool {rule.get('say')!r}")
+        return Transition(rule["to"], pools[rule["say"]], bool(rule.get("set_nps", False)))
+
+    unknown_state = None
+    if definition.get("unknown_state") is not None:
+        unknown_state = transition_for(definition["unknown_state"], "unknown_state")
+
+    compiled = {}
+    for name, spec in states.items():
+        transitions = spec.get("transitions") if isinstance(spec, dict) else None
+        if not isinstance(transitions, list) or not transitions:
+            fail(f"state {name!r} needs a non-empty 'transitions' list")
+        metric = spec.get("metric")
+        if metric not in (None, "nps", "csat"):
+            fail(f"state {name!r}: metric must be 'nps' or 'csat'")
+
+        score_table = [None] * (MAX_SCORE + 1)
+        match_rules = []
+        sentiment_table = {}
+        default = None
+        for i, rule in enumerate(transitions):
+            where = f"state {name!r} transition {i}"
+            transition = transition_for(rule, where)
+
+            conditions = [key for key in ("score", "match", "sentiment") if key in rule]
+            if len(conditions) > 1:
+                fail(f"{where} has more than one condition ({', '.join(conditions)})")
+            if transition.set_nps and "score" not in rule:
+                fail(f"{where}: set_nps needs a score condition")
+            if not conditions:
+                if default is not None:
+                    fail(f"{where} is a second default transition")
+                default = transition
+            elif "score" in rule:
+                bounds = rule["score"]
+                if (not isinstance(bounds, list) or len(bounds) != 2 or not all(isinstance(b, int) for b in bounds)
+                        or not 0 <= bounds[0] <= bounds[1] <= MAX_SCORE):
+                    fail(f"{where}: score must be [lo, hi] within 0-{MAX_SCORE}")
+                for score in range(bounds[0], bounds[1] + 1):
+                    # First matching rule wins, as in the definition's order
+                    if score_table[score] is None:
+                        score_table[score] = transition
+            elif "match" in rule:
+                try:
+                    match_rules.append((re.compile(rule["match"], re.IGNORECASE), transition))
+                except (re.error, TypeError) as e:
+                    fail(f"{where}: invalid regex: {e}")
+            else:
+                labels = rule["sentiment"]
+                labels = [labels] if isinstance(labels, str) else labels
+                if not isinstance(labels, list) or not all(isinstance(l, str) for l in labels):
+                    fail(f"{where}: sentiment must be a label or list of labels")
+                for label in labels:
+                    sentiment_table.setdefault(label, transition)
+        if default is None:
+            fail(f"state {name!r} needs a default transition (one without a condition)")
+
+        compiled[name] = CompiledState(
+            name=name,
+            terminal=bool(spec.get("terminal", False)),
+            metric=metric,
+            score_table=tuple(score_table),
+            match_rules=tuple(match_rules),
+            sentiment_table=MappingProxyType(sentiment_table),
+            default=default,
+        )
+    return CompiledSurvey(survey_id, initial, compiled, unknown_state, source)
+
+
+class SurveyRegistry:
+    """
+    Compiled surveys by id: the built-in default plus every *.json file in
+    `directory` (a file whose id is "default" replaces the built-in one).
+
+    `reload()` recompiles files whose mtime changed. A file that fails to
+    validate is reported and its last good version stays active, so a typo
+    never takes a survey down. `start()` polls for changes every
+    `reload_interval` seconds.
+    """
+
+    def __init__(self, directory=None, reload_interval=5.0):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self.errors = {}  # path -> message of the last failed compile
+        self._builtin = compile_survey(DEFAULT_SURVEY, source="<built-in>")
+        self._by_file = {}  # path -> (mtime, CompiledSurvey)
+        self._surveys = {self._builtin.id: self._builtin}
+        self._task = None
+        self.reload()
+
+    def get(self, survey_id=None) -> CompiledSurvey:
+        survey = self._surveys.get(survey_id or DEFAULT_SURVEY_ID)
+        return survey if survey is not None else self._surveys[DEFAULT_SURVEY_ID]
+
+    def __contains__(self, survey_id):
+        return survey_id in self._surveys
+
+    def terminal_states(self) -> frozenset:
+        return frozenset().union(*(survey.terminal_states for survey in self._surveys.values()))
+
+    def reload(self) -> bool:
+        """Recompiles changed definitions; returns whether anything changed."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return False
+        seen = set()
+        changed = False
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            seen.add(entry.path)
+            mtime = entry.stat().st_mtime
+            previous = self._by_file.get(entry.path)
+            if previous is not None and previous[0] == mtime:
+                continue
+            if self.errors.get(entry.path, (None,))[0] == mtime:
+                continue
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    survey = compile_survey(json.load(f), source=entry.path)
+            except (OSError, ValueError) as e:
+                self.errors[entry.path] = (mtime, str(e))
+                print(f"Survey definition not loaded, keeping the previous version: {e}")
+                continue
+            self.errors.pop(entry.path, None)
+            self._by_file[entry.path] = (mtime, survey)
+            changed = True
+        for path in set(self._by_file) - seen:
+            del self._by_file[path]
+            changed = True
+        if changed:
+            surveys = {self._builtin.id: self._builtin}
+            for _, survey in sorted(self._by_file.values(), key=lambda item: item[1].source):
+                surveys[survey.id] = survey
+            # Swap the whole mapping so a turn never sees a half-reloaded registry
+            self._surveys = surveys
+            self.reloads += 1
+            print(f"Loaded surveys: {', '.join(sorted(surveys))}")
+        return changed
+
+    def start(self):
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Survey reload failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "surveys": [survey.describe() for _, survey in sorted(self._surveys.items())],
+            "reloads": self.reloads,
+            "errors": {path: message for path, (_, message) in self.errors.items()},
+        }
+
+
+_default_registry = None
+
+
+def default_registry() -> SurveyRegistry:
+    """Process-wide registry over config.SURVEY_DIR, created on first use."""
+    global _default_registry
+    if _default_registry is None:
+        import config
+        _default_registry = SurveyRegistry(config.SURVEY_DIR, reload_interval=config.SURVEY_RELOAD_INTERVAL)
+    return _default_registry
@@ -0,0 +1,101 @@
+import asyncio
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Point the app at a throwaway database before anything imports `database`
+_tmpdir = tempfile.mkdtemp(prefix="analytics-")
+_db_path = os.path.join(_tmpdir, "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+
+from sqlalchemy import text
+import analytics
+from database import AsyncSessionLocal, init_db
+
+# Grows the interactions table and compares /analytics (rollup rows) with the
+# equivalent aggregate over the raw tables. Rollups are produced (and timed)
+# with `analytics.rebuild`. Pass --quick to stop at 100k interactions.
+
+SIZES = [10_000, 100_000, 1_000_000]
+if "--quick" in sys.argv:
+    SIZES = SIZES[:2]
+DAYS = 30
+QUERY_RUNS = 20
+
+FLOWS = [
+    ["9", "love the speed", "5"],
+    ["3", "checkout kept failing", "2"],
+    ["7", "it was ok", "4"],
+]
+
+FULL_SCAN = """
+SELECT s.nps_score, i.sentiment_label, s.current_step, date(i.timestamp), count(*)
+FROM interactions i JOIN survey_sessions s ON s.session_id = i.session_id
+WHERE i.timestamp >= :start
+GROUP BY 1, 2, 3, 4
+"""
+
+def grow(conn, start_session, target_turns):
+    """Appends whole sessions until the interactions table has target_turns rows."""
+    now = datetime.datetime.utcnow()
+    turns = conn.execute("SELECT count(*) FROM interactions").fetchone()[0]
+    sid = start_session
+    sessions, interactions = [], []
+    while turns < target_turns:
+        flow = FLOWS[sid % len(FLOWS)]
+        ts = now - datetime.timedelta(minutes=random.randrange(DAYS * 24 * 60))
+        score = int(flow[0])
+        sessions.append((f"s{sid}", "CLOSING", score, random.choice(["enterprise", "smb", None]), ts))
+        for j, msg in enumerate(flow):
+            interactions.append((f"s{sid}", ts + datetime.timedelta(seconds=j * 20), msg, "ok", "Neutral", 0.0))
+        turns += len(flow)
+        sid += 1
+    conn.executemany("INSERT INTO survey_sessions (session_id, current_step, nps_score, customer_segment, start_time) VALUES (?, ?, ?, ?, ?)", sessions)
+    conn.executemany("INSERT INTO interactions (session_id, timestamp, user_input, bot_response, sentiment_label, sentiment_score) VALUES (?, ?, ?, ?, ?, ?)", interactions)
+    conn.commit()
+    return sid
+
+async def timed(fn):
+    samples = []
+    for _ in range(QUERY_RUNS):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+async def main():
+    random.seed(7)
+    init_db()
+    conn = sqlite3.connect(_db_path)
+    sid = 0
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=DAYS)
+
+    print(f"{'interactions':>12} | {'rebuild':>9} | {'rollup rows':>11} | {'/analytics (rollups)':>20} | {'full scan':>10}")
+    print("-" * 76)
+    for size in SIZES:
+        sid = grow(conn, sid, size)
+        start = time.perf_counter()
+        _, rows = await analytics.rebuild(AsyncSessionLocal)
+        rebuild_time = time.perf_counter() - start
+
+        async def rollup_query():
+            async with AsyncSessionLocal() as db:
+                await analytics.query(db, bucket="day", start=since)
+
+        async def full_scan():
+            async with AsyncSessionLocal() as db:
+                (await db.execute(text(FULL_SCAN), {"start": since})).all()
+
+        rollup = await timed(rollup_query)
+        scan = await timed(full_scan)
+        print(f"{size:>12,} | {rebuild_time:>8.1f}s | {rows:>11,} | {rollup * 1000:>17.1f} ms | {scan * 1000:>7.1f} ms")
+
+    conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+from fake_ollama import FakeOllamaServer
+from llm_backends import Backend, BackendPool
+from llm_service import LLMService
+
+# Multi-backend routing against fake Ollama servers that each run one
+# generation at a time (~0.2s), like a single GPU box. First the throughput
+# of a closed loop of --clients concurrent sentiment calls with 1 to 4
+# backends, with each backend's share of the requests. Then one of three
+# backends goes down for --outage seconds under steady traffic: it should be
+# ejected after a few failures, its traffic should move to the others and it
+# should be re-admitted once its health checks pass again.
+
+BASE_PORT = 11531
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def servers(count, **settings):
+    return [FakeOllamaServer(port=BASE_PORT + i, latency=0.2, jitter=0.02, distribution="normal", parallel=1, **settings)
+            for i in range(count)]
+
+
+def make_service(urls, **pool_settings):
+    pool = BackendPool([Backend(url) for url in urls], **pool_settings)
+    return LLMService(timeout=5.0, retries=2, retry_delay=0.05, pool=pool)
+
+
+async def closed_loop(service, clients, seconds, latencies):
+    end = time.perf_counter() + seconds
+
+    async def client(n):
+        i = 0
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            await service.analyze_sentiment(f"checkout failed again, client {n} call {i}", fallback=False)
+            latencies.append(time.perf_counter() - start)
+            i += 1
+
+    await asyncio.gather(*(client(n) for n in range(clients)))
+
+
+async def scaling(count, args):
+    with contextlib.ExitStack() as stack:
+        urls = [stack.enter_context(server).url for server in servers(count)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            service = make_service(urls, health_interval=0)
+            await closed_loop(service, args.clients, 1.0, [])  # warm-up, unmeasured
+            before = [backend.requests for backend in service.pool.backends]
+            latencies = []
+            started = time.perf_counter()
+            await closed_loop(service, args.clients, args.seconds, latencies)
+            elapsed = time.perf_counter() - started
+            shares = [backend.requests - b for backend, b in zip(service.pool.backends, before)]
+            await service.close()
+    total = sum(shares)
+    print(f"{count:>8} {len(latencies) / elapsed:>8.1f} {statistics.median(latencies) * 1000:>7.0f} "
+          f"{percentile(latencies, 0.99) * 1000:>7.0f}  {' / '.join(f'{s / total:.0%}' for s in shares)}")
+    return len(latencies) / elapsed
+
+
+async def outage(args):
+    with contextlib.ExitStack() as stack:
+        fakes = [stack.enter_context(server) for server in servers(3)]
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            service = make_service([fake.url for fake in fakes], eject_after=3, eject_seconds=2.0, health_interval=0.5)
+            service.pool.start(service.check_connection)
+            results = []  # (phase, served)
+
+            async def call(phase, i):
+                result = await service.analyze_sentiment(f"the app crashed, call {phase} {i}")
+                results.append((phase, not result.get("fallback")))
+
+            async def drive(phase, seconds):
+                tasks, i = [], 0
+                end = time.perf_counter() + seconds
+                while time.perf_counter() < end:
+                    tasks.append(asyncio.create_task(call(phase, i)))
+                    i += 1
+                    await asyncio.sleep(args.interval)
+                await asyncio.gather(*tasks)
+
+            await drive("before", 2.0)
+            fakes[0].settings.down = True
+            down = [backend.requests for backend in service.pool.backends]
+            await drive("outage", args.outage)
+            fakes[0].settings.down = False
+            up = [backend.requests for backend in service.pool.backends]
+            await drive("after", 2.0 + 3.0)
+            after = [backend.requests for backend in service.pool.backends]
+            await service.pool.stop()
+            stats = service.pool.stats()
+            await service.close()
+
+    print(f"\nOne of 3 backends down for {args.outage}s, a call every {args.interval}s:")
+    for phase in ("before", "outage", "after"):
+        served = [ok for p, ok in results if p == phase]
+        print(f"  {phase:>6}: {sum(served)}/{len(served)} served")
+    print(f"  requests sent to the failed backend: {up[0] - down[0]} during the outage, {after[0] - up[0]} after it")
+    for transition in stats["transitions"]:
+        print(f"  {transition['backend']} {transition['event']}: {transition['reason']}")
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Throughput scaling and ejection across several Ollama backends.")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent callers in the closed loop")
+    parser.add_argument("--seconds", type=float, default=8.0, help="measured seconds per backend count")
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between calls in the outage run")
+    parser.add_argument("--outage", type=float, default=4.0)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, one ~0.2s generation at a time per backend (latencies in ms)")
+    print(f"{'backends':>8} {'calls/s':>8} {'p50':>7} {'p99':>7}  share per backend")
+    throughput = [await scaling(count, args) for count in range(1, 5)]
+    print(f"4 backends: {throughput[-1] / throughput[0]:.2f}x the throughput of 1")
+
+    stats = await outage(args)
+    events = [t["event"] for t in stats["transitions"]]
+    assert events == ["ejected", "readmitted"], events
+    assert all(backend["healthy"] for backend in stats["backends"]), stats
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
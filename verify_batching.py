@@ -0,0 +1,50 @@
+
+import asyncio
+import time
+from llm_service import LLMService
+
+# Mix of short feedback texts as they arrive from concurrent users in a detail state
+TEXTS = [
+    "The app keeps crashing when I open settings.",
+    "Great support, the agent solved it fast.",
+    "Checkout was too slow.",
+    "It's fine I guess.",
+    "Love the new dark mode!",
+    "I waited 20 minutes for a reply, terrible.",
+    "Prices went up again.",
+    "Smooth onboarding, thanks.",
+]
+
+async def run_round(service, texts):
+    start = time.time()
+    results = await asyncio.gather(*[service.analyze_sentiment(t) for t in texts])
+    duration = time.time() - start
+    fallbacks = sum(1 for r in results if r.get("label") == "Neutral" and r.get("score") == 0.0 and not r.get("keywords"))
+    return duration, fallbacks
+
+async def benchmark(concurrency=16, rounds=3):
+    texts = (TEXTS * ((concurrency // len(TEXTS)) + 1))[:concurrency]
+
+    print(f"--- Sentiment Throughput ({concurrency} concurrent turns x {rounds} rounds) ---")
+    results = {}
+    for label, batch_size in [("one-call-per-turn", 1), ("micro-batched", 8)]:
+        service = LLMService(batch_max_size=batch_size)
+        # Warm the model so load time isn't attributed to the first mode
+        await service.analyze_sentiment("warm up")
+
+        total_time = 0.0
+        total_fallbacks = 0
+        for _ in range(rounds):
+            duration, fallbacks = await run_round(service, texts)
+            total_time += duration
+            total_fallbacks += fallbacks
+
+        throughput = (concurrency * rounds) / total_time
+        results[label] = throughput
+        print(f"{label:>18}: {throughput:.2f} texts/s ({total_time / rounds:.2f}s per round, {total_fallbacks} possible fallbacks)")
+
+    speedup = results["micro-batched"] / results["one-call-per-turn"]
+    print(f"\nSpeedup: {speedup:.2f}x")
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,73 @@
+
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+from circuit_breaker import CircuitBreaker
+from fake_ollama import FakeOllamaServer
+from llm_service import LLMService
+
+TIMEOUT = 1.0          # LLM timeout (30s in production)
+REQUEST_INTERVAL = 0.1
+OUTAGE_SECONDS = 4.0
+RECOVERY_SECONDS = 4.0
+
+async def drive(service, seconds, results, phase):
+    # Fire a sentiment call every REQUEST_INTERVAL seconds, like steady user traffic
+    tasks = []
+    end = time.time() + seconds
+    while time.time() < end:
+        tasks.append(asyncio.create_task(call(service, results, phase)))
+        await asyncio.sleep(REQUEST_INTERVAL)
+    await asyncio.gather(*tasks)
+
+async def call(service, results, phase):
+    start = time.time()
+    try:
+        await service.analyze_sentiment("checkout keeps failing", fallback=False)
+        ok = True
+    except Exception:
+        ok = False
+    results.append((phase, start, time.time() - start, ok))
+
+async def run(label, port, breaker):
+    results = []
+    # Per-call fallback logging would drown the summary
+    with FakeOllamaServer(port=port, latency=0.05) as server, contextlib.redirect_stdout(io.StringIO()):
+        service = LLMService(base_url=server.url, timeout=TIMEOUT, breaker=breaker)
+        await drive(service, 1.0, results, "healthy")
+
+        # Ollama hangs: every generation now exceeds the timeout
+        server.settings.latency = 10.0
+        await drive(service, OUTAGE_SECONDS, results, "outage")
+
+        server.settings.latency = 0.05
+        recovered_at = time.time()
+        await drive(service, RECOVERY_SECONDS, results, "recovery")
+        await service.close()
+
+    print(f"\n--- {label} ---")
+    for phase in ("healthy", "outage", "recovery"):
+        rows = [r for r in results if r[0] == phase]
+        fallbacks = [latency for _, _, latency, ok in rows if not ok]
+        line = f"  {phase:>8}: {len(rows) - len(fallbacks):>2}/{len(rows)} served"
+        if fallbacks:
+            line += f", fallback latency mean={statistics.mean(fallbacks) * 1000:.0f}ms max={max(fallbacks) * 1000:.0f}ms"
+        print(line)
+
+    first_ok = min((start + latency for phase, start, latency, ok in results if phase == "recovery" and ok), default=None)
+    if first_ok:
+        print(f"  time from Ollama recovery to first served request: {first_ok - recovered_at:.2f}s")
+    if breaker:
+        for t in breaker.stats()["transitions"]:
+            print(f"  transition {t['from']} -> {t['to']}: {t['reason']}")
+
+async def main():
+    print(f"LLM timeout {TIMEOUT}s, one request every {REQUEST_INTERVAL}s, {OUTAGE_SECONDS}s hang then recovery")
+    await run("Retry only (no breaker)", 11511, None)
+    breaker = CircuitBreaker(window=10.0, min_calls=3, failure_rate=0.5, open_duration=1.0, half_open_max_calls=1)
+    await run("Circuit breaker (open 1s, 1 probe)", 11512, breaker)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import time
+import httpx
+from fake_ollama import FakeOllamaServer
+from llm_scheduler import PriorityLimiter
+from llm_service import LLMService
+from llm_timeouts import AdaptiveTimeouts
+
+# Tail latency of interactive sentiment calls against a fake Ollama whose
+# generations usually take ~0.2s but now and then spike to --spike-latency.
+# Open-loop traffic (one call every --interval seconds) is replayed against:
+# the fixed 30s timeout without a deadline (before), a per-turn deadline,
+# deadline + adaptive timeout + deadline-aware retry, and the same plus a
+# hedged second request after the p95. Reports served share, p50/p95/p99/max
+# per call (fallbacks included) and Ollama requests per call.
+
+WARMUP_SECONDS = 3.0  # unmeasured, fills the latency windows
+
+
+async def call(service, text, budget, latencies, served):
+    start = time.perf_counter()
+    deadline = time.monotonic() + budget if budget else None
+    result = await service.analyze_sentiment(text, deadline=deadline)
+    latencies.append(time.perf_counter() - start)
+    served.append(not result.get("fallback"))
+
+
+async def drive(service, seconds, interval, budget, latencies, served, rng):
+    tasks = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        text = f"checkout failed again, order {rng.randrange(10**9)}"
+        tasks.append(asyncio.create_task(call(service, text, budget, latencies, served)))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(label, port, args, budget=None, adaptive=False, retries=1, hedge=False):
+    rng = random.Random(1)
+    server = FakeOllamaServer(port=port, latency=0.2, jitter=0.03, distribution="normal",
+                              spike_rate=args.spike_rate, spike_latency=args.spike_latency)
+    with server, contextlib.redirect_stdout(io.StringIO()):
+        timeouts = AdaptiveTimeouts(max_timeout=30.0, min_timeout=args.min_timeout) if adaptive or hedge else None
+        service = LLMService(
+            base_url=server.url, timeout=30.0, limiter=PriorityLimiter(max_concurrent=args.slots, max_queue=256),
+            timeouts=timeouts, retries=retries, retry_delay=0.1, hedge=hedge, max_connections=args.slots * 2,
+        )
+        await drive(service, WARMUP_SECONDS, args.interval, budget, [], [], rng)
+        requests_before = httpx.get(f"{server.url}/_stats").json()["requests"]
+        latencies, served = [], []
+        await drive(service, args.seconds, args.interval, budget, latencies, served, rng)
+        requests = httpx.get(f"{server.url}/_stats").json()["requests"] - requests_before
+        await service.close()
+    print(f"{label:<44} {sum(served) / len(served):>7.1%} "
+          f"{statistics.median(latencies) * 1000:>7.0f} {percentile(latencies, 0.95) * 1000:>7.0f} "
+          f"{percentile(latencies, 0.99) * 1000:>7.0f} {max(latencies) * 1000:>7.0f} {requests / len(latencies):>9.2f}")
+    if timeouts is not None:
+        stats = timeouts.stats()["methods"]["analyze_sentiment"]
+        print(f"{'':<44} timeout {stats['timeout']:.2f}s, {stats['timeouts']} timeouts, "
+              f"{stats['hedges']} hedges ({stats['hedge_wins']} won), {stats['deadline_skips']} deadline skips")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Tail latency with deadlines, adaptive timeouts and hedging.")
+    parser.add_argument("--seconds", type=float, default=20.0, help="measured seconds per configuration")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between calls")
+    parser.add_argument("--spike-rate", type=float, default=0.05)
+    parser.add_argument("--spike-latency", type=float, default=8.0)
+    parser.add_argument("--budget", type=float, default=2.5, help="per-call deadline in seconds")
+    parser.add_argument("--min-timeout", type=float, default=0.5, help="adaptive timeout floor")
+    parser.add_argument("--slots", type=int, default=32, help="concurrent generations (PriorityLimiter)")
+    args = parser.parse_args()
+
+    print(f"~0.2s generations, {args.spike_rate:.0%} spike to {args.spike_latency}s, a call every {args.interval}s, "
+          f"deadline {args.budget}s")
+    print(f"{'':<44} {'served':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'req/call':>9}  (ms)")
+    await run("fixed 30s timeout, no deadline (before)", 11521, args)
+    await run("deadline", 11522, args, budget=args.budget, retries=2)
+    await run("deadline + adaptive timeout + retry", 11523, args, budget=args.budget, adaptive=True, retries=2)
+    await run("deadline + adaptive timeout + retry + hedge", 11524, args, budget=args.budget, adaptive=True, retries=2, hedge=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
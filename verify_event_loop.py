@@ -0,0 +1,58 @@
+
+import asyncio
+import httpx
+import statistics
+import time
+
+BASE_URL = "http://127.0.0.1:8000"
+
+# Ambiguous enough that the local classifier defers it to the LLM
+SLOW_TEXT = "The dashboard layout changed after the last update and the export moved."
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def nps_latencies(client, count, run_id):
+    latencies = []
+    for i in range(count):
+        start = time.time()
+        await client.post(BASE_URL + "/analyze", json={"text": "7", "session_id": f"nps-{run_id}-{i}"})
+        latencies.append(time.time() - start)
+    return latencies
+
+async def slow_llm_turns(client, count, run_id):
+    # Move each session into DEEP_DIVE first so the text turn hits the LLM
+    session_ids = [f"slow-{run_id}-{i}" for i in range(count)]
+    await asyncio.gather(*[client.post(BASE_URL + "/analyze", json={"text": "3", "session_id": s}) for s in session_ids])
+    await asyncio.gather(*[client.post(BASE_URL + "/analyze", json={"text": SLOW_TEXT, "session_id": s}) for s in session_ids])
+
+def report(label, latencies):
+    print(f"{label:>22}: p50={statistics.median(latencies) * 1000:.1f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.1f}ms max={max(latencies) * 1000:.1f}ms")
+
+async def test_event_loop(nps_requests=200, slow_requests=16):
+    async with httpx.AsyncClient(timeout=120.0, limits=httpx.Limits(max_connections=200)) as client:
+        run_id = int(time.time())
+
+        print("--- NPS fast path, idle server ---")
+        idle = await nps_latencies(client, nps_requests, f"{run_id}-idle")
+        report("idle", idle)
+
+        print(f"\n--- NPS fast path, {slow_requests} LLM turns in flight ---")
+        slow_task = asyncio.create_task(slow_llm_turns(client, slow_requests, run_id))
+        await asyncio.sleep(0.5)  # let the LLM turns reach Ollama
+        loaded = await nps_latencies(client, nps_requests, f"{run_id}-loaded")
+        report("with LLM in flight", loaded)
+        await slow_task
+
+        ratio = percentile(loaded, 99) / percentile(idle, 99)
+        print(f"\np99 ratio (loaded / idle): {ratio:.2f}x")
+        if ratio < 2.0:
+            print("[PASS] NPS fast path stays flat while LLM requests are in flight")
+        else:
+            print("[FAIL] NPS fast path is being blocked")
+
+if __name__ == "__main__":
+    asyncio.run(test_event_loop())
@@ -0,0 +1,74 @@
+import asyncio
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Point the app at a throwaway database before anything imports `database`
+_tmpdir = tempfile.mkdtemp(prefix="export-")
+_db_path = os.path.join(_tmpdir, "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+
+from database import SessionLocal, init_db
+from models import SurveySession, Interaction
+import export
+
+# Peak Python memory of loading everything with .all() (as check_db.py does)
+# vs. the streaming export, as the interactions table grows. Throughput is
+# measured in a separate untraced run.
+
+SIZES = [50_000, 200_000, 500_000]
+if "--quick" in sys.argv:
+    SIZES = SIZES[:2]
+
+def grow(conn, target):
+    now = datetime.datetime.utcnow()
+    have = conn.execute("SELECT count(*) FROM interactions").fetchone()[0]
+    sessions, interactions = [], []
+    for n in range(have, target):
+        sid = f"s{n // 3}"
+        if n % 3 == 0:
+            sessions.append((sid, "CLOSING", 9, "smb", now))
+        interactions.append((sid, now - datetime.timedelta(seconds=target - n), f"message {n} about checkout speed", "Thanks for sharing!", "Neutral", 0.0))
+    conn.executemany("INSERT INTO survey_sessions (session_id, current_step, nps_score, customer_segment, start_time) VALUES (?, ?, ?, ?, ?)", sessions)
+    conn.executemany("INSERT INTO interactions (session_id, timestamp, user_input, bot_response, sentiment_label, sentiment_score) VALUES (?, ?, ?, ?, ?, ?)", interactions)
+    conn.commit()
+
+def load_all():
+    db = SessionLocal()
+    rows = db.query(Interaction, SurveySession).join(SurveySession, SurveySession.session_id == Interaction.session_id).all()
+    db.close()
+    return len(rows)
+
+def stream_export(fmt):
+    with open(os.devnull, "w") as out:
+        exported, _ = asyncio.run(export.export(fmt, out))
+    return exported
+
+def measure(fn):
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    rows = fn()
+    return peak / 2**20, rows / (time.perf_counter() - start)
+
+def main():
+    init_db()
+    conn = sqlite3.connect(_db_path)
+    print(f"{'interactions':>12} | {'.all() peak':>12} | {'ndjson peak':>12} | {'csv peak':>9} | {'ndjson rows/s':>13} | {'csv rows/s':>10}")
+    print("-" * 86)
+    for size in SIZES:
+        grow(conn, size)
+        all_peak, _ = measure(load_all)
+        nd_peak, nd_rate = measure(lambda: stream_export("ndjson"))
+        csv_peak, csv_rate = measure(lambda: stream_export("csv"))
+        print(f"{size:>12,} | {all_peak:>9.1f} MB | {nd_peak:>9.1f} MB | {csv_peak:>6.1f} MB | {nd_rate:>13,.0f} | {csv_rate:>10,.0f}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
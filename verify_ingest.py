@@ -0,0 +1,165 @@
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+
+# Temporary database; must be set before database.py is imported
+WORKDIR = tempfile.mkdtemp(prefix="ingest-")
+DB_PATH = os.path.join(WORKDIR, "ingest.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+from database import AsyncSessionLocal, init_db
+from fake_ollama import FakeOllamaServer
+from feedback_processor import FeedbackProcessor
+from llm_scheduler import PriorityLimiter
+from llm_service import LLMService
+from local_classifier import LocalSentimentClassifier
+from survey_engine import SurveyRegistry
+import ingest
+
+# Imports the same mixed historical export (bare NPS scores, clear-cut and
+# ambiguous reviews) three ways against fake_ollama: one /analyze-style turn
+# per row (sequential, and 8 at a time), and through BulkIngestor. Then
+# checks that an interrupted job resumes without losing or duplicating rows,
+# and that two runners of one job can't both insert.
+
+PORT = 11509
+LATENCY = 0.1
+ROWS = 4000
+BASELINE_ROWS = 400
+
+AMBIGUOUS = ["the update changed the menu layout", "support replied after {n} days", "pricing is different from last year",
+             "I use it for {n} projects now", "the export took about {n} minutes", "not what I expected from version {n}"]
+CLEAR = ["terrible, it crashed {n} times", "love the new dashboard", "great support, thanks", "the app is slow and broken",
+         "excellent, works great", "worst update ever"]
+
+def make_rows(n, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.25:
+            text = str(rng.randint(0, 10))
+        elif kind < 0.6:
+            text = rng.choice(CLEAR).format(n=rng.randint(2, 99))
+        else:
+            text = rng.choice(AMBIGUOUS).format(n=rng.randint(2, 999)) + f" (ref {i})"
+        rows.append({"id": f"r{i}", "text": text})
+    return rows
+
+def to_ndjson(rows):
+    import json
+    return "".join(json.dumps(r) + "\n" for r in rows).encode()
+
+async def chunks(data, size=64 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+def make_llm(url):
+    # Same scheduling as the app defaults: 2 generations at once, batches of 8
+    return LLMService(base_url=url, batch_max_size=8, limiter=PriorityLimiter(max_concurrent=2, max_queue=64))
+
+async def per_row(url, rows, concurrency):
+    llm = make_llm(url)
+    surveys = SurveyRegistry(None)
+    classifier = LocalSentimentClassifier()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def turn(row):
+        async with semaphore:
+            async with AsyncSessionLocal() as db:
+                processor = FeedbackProcessor(llm, db, classifier=classifier, surveys=surveys)
+                await processor.process_response(row["text"], str(uuid.uuid4()))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[turn(row) for row in rows])
+    elapsed = time.perf_counter() - start
+    await llm.close()
+    return len(rows) / elapsed
+
+async def bulk(url, data, job_id, stop_after_batches=None, concurrency=16, batch_size=500):
+    llm = make_llm(url)
+    ingestor = ingest.BulkIngestor(AsyncSessionLocal, llm, classifier=LocalSentimentClassifier(),
+                                   concurrency=concurrency, batch_size=batch_size)
+    job = await ingestor.open(job_id, "ndjson")
+    summary, batches = None, 0
+    results = ingestor.run(job, chunks(data))
+    try:
+        async for result in results:
+            if "progress" in result:
+                batches += 1
+                if stop_after_batches is not None and batches >= stop_after_batches:
+                    break
+            if "summary" in result:
+                summary = result["summary"]
+    finally:
+        await results.aclose()
+        await llm.close()
+    return summary, batches
+
+async def racing_runners(url, data, job_id):
+    # Two ingestors (as in two worker processes) running the same job at once
+    llm = make_llm(url)
+    runners = [ingest.BulkIngestor(AsyncSessionLocal, llm, concurrency=8, batch_size=200) for _ in range(2)]
+    jobs = [await runner.open(job_id, "ndjson") for runner in runners]
+
+    async def drain(runner, job):
+        try:
+            async for _ in runner.run(job, chunks(data)):
+                pass
+            return "completed"
+        except ingest.IngestConflictError:
+            return "conflict"
+
+    outcomes = await asyncio.gather(*[drain(r, j) for r, j in zip(runners, jobs)])
+    await llm.close()
+    return outcomes
+
+def job_rows(job_id):
+    with sqlite3.connect(DB_PATH) as conn:
+        total, distinct = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT user_input) FROM interactions WHERE session_id = ?", (f"import-{job_id}",)
+        ).fetchone()
+        rows_done, status = conn.execute("SELECT rows_done, status FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+    return total, distinct, rows_done, status
+
+def main():
+    init_db()
+    rows = make_rows(ROWS)
+    data = to_ndjson(rows)
+    distinct_texts = len({r["text"] for r in rows})
+
+    with FakeOllamaServer(port=PORT, latency=LATENCY) as server:
+        print(f"{ROWS} rows (25% bare scores, 35% clear-cut, 40% ambiguous), fake Ollama latency {LATENCY}s\n")
+        print(f"{'method':<40} | {'rows/s':>8}")
+        print("-" * 52)
+        sequential = asyncio.run(per_row(server.url, rows[:BASELINE_ROWS], concurrency=1))
+        print(f"{'/analyze turn per row, sequential':<40} | {sequential:>8.1f}")
+        concurrent = asyncio.run(per_row(server.url, rows[:BASELINE_ROWS], concurrency=8))
+        print(f"{'/analyze turn per row, 8 at a time':<40} | {concurrent:>8.1f}")
+        summary, _ = asyncio.run(bulk(server.url, data, "bench"))
+        print(f"{'BulkIngestor (16 on LLM, 500/commit)':<40} | {summary['rows_per_sec']:>8.1f}")
+        print(f"  paths: {summary['paths']}")
+        print(f"  speed-up vs sequential: {summary['rows_per_sec'] / sequential:.1f}x, vs 8 at a time: {summary['rows_per_sec'] / concurrent:.1f}x\n")
+
+        # Interrupted after 3 batches, then resumed with the same input
+        asyncio.run(bulk(server.url, data, "resume", stop_after_batches=3))
+        partial = job_rows("resume")
+        resumed, _ = asyncio.run(bulk(server.url, data, "resume"))
+        total, distinct, rows_done, status = job_rows("resume")
+        print(f"Resume: interrupted at {partial[2]} rows, resumed run processed {resumed['rows_this_run']}; "
+              f"{total} rows stored ({distinct} distinct texts), job {status}")
+        assert partial[2] == 1500 and partial[0] == 1500
+        assert total == ROWS and distinct == distinct_texts and rows_done == ROWS and status == "completed"
+
+        outcomes = asyncio.run(racing_runners(server.url, data, "race"))
+        total, distinct, rows_done, status = job_rows("race")
+        print(f"Two runners of one job: {outcomes}; {total} rows stored, job {status}")
+        assert sorted(outcomes) == ["completed", "conflict"] and total == ROWS and rows_done == ROWS
+    print("Resume and concurrent-runner checks: OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import asyncio
+import datetime
+import glob
+import gzip
+import json
+import os
+import tempfile
+import time
+
+from interaction_log import InteractionLog
+
+# Compares the old per-turn logging (open, append str(dict), close in a
+# background task) with the buffered JSONL InteractionLog. "Per request" is
+# the time spent on the request's behalf; "records/sec" is end-to-end until
+# every record is on disk.
+
+RECORDS = 20000
+
+def make_record(i):
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "session_id": f"session-{i % 500}",
+        "user_input": "The checkout page was slow but support fixed it quickly.",
+        "sentiment": "Positive",
+        "score": 0.6,
+        "bot_response": "Appreciate the feedback! How satisfied were you with this chat?",
+    }
+
+def old_log_to_file(path, data):
+    # Previous FeedbackProcessor.log_to_file, minus the hard-coded path
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(str(data) + "\n")
+    except Exception as e:
+        print(f"Failed to write log: {e}")
+
+async def bench_old(tmpdir, records):
+    path = os.path.join(tmpdir, "feedback_log.txt")
+    start = time.perf_counter()
+    for record in records:
+        # Starlette runs sync background tasks in the threadpool
+        await asyncio.to_thread(old_log_to_file, path, record)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(records), len(records) / elapsed
+
+async def bench_new(tmpdir, records):
+    log = InteractionLog(os.path.join(tmpdir, "feedback_log.jsonl"), flush_interval=0.05)
+    log.start()
+    start = time.perf_counter()
+    write_time = 0.0
+    for i, record in enumerate(records):
+        t = time.perf_counter()
+        log.write(record)
+        write_time += time.perf_counter() - t
+        if i % 100 == 0:
+            # Let the writer run as it would between requests
+            await asyncio.sleep(0)
+    await log.stop()
+    elapsed = time.perf_counter() - start
+    with open(log.path, encoding="utf-8") as f:
+        parsed = sum(1 for line in f if json.loads(line))
+    assert parsed == len(records), f"expected {len(records)} JSON lines, found {parsed}"
+    return write_time / len(records), len(records) / elapsed, log.stats()
+
+async def check_rotation(tmpdir, records):
+    path = os.path.join(tmpdir, "rotating.jsonl")
+    log = InteractionLog(path, flush_interval=0.01, batch_size=100, max_bytes=64 * 1024)
+    log.start()
+    for i, record in enumerate(records):
+        log.write(record)
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    await log.stop()
+    rotated = sorted(glob.glob(path + ".*.gz"))
+    total = 0
+    for name in rotated:
+        with gzip.open(name, "rt", encoding="utf-8") as f:
+            total += sum(1 for _ in f)
+    with open(path, encoding="utf-8") as f:
+        total += sum(1 for _ in f)
+    assert total == len(records), f"lost records across rotation: {total} != {len(records)}"
+    return len(rotated), log.rotations
+
+async def main():
+    records = [make_record(i) for i in range(RECORDS)]
+    with tempfile.TemporaryDirectory(prefix="interaction-log-") as tmpdir:
+        old_per, old_rate = await bench_old(tmpdir, records)
+        new_per, new_rate, stats = await bench_new(tmpdir, records)
+        files, rotations = await check_rotation(tmpdir, records[:5000])
+
+    print(f"{RECORDS} records\n")
+    print(f"{'':<28} | {'per request':>12} | {'records/sec':>12}")
+    print("-" * 58)
+    print(f"{'open/append/close per turn':<28} | {old_per * 1e6:>9.1f} us | {old_rate:>12,.0f}")
+    print(f"{'buffered JSONL writer':<28} | {new_per * 1e6:>9.1f} us | {new_rate:>12,.0f}")
+    print(f"\nWriter: {stats['batches']} batches for {stats['written']} records, {stats['dropped']} dropped")
+    print(f"Rotation at 64 KiB: {rotations} rotations, {files} gzipped files, no records lost")
+
+if __name__ == "__main__":
+    asyncio.run(main())
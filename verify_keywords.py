@@ -0,0 +1,147 @@
+import asyncio
+import datetime
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Point the app at a throwaway database before anything imports `database`
+_tmpdir = tempfile.mkdtemp(prefix="keywords-")
+_db_path = os.path.join(_tmpdir, "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+
+from sqlalchemy import text
+import keyword_index
+from database import AsyncSessionLocal, init_db
+from models import Interaction
+
+# Grows the interactions table (with keywords) and compares /search and
+# /trending, served from the postings and keyword rollups, with the LIKE and
+# json_each scans they replace. Postings and rollups are produced (and timed)
+# with `keyword_index.rebuild`. Also measures what indexing adds to a turn's
+# commit. Pass --quick to stop at 100k interactions.
+
+SIZES = [10_000, 100_000, 1_000_000]
+if "--quick" in sys.argv:
+    SIZES = SIZES[:2]
+DAYS = 30
+QUERY_RUNS = 20
+TURNS = 300
+
+TOPICS = ["checkout page", "login", "pricing", "mobile app", "export", "dashboard", "support", "invoices",
+          "search", "notifications", "onboarding", "password reset", "api", "billing", "reports", "sync"]
+# Rare overall, and mentioned a lot in the last day: /search looks it up and
+# /trending should surface it
+SPIKE = "refunds"
+WORDS = ["slow", "broken", "great", "confusing", "crashed", "fast", "missing", "love", "hate", "fine"]
+
+LIKE_SEARCH = """
+SELECT id, session_id, timestamp, user_input, sentiment_label, sentiment_score, keywords FROM interactions
+WHERE lower(user_input) LIKE :pattern ORDER BY id DESC LIMIT 50
+"""
+
+SCAN_TRENDING = """
+SELECT k.value, sum(i.timestamp >= :recent), sum(i.timestamp < :recent), avg(i.sentiment_score)
+FROM interactions i, json_each(i.keywords) k
+WHERE i.timestamp >= :previous
+GROUP BY k.value
+"""
+
+def grow(conn, target):
+    """Appends interactions until the table has `target` rows."""
+    now = datetime.datetime.utcnow()
+    count = conn.execute("SELECT count(*) FROM interactions").fetchone()[0]
+    rows = []
+    for i in range(count, target):
+        spike = i % 500 == 0
+        keywords = [SPIKE] if spike else random.sample(TOPICS, random.randint(1, 3))
+        minutes = random.randrange(24 * 60) if spike else random.randrange(DAYS * 24 * 60)
+        score = random.choice([-0.7, 0.0, 0.8]) if not spike else -0.8
+        text_ = f"the {keywords[0]} is {random.choice(WORDS)}" + (f", also {keywords[1]}" if len(keywords) > 1 else "")
+        rows.append((f"s{i // 3}", now - datetime.timedelta(minutes=minutes), text_, "ok",
+                     "Frustrated" if score < 0 else "Neutral", score, json.dumps(keywords)))
+    conn.executemany("INSERT INTO interactions (session_id, timestamp, user_input, bot_response, sentiment_label, sentiment_score, keywords) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+
+async def timed(fn):
+    samples = []
+    for _ in range(QUERY_RUNS):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+async def turn_overhead():
+    # One interaction per commit, as a turn persists it, with and without indexing
+    async def run(index):
+        start = time.perf_counter()
+        for i in range(TURNS):
+            async with AsyncSessionLocal() as db:
+                interaction = Interaction(session_id="overhead", user_input="checkout page was slow", bot_response="ok",
+                                          sentiment_label="Frustrated", sentiment_score=-0.7)
+                db.add(interaction)
+                if index:
+                    await keyword_index.record(db, interaction, ["checkout page", "slow"], datetime.datetime.utcnow(), -0.7)
+                await db.commit()
+        return (time.perf_counter() - start) / TURNS
+
+    plain = await run(False)
+    indexed = await run(True)
+    return plain, indexed
+
+async def main():
+    random.seed(11)
+    init_db()
+    conn = sqlite3.connect(_db_path)
+    now = datetime.datetime.utcnow()
+    recent = now - datetime.timedelta(hours=23)
+    previous = recent - datetime.timedelta(hours=24)
+
+    print(f"{'interactions':>12} | {'rebuild':>8} | {'/search':>9} | {'LIKE scan':>9} | {'/trending':>9} | {'json_each scan':>14}")
+    print("-" * 80)
+    for size in SIZES:
+        grow(conn, size)
+        start = time.perf_counter()
+        await keyword_index.rebuild(AsyncSessionLocal)
+        rebuild_time = time.perf_counter() - start
+
+        async def search():
+            async with AsyncSessionLocal() as db:
+                return await keyword_index.search(db, SPIKE)
+
+        async def like_scan():
+            async with AsyncSessionLocal() as db:
+                return (await db.execute(text(LIKE_SEARCH), {"pattern": f"%{SPIKE}%"})).all()
+
+        async def trending():
+            async with AsyncSessionLocal() as db:
+                return await keyword_index.trending(db, bucket="hour", window=24, now=now)
+
+        async def scan_trending():
+            async with AsyncSessionLocal() as db:
+                return (await db.execute(text(SCAN_TRENDING), {"recent": recent, "previous": previous})).all()
+
+        indexed, scanned = await timed(search), await timed(like_scan)
+        rising, scanned_rising = await timed(trending), await timed(scan_trending)
+        print(f"{size:>12,} | {rebuild_time:>7.1f}s | {indexed * 1000:>6.1f} ms | {scanned * 1000:>6.1f} ms | "
+              f"{rising * 1000:>6.1f} ms | {scanned_rising * 1000:>11.1f} ms")
+
+    report = await trending()
+    top = report["topics"][0]
+    print(f"\nTop trending complaint: {top['keyword']!r} ({top['previous']} -> {top['recent']}, avg sentiment {top['avg_sentiment']})")
+    assert top["keyword"] == SPIKE, "the spiking keyword should rank first"
+    page = await search()
+    assert page["results"] and all(SPIKE in r["keywords"] for r in page["results"])
+
+    plain, indexed = await turn_overhead()
+    print(f"Turn commit: {plain * 1000:.2f} ms without indexing, {indexed * 1000:.2f} ms with "
+          f"(+{(indexed - plain) * 1000:.2f} ms)")
+    conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import httpx
+
+# Point the app at a throwaway database before anything imports `database`
+_tmpdir = tempfile.mkdtemp(prefix="llm-cache-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'cache.db')}"
+
+from sqlalchemy import select, func
+from database import AsyncSessionLocal, init_db
+from fake_ollama import FakeOllamaServer
+from llm_cache import LLMCache
+from llm_service import LLMService
+from models import LLMCacheEntry
+
+# Checks the two-tier LLM cache against a fake Ollama that counts requests:
+# hit/miss accounting per namespace, that normalized texts share an entry,
+# that entries survive a restart through the llm_cache table, TTL expiry in
+# both tiers, LRU eviction from memory, and that fallback results (Ollama
+# down) are never cached. Sentiment and compression keys both.
+
+PORT = 11541
+TRANSCRIPT = "User: the checkout page keeps crashing\nBot: Sorry to hear that. What happened?"
+
+
+def ollama_requests(server):
+    return httpx.get(f"{server.url}/_stats").json()["requests"]
+
+
+def make_service(server, **cache_settings):
+    return LLMService(base_url=server.url, timeout=2.0, cache=LLMCache(AsyncSessionLocal, **cache_settings))
+
+
+async def stored(namespace):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count()).select_from(LLMCacheEntry).where(LLMCacheEntry.namespace == namespace))).scalar()
+
+
+async def calls(server, coroutines):
+    """Ollama requests made while running `coroutines`."""
+    before = ollama_requests(server)
+    for coroutine in coroutines:
+        await coroutine
+    return ollama_requests(server) - before
+
+
+def check(label, condition):
+    print(f"  {'ok' if condition else 'FAILED':<6} {label}")
+    assert condition, label
+
+
+async def main():
+    init_db()
+    with FakeOllamaServer(port=PORT, latency=0.05) as server:
+        print("Hits and misses:")
+        service = make_service(server)
+        sent = await calls(server, [
+            service.analyze_sentiment("Great, the export was fast!!"),
+            service.analyze_sentiment("  great the export was FAST "),
+            service.compress_feedback(TRANSCRIPT),
+            service.compress_feedback(TRANSCRIPT),
+        ])
+        stats = service.cache.stats()
+        check("one Ollama request per distinct input", sent == 2)
+        check("sentiment: 1 miss, 1 memory hit", (stats["sentiment"]["misses"], stats["sentiment"]["memory_hits"]) == (1, 1))
+        check("compression: 1 miss, 1 memory hit", (stats["compression"]["misses"], stats["compression"]["memory_hits"]) == (1, 1))
+        check("both stored in llm_cache", await stored("sentiment") == 1 and await stored("compression") == 1)
+        await service.close()
+
+        print("Restart:")
+        service = make_service(server)
+        sent = await calls(server, [
+            service.analyze_sentiment("great the export was fast"),
+            service.compress_feedback(TRANSCRIPT),
+        ])
+        stats = service.cache.stats()
+        check("no Ollama request after a restart", sent == 0)
+        check("served from the database tier", stats["sentiment"]["db_hits"] == 1 and stats["compression"]["db_hits"] == 1)
+        await service.close()
+
+        print("TTL:")
+        service = make_service(server, ttl=1.0)
+        await service.analyze_sentiment("the login page is slow")
+        await service.compress_feedback(TRANSCRIPT + "\nUser: and slow")
+        time.sleep(1.1)
+        sent = await calls(server, [
+            service.analyze_sentiment("the login page is slow"),
+            service.compress_feedback(TRANSCRIPT + "\nUser: and slow"),
+        ])
+        check("expired entries go back to Ollama", sent == 2)
+        check("expired entries count as misses",
+              service.cache.stats()["sentiment"]["misses"] == 2 and service.cache.stats()["compression"]["misses"] == 2)
+        await service.close()
+
+        print("LRU eviction:")
+        service = make_service(server, max_entries=2)
+        for text in ("pricing is confusing", "support was helpful", "invoices are wrong"):
+            await service.analyze_sentiment(text)
+        check("memory tier holds max_entries", service.cache.stats()["memory_entries"] == 2)
+        sent = await calls(server, [service.analyze_sentiment("invoices are wrong")])
+        check("most recent entry still in memory", sent == 0 and service.cache.stats()["sentiment"]["memory_hits"] == 1)
+        sent = await calls(server, [service.analyze_sentiment("pricing is confusing")])
+        check("evicted entry comes back from the database", sent == 0 and service.cache.stats()["sentiment"]["db_hits"] == 1)
+        await service.close()
+
+        print("Fallbacks:")
+        service = make_service(server)
+        rows = (await stored("sentiment"), await stored("compression"))
+        server.settings.down = True
+        with contextlib.redirect_stdout(io.StringIO()):
+            sentiment = await service.analyze_sentiment("the dashboard never loads")
+            compression = await service.compress_feedback(TRANSCRIPT + "\nUser: still broken")
+        server.settings.down = False
+        check("sentiment fell back", sentiment.get("fallback") is True)
+        check("compression fell back", compression["key_pain_point"] == "Error processing")
+        check("fallbacks not stored", (await stored("sentiment"), await stored("compression")) == rows)
+        sent = await calls(server, [
+            service.analyze_sentiment("the dashboard never loads"),
+            service.compress_feedback(TRANSCRIPT + "\nUser: still broken"),
+        ])
+        check("next call goes to Ollama again", sent == 2)
+        await service.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    finally:
+        shutil.rmtree(_tmpdir, ignore_errors=True)
@@ -0,0 +1,65 @@
+
+import asyncio
+import statistics
+import time
+import httpx
+from fake_ollama import FakeOllamaServer
+from llm_scheduler import PriorityLimiter, INTERACTIVE, BACKGROUND
+from llm_service import LLMService
+
+# A burst against a single-slot Ollama (OLLAMA_NUM_PARALLEL=1) that needs
+# LATENCY seconds per generation: far more work than fits in TIMEOUT.
+LATENCY = 0.25
+TIMEOUT = 3.0
+INTERACTIVE_REQUESTS = 40
+BACKGROUND_REQUESTS = 10
+
+async def timed(coro):
+    start = time.time()
+    try:
+        await coro
+        return True, time.time() - start
+    except Exception:
+        return False, time.time() - start
+
+async def burst(service):
+    interactive = [timed(service.analyze_sentiment(f"checkout was slow #{i}", fallback=False)) for i in range(INTERACTIVE_REQUESTS)]
+    background = [timed(service._compress_feedback_once(f"User: item {i}\nBot: ok")) for i in range(BACKGROUND_REQUESTS)]
+    results = await asyncio.gather(*interactive, *background)
+    return results[:INTERACTIVE_REQUESTS], results[INTERACTIVE_REQUESTS:]
+
+def report(label, results):
+    served = [t for ok, t in results if ok]
+    fallback = [t for ok, t in results if not ok]
+    line = f"  {label:>11}: served {len(served):>2}/{len(results)}"
+    if served:
+        line += f", served p50={statistics.median(served):.2f}s max={max(served):.2f}s"
+    if fallback:
+        line += f", fallback after mean {statistics.mean(fallback):.2f}s"
+    print(line)
+
+async def run(label, port, limiter):
+    with FakeOllamaServer(port=port, latency=LATENCY, parallel=1) as server:
+        service = LLMService(base_url=server.url, timeout=TIMEOUT, limiter=limiter)
+        start = time.time()
+        interactive, background = await burst(service)
+        duration = time.time() - start
+        async with httpx.AsyncClient() as client:
+            stats = (await client.get(server.url + "/_stats")).json()
+        await service.close()
+
+    print(f"\n--- {label} ({duration:.1f}s, peak {stats['max_in_flight']} requests open at Ollama) ---")
+    report("interactive", interactive)
+    report("background", background)
+    if limiter:
+        print(f"  limiter: {limiter.stats()['classes']}")
+
+async def main():
+    print(f"Burst: {INTERACTIVE_REQUESTS} interactive + {BACKGROUND_REQUESTS} background requests, "
+          f"{LATENCY}s per generation, 1 Ollama slot, {TIMEOUT}s LLM timeout")
+    await run("Unbounded (current behaviour)", 11501, None)
+    limiter = PriorityLimiter(max_concurrent=1, max_queue=10, queue_timeouts={INTERACTIVE: 2.5, BACKGROUND: 10.0})
+    await run("Priority limiter (1 slot, queue 10)", 11502, limiter)
+
+if __name__ == "__main__":
+    asyncio.run(main())
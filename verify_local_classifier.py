@@ -0,0 +1,65 @@
+from local_classifier import NEGATORS, LocalSentimentClassifier
+
+# Checks the lexicon classifier's labels and the direction of its scores on
+# plain and negated phrases (no server or Ollama needed). A negator flips and
+# damps the words after it, so "never crashes" leans positive and "never
+# helpful" negative; a negator on its own carries no sentiment, and "never"
+# behaves exactly like "not".
+
+LABELED = [
+    ("love it, the new dashboard is great", "Delight"),
+    ("checkout failed again", "Frustrated"),
+    ("the app crashes every time I upload", "Frustrated"),
+    ("support was really helpful, thanks", "Delight"),
+    ("the page loaded", "Neutral"),
+    ("this is not great", "Frustrated"),
+    ("not bad at all", "Delight"),
+    ("it never crashes", "Delight"),
+]
+
+# (phrase, sign of the score)
+NEGATED = [
+    ("it never crashes", 1),
+    ("never had a problem with it", 1),
+    ("not bad at all", 1),
+    ("the app is not slow anymore", 1),
+    ("support was never helpful", -1),
+    ("I would never recommend this", -1),
+    ("this is not great", -1),
+    ("the setup wasn't easy", -1),
+]
+
+
+def check(label, condition):
+    print(f"  {'ok' if condition else 'FAILED':<6} {label}")
+    assert condition, label
+
+
+def main():
+    classifier = LocalSentimentClassifier()
+
+    print("Labels:")
+    for text, expected in LABELED:
+        result, confidence = classifier.classify(text)
+        check(f"{text!r} -> {result['label']} ({result['score']:+.2f}, confidence {confidence:.2f})",
+              result["label"] == expected)
+
+    print("Negated phrases:")
+    for text, sign in NEGATED:
+        score = classifier.classify(text)[0]["score"]
+        check(f"{text!r} scores {score:+.2f}", score * sign > 0)
+
+    print("Negators:")
+    for word in sorted(NEGATORS):
+        result, confidence = classifier.classify(word)
+        if result["score"] != 0.0 or confidence != 0.0:
+            check(f"{word!r} alone carries no sentiment", False)
+    check("no negator carries sentiment on its own", True)
+    for phrase in ("crashes", "helpful", "slow", "recommend this"):
+        never = classifier.classify(f"it never {phrase}")[0]["score"]
+        negated = classifier.classify(f"it not {phrase}")[0]["score"]
+        check(f"'never {phrase}' scores like 'not {phrase}' ({never:+.2f})", never == negated)
+
+
+if __name__ == "__main__":
+    main()
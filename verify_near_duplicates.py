@@ -0,0 +1,169 @@
+import argparse
+import gzip
+import json
+import random
+import resource
+import time
+
+from fake_ollama import _sentiment
+from llm_cache import normalize_text
+from local_classifier import LocalSentimentClassifier
+import near_duplicates
+
+# Replays an interaction log (feedback_log.jsonl, gzipped rotations too) through
+# the sentiment tiers a live turn uses: NPS regex, exact result cache, local
+# classifier, then the LLM. Reports how many LLM calls the near-duplicate index
+# removes, and how often a reused label differs from what the LLM (here
+# fake_ollama's scorer) would have said. Without --log, a synthetic log of
+# paraphrased complaints and praise is replayed. Then measures lookup latency
+# and memory with 1M signatures in the index, at the default and larger
+# distances (which split signatures into shorter bands, so each probe scans
+# more candidates).
+
+ISSUES = [
+    "the app crashes on login", "checkout page keeps timing out", "I can't reset my password",
+    "export to csv is broken", "the dashboard takes forever to load", "notifications arrive hours late",
+    "search doesn't find my old invoices", "sync between phone and laptop fails", "billing charged me twice",
+    "the update removed dark mode", "support never answered my ticket", "uploading photos freezes the app",
+    "reports show the wrong totals", "the mobile app logs me out every day", "pricing page is confusing",
+    "the new menu layout is hard to find things in", "calendar invites come with the wrong time zone",
+    "two factor codes never arrive by sms", "the api returns errors since yesterday", "onboarding emails are in the wrong language",
+]
+PRAISE = [
+    "love the new dashboard", "support was super helpful", "the latest update is great", "export is fast now",
+    "the mobile app works great", "onboarding was easy and quick",
+]
+PREFIXES = ["", "", "", "honestly ", "again, ", "hi, ", "ugh ", "well "]
+SUFFIXES = ["", "", "", "!", "!!", ".", " again", " today", " please fix", " :("]
+INFLECTIONS = {"crashes": "crashed", "keeps": "kept", "fails": "failed", "arrive": "arrived", "freezes": "froze",
+               "takes": "took", "logs": "logged", "charged": "charges", "show": "showing", "returns": "returned"}
+
+
+def paraphrase(text, rng):
+    words = text.split()
+    if rng.random() < 0.4:
+        words = [INFLECTIONS.get(w, w) for w in words]
+    if rng.random() < 0.3 and words[0] == "the":
+        words = words[1:]
+    text = " ".join(words)
+    if rng.random() < 0.3:
+        text = text.capitalize()
+    return rng.choice(PREFIXES) + text + rng.choice(SUFFIXES)
+
+
+def synthetic_log(n, seed=3):
+    # Recurring issues (paraphrased), praise, one-off comments and bare NPS scores
+    rng = random.Random(seed)
+    texts = []
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.2:
+            texts.append(str(rng.randint(0, 10)))
+        elif kind < 0.65:
+            texts.append(paraphrase(rng.choice(ISSUES), rng))
+        elif kind < 0.75:
+            texts.append(paraphrase(rng.choice(PRAISE), rng))
+        else:
+            texts.append(f"{rng.choice(['my', 'our', 'the'])} {rng.choice(['team', 'manager', 'client', 'intern'])} "
+                         f"{rng.choice(['asked about', 'wanted', 'tried', 'complained about'])} "
+                         f"{rng.choice(['invoices', 'roles', 'exports', 'widgets', 'themes', 'webhooks', 'labels'])} "
+                         f"{rng.choice(['yesterday', 'last week', 'during the demo', 'for project'])} {rng.choice(ISSUES).split()[-1]} {i}")
+    return texts
+
+
+def read_log(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line)["user_input"] for line in f if line.strip()]
+
+
+def replay(texts, index):
+    classifier = LocalSentimentClassifier()
+    cache = {}
+    paths = {"nps_regex": 0, "cache": 0, "local_classifier": 0, "near_duplicate": 0, "llm": 0}
+    disagreements = 0
+    for text in texts:
+        if text.strip().isdigit():
+            paths["nps_regex"] += 1
+            continue
+        key = normalize_text(text)
+        if key in cache:
+            paths["cache"] += 1
+            continue
+        result, confidence = classifier.classify(text)
+        if confidence >= classifier.threshold:
+            paths["local_classifier"] += 1
+            continue
+        sig = near_duplicates.signature(text)
+        if index is not None and sig is not None:
+            found = index.lookup(text, sig)
+            if found is not None:
+                paths["near_duplicate"] += 1
+                disagreements += found[0]["label"] != _sentiment(text)["label"]
+                continue
+        result = cache[key] = _sentiment(text)
+        paths["llm"] += 1
+        if index is not None:
+            index.add(sig, result["label"], result["score"], result["keywords"])
+    return paths, disagreements
+
+
+def lookup_benchmark(entries, max_distance, probes=20000):
+    rng = random.Random(5)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    index = near_duplicates.NearDuplicateIndex(max_distance=max_distance, max_entries=entries)
+    # Unrelated signatures fill the index; the probe texts are paraphrases of stored ones
+    for i in range(entries):
+        index.add((rng.getrandbits(64) - (1 << 63), 0), "Neutral", 0.0)
+    stored = synthetic_log(2000, seed=9)
+    for text in stored:
+        index.add(near_duplicates.signature(text), "Frustrated", -0.7)
+    build_rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+    probes = [paraphrase(rng.choice(ISSUES), rng) for _ in range(probes)]
+    signatures = [near_duplicates.signature(t) for t in probes]
+    samples = []
+    for text, sig in zip(probes, signatures):
+        start = time.perf_counter()
+        index.lookup(text, sig)
+        samples.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for text in probes:
+        near_duplicates.signature(text)
+    per_signature = (time.perf_counter() - start) / len(probes)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)], per_signature, build_rss, index.stats()["hit_rate"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a log through the sentiment tiers and benchmark near-duplicate lookups.")
+    parser.add_argument("--log", help="interaction log to replay (JSONL, optionally .gz)")
+    parser.add_argument("--rows", type=int, default=50000, help="synthetic log size")
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    texts = read_log(args.log) if args.log else synthetic_log(args.rows)
+    source = args.log or f"synthetic log, {len(texts)} turns"
+    baseline, _ = replay(texts, None)
+    index = near_duplicates.NearDuplicateIndex()
+    with_index, disagreements = replay(texts, index)
+    print(f"Replay of {source}")
+    print(f"  {'tier':<18} | {'exact cache only':>16} | {'+ near-duplicates':>17}")
+    for path in baseline:
+        print(f"  {path:<18} | {baseline[path]:>16} | {with_index[path]:>17}")
+    saved = 1 - with_index["llm"] / baseline["llm"] if baseline["llm"] else 0.0
+    print(f"  LLM calls: {baseline['llm']} -> {with_index['llm']} ({saved:.0%} fewer); "
+          f"reused labels differing from the LLM's: {disagreements} of {with_index['near_duplicate']}\n")
+
+    print(f"Lookup with {args.entries:,} signatures in the index")
+    for max_distance in (3, 4, 5):
+        p50, p99, per_signature, rss, hit_rate = lookup_benchmark(args.entries, max_distance)
+        # Peak RSS only grows, so the memory figure is meaningful for the first index only
+        memory = f", ~{rss:.0f} MB" if max_distance == 3 else ""
+        print(f"  max_distance {max_distance}: lookup p50 {p50 * 1e6:.1f} us, p99 {p99 * 1e6:.1f} us "
+              f"(+{per_signature * 1e6:.0f} us to sign the text), hit rate {hit_rate:.0%}{memory}")
+        if max_distance == 3:
+            assert p99 < 0.001, "lookup at the default distance should stay under a millisecond"
+
+
+if __name__ == "__main__":
+    main()
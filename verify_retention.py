@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+# Point the app at a throwaway database before anything imports `database`
+_tmpdir = tempfile.mkdtemp(prefix="retention-")
+_db_path = os.path.join(_tmpdir, "bench.db")
+_archive_path = os.path.join(_tmpdir, "archive.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+
+from database import AsyncSessionLocal, async_engine, init_db
+from feedback_processor import FeedbackProcessor
+from keyword_index import index_terms
+from retention import RetentionWorker
+from session_cache import SessionStateCache
+
+# Builds a year of survey traffic (default 10M interactions in 4-turn
+# sessions, with keyword postings), then runs one retention pass: close idle
+# sessions, archive the interactions of sessions that ended more than 90 days
+# ago and vacuum the freed pages. Reports database size and per-turn latency
+# (stub LLM, so it is all database work) before, during and after the pass,
+# and checks that no interaction was lost or counted twice.
+
+DAYS = 365
+ARCHIVE_AFTER_DAYS = 90
+TURNS_PER_SESSION = 4
+OPEN_SESSIONS = 0.1  # fraction left without an end_time, idle since their last turn
+FLOW = ["9", "The onboarding emails were a nice touch.", "5", "one more thing"]
+TOPICS = ["checkout page", "login", "pricing", "mobile app", "export", "dashboard", "support", "invoices"]
+LABELS = [("Delight", 0.8), ("Neutral", 0.0), ("Frustrated", -0.7)]
+
+
+class InstantLLM:
+    async def analyze_sentiment(self, text, deadline=None):
+        return {"score": 0.0, "label": "Neutral", "keywords": []}
+
+
+def build(rows, now):
+    """Writes `rows` interactions, oldest first, with their sessions and postings."""
+    rng = random.Random(7)
+    conn = sqlite3.connect(_db_path)
+    conn.execute("PRAGMA synchronous=OFF")
+    sessions = rows // TURNS_PER_SESSION
+    step = DAYS * 86400 / sessions
+    interaction_id = 0
+    chunk = 25_000
+    for first in range(0, sessions, chunk):
+        session_rows, interaction_rows, postings = [], [], []
+        for n in range(first, min(first + chunk, sessions)):
+            start = now - datetime.timedelta(seconds=DAYS * 86400 - n * step)
+            session_id = f"s{n:08d}"
+            ts = start
+            for turn in range(TURNS_PER_SESSION):
+                interaction_id += 1
+                topics = rng.sample(TOPICS, 2)
+                keywords, terms = index_terms(topics)
+                label, score = rng.choice(LABELS)
+                interaction_rows.append((
+                    interaction_id, session_id, ts, f"the {topics[0]} and the {topics[1]} were {label.lower()} {n}",
+                    "Thanks for the feedback, could you tell us more?", label, score, json.dumps(keywords), "llm",
+                ))
+                postings.extend((term, interaction_id) for term in terms)
+                ts += datetime.timedelta(seconds=rng.randint(5, 120))
+            ended = rng.random() >= OPEN_SESSIONS
+            session_rows.append((
+                session_id, start, ts if ended else None, ts, "CLOSING" if ended else "FEEDBACK_ASK",
+                rng.randint(0, 10), json.dumps({"summary": "folded"}), interaction_id,
+            ))
+        conn.executemany(
+            "INSERT INTO survey_sessions (session_id, start_time, end_time, last_activity, current_step, nps_score, "
+            "summary_json, summary_watermark, version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)", session_rows)
+        conn.executemany(
+            "INSERT INTO interactions (id, session_id, timestamp, user_input, bot_response, sentiment_label, "
+            "sentiment_score, keywords, sentiment_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", interaction_rows)
+        conn.executemany("INSERT INTO interaction_keywords (keyword, interaction_id) VALUES (?, ?)", postings)
+        conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return sessions
+
+
+def file_size():
+    return sum(os.path.getsize(p) for p in (_db_path, _db_path + "-wal") if os.path.exists(p))
+
+
+async def turns(label, count=None, until=None):
+    """Runs 4-turn survey sessions until `count` turns or until `until` is done; returns latencies."""
+    llm = InstantLLM()
+    cache = SessionStateCache()
+    latencies = []
+    n = 0
+    while (count is None or len(latencies) < count) and (until is None or not until.done()):
+        session_id = f"{label}-{n}"
+        n += 1
+        for text in FLOW:
+            async with AsyncSessionLocal() as db:
+                processor = FeedbackProcessor(llm, db, session_cache=cache)
+                start = time.perf_counter()
+                await processor.process_response(text, session_id)
+                latencies.append(time.perf_counter() - start)
+        if until is not None:
+            await asyncio.sleep(0.01)  # a steady trickle of turns, not a flood
+    return latencies
+
+
+def describe(latencies):
+    latencies = sorted(latencies)
+    return (f"p50 {statistics.median(latencies) * 1000:.2f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms, "
+            f"max {latencies[-1] * 1000:.1f} ms over {len(latencies)} turns")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure the retention pass on a synthetic dataset.")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--turns", type=int, default=2000, help="turns timed before and after the pass")
+    args = parser.parse_args()
+
+    init_db()
+    now = datetime.datetime.utcnow()
+    started = time.perf_counter()
+    sessions = build(args.rows, now)
+    print(f"Built {args.rows:,} interactions in {sessions:,} sessions in {time.perf_counter() - started:.0f}s "
+          f"({_tmpdir})")
+
+    await turns("warmup", 200)
+    before_size = file_size()
+    before = await turns("before", args.turns)
+    print(f"Before: database {before_size / 2**30:.2f} GB; turns {describe(before)}")
+
+    worker = RetentionWorker(
+        AsyncSessionLocal, async_engine, archive_path=_archive_path, idle_timeout=86400,
+        archive_after_days=ARCHIVE_AFTER_DAYS, vacuum_budget=24 * 3600,
+    )
+    # The pass's three steps one at a time, each with turns running alongside
+    steps = [
+        ("close idle sessions", "sessions closed", lambda: worker.close_idle_sessions(now)),
+        ("archive", "interactions archived", lambda: worker.archive(now)),
+        ("vacuum", "pages freed", worker.vacuum),
+    ]
+    results = {}
+    for name, unit, step in steps:
+        started = time.perf_counter()
+        task = asyncio.create_task(step())
+        during = await turns(name, until=task)
+        results[name] = await task
+        print(f"{name.capitalize()}: {results[name]:,} {unit} in {time.perf_counter() - started:.0f}s; "
+              f"turns meanwhile {describe(during)}")
+
+    after_size = file_size()
+    after = await turns("after", args.turns)
+    print(f"After: database {after_size / 2**30:.2f} GB (archive {os.path.getsize(_archive_path) / 2**30:.2f} GB); "
+          f"turns {describe(after)}")
+
+    conn = sqlite3.connect(_db_path)
+    live = conn.execute("SELECT count(*) FROM interactions WHERE session_id LIKE 's%'").fetchone()[0]
+    counted = conn.execute("SELECT coalesce(sum(json_extract(archive_stats, '$.interactions')), 0) FROM survey_sessions").fetchone()[0]
+    orphans = conn.execute("SELECT count(*) FROM interaction_keywords k LEFT JOIN interactions i ON i.id = k.interaction_id "
+                           "WHERE i.id IS NULL").fetchone()[0]
+    still_open = conn.execute("SELECT count(*) FROM survey_sessions WHERE end_time IS NULL AND last_activity < ?",
+                              (now - datetime.timedelta(days=1),)).fetchone()[0]
+    conn.close()
+    archived = sqlite3.connect(_archive_path).execute("SELECT count(*) FROM archived_interactions").fetchone()[0]
+    print(f"Live {live:,} + archived {archived:,} = {live + archived:,} of {args.rows:,}; archive_stats count {counted:,}")
+    assert live + archived == args.rows and counted == archived, "every interaction is either live or archived, once"
+    assert orphans == 0 and still_open == 0, (orphans, still_open)
+    assert after_size < before_size
+    await worker.stop()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    finally:
+        # Several GB at the default size
+        shutil.rmtree(_tmpdir, ignore_errors=True)
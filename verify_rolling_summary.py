@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+
+import config
+from llm_service import estimate_tokens, COMPRESSION_SYSTEM_PROMPT, SUMMARY_UPDATE_SYSTEM_PROMPT
+from rolling_summary import build_transcript, fold_turns
+
+# Compares summarizing a session from its full transcript against folding new
+# turns into a rolling summary. A recording stand-in for LLMService counts
+# prompt tokens; prompt size is what drives Ollama prefill time and num_ctx
+# overflow, so per-call tokens are the number to watch.
+
+SESSION_SIZES = [10, 100, 1000]
+STEADY_STATE_TURNS = 4
+NUM_CTX = 2048
+
+class Turn:
+    def __init__(self, i):
+        self.id = i + 1
+        self.user_input = f"Turn {i}: the checkout page was slow and support took a while to answer."
+        self.bot_response = "Thanks for sharing! How would you rate this chat experience (1-5)?"
+
+class RecordingLLM:
+    """Stand-in for LLMService that records prompt tokens per call."""
+    def __init__(self):
+        self.calls = []
+
+    async def compress_feedback(self, transcript, fallback=True):
+        self.calls.append(estimate_tokens(COMPRESSION_SYSTEM_PROMPT) + estimate_tokens(transcript))
+        return {"summary": "s", "pain_points": [], "suggestions": []}
+
+    async def update_summary(self, summary, transcript, fallback=True):
+        self.calls.append(estimate_tokens(SUMMARY_UPDATE_SYSTEM_PROMPT) + estimate_tokens(json.dumps(summary)) + estimate_tokens(transcript))
+        return summary
+
+async def incremental(turns, summary, budget):
+    llm = RecordingLLM()
+    start = time.perf_counter()
+    async for _ in fold_turns(llm, summary, [(t.id, t.user_input, t.bot_response) for t in turns], budget):
+        pass
+    return llm.calls, time.perf_counter() - start
+
+async def main():
+    budget = config.SUMMARY_TOKEN_BUDGET
+    print(f"Token budget: {budget}, model context (num_ctx): {NUM_CTX}\n")
+    print(f"{'turns':>6} | {'full transcript':>16} | {'first fold: calls / max / total':>32} | {'steady-state update':>20}")
+    print("-" * 86)
+    for size in SESSION_SIZES:
+        turns = [Turn(i) for i in range(size)]
+        full = estimate_tokens(COMPRESSION_SYSTEM_PROMPT) + estimate_tokens(build_transcript(turns))
+        overflow = "*" if full > NUM_CTX else ""
+
+        calls, _ = await incremental(turns, None, budget)
+        steady, _ = await incremental([Turn(size + i) for i in range(STEADY_STATE_TURNS)], {"summary": "s"}, budget)
+
+        print(f"{size:>6} | {full:>12,} tok{overflow:<1} | {len(calls):>6} / {max(calls):>5,} / {sum(calls):>9,} tok | {sum(steady):>16,} tok")
+        assert max(calls) <= budget, "a fold exceeded the token budget"
+        assert sum(steady) <= budget, "steady-state update exceeded the token budget"
+
+    print(f"\n* full transcript exceeds num_ctx and is silently truncated by Ollama")
+    print(f"Every fold stays within {budget} tokens; a steady-state update only sends the")
+    print(f"summary plus the last {STEADY_STATE_TURNS} turns, independent of session length.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
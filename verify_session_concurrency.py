@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import collections
+import os
+import random
+import sqlite3
+import tempfile
+import httpx
+
+import loadtest
+from feedback_processor import SCORE_PATTERN
+from survey_engine import SurveyRegistry
+
+# Stress test for per-session ordering: bursts of concurrent turns for ONE
+# session are fired at the app running with several uvicorn workers. The
+# committed interactions are then replayed through the survey in commit
+# (id) order. Every stored reply must match the replayed step, and every
+# successful response must appear exactly once, so no transition was lost
+# or applied twice. A second part measures how throughput scales with the
+# number of workers, using loadtest.py's virtual users.
+
+TEXTS = ["3", "8", "10", "not sure", "The checkout kept crashing", "It was fine", "4", "hello?"]
+
+def stack_args(workers, ollama_latency):
+    return argparse.Namespace(
+        workers=workers, ollama_latency=ollama_latency, ollama_jitter=0.0, ollama_distribution="fixed",
+        ollama_error_rate=0.0, ollama_parallel=64,
+    )
+
+async def burst_session(base_url, session_id, rounds, burst):
+    responses = []
+    limits = httpx.Limits(max_connections=burst, max_keepalive_connections=burst)
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        async def turn(text):
+            resp = await client.post(f"{base_url}/analyze", json={"text": text, "session_id": session_id})
+            responses.append((resp.status_code, resp.headers.get("X-Survey-Transition"), resp.json()))
+        for _ in range(rounds):
+            await asyncio.gather(*[turn(random.choice(TEXTS)) for _ in range(burst)])
+    return responses
+
+def replay(db_path, session_id):
+    """Returns (transitions, mismatches, version) for the session's committed turns."""
+    survey = SurveyRegistry(None).get()
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT user_input, sentiment_label, bot_response FROM interactions WHERE session_id = ? ORDER BY id", (session_id,)
+        ).fetchall()
+        version = conn.execute("SELECT version FROM survey_sessions WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    step = survey.initial_state
+    transitions, mismatches = [], 0
+    for text, label, reply in rows:
+        if step in survey.terminal_states:
+            step = survey.initial_state
+        score = None
+        if step in survey.scored_states:
+            match = SCORE_PATTERN.search(text)
+            score = int(match.group(1)) if match else None
+        transition = survey.step(step, text, score, label)
+        if reply not in transition.responses:
+            mismatches += 1
+        transitions.append(f"{step}->{transition.to}")
+        step = transition.to
+    return transitions, mismatches, version
+
+def run_stress(workers, rounds, burst):
+    with tempfile.TemporaryDirectory(prefix="session-stress-") as workdir:
+        base_url, processes = loadtest.start_stack(stack_args(workers, 0.05), workdir)
+        try:
+            responses = asyncio.run(burst_session(base_url, "stress", rounds, burst))
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait(timeout=10)
+        transitions, mismatches, version = replay(os.path.join(workdir, "load.db"), "stress")
+
+    ok = [(t, body) for status, t, body in responses if status == 200 and body.get("status") == "success"]
+    conflicts = sum(1 for status, _, _ in responses if status == 409)
+    errors = len(responses) - len(ok) - conflicts
+    lost = collections.Counter(t for t, _ in ok) - collections.Counter(transitions)
+    phantom = collections.Counter(transitions) - collections.Counter(t for t, _ in ok)
+    passed = (
+        mismatches == 0 and not lost and not phantom and errors == 0
+        and len(transitions) == len(ok) and version == len(transitions) - 1
+    )
+    print(f"{workers:>7} | {len(responses):>5} | {len(ok):>4} | {conflicts:>4} | {errors:>6} | {len(transitions):>9} | "
+          f"{mismatches:>10} | {sum(lost.values()) + sum(phantom.values()):>11} | {version:>7} | {'OK' if passed else 'FAIL'}")
+    return passed
+
+def run_scaling(workers, users, duration):
+    with tempfile.TemporaryDirectory(prefix="session-scale-") as workdir:
+        base_url, processes = loadtest.start_stack(stack_args(workers, 0.3), workdir)
+        try:
+            recorder, elapsed = asyncio.run(loadtest.run_load(base_url, users, duration, 2.0, True, 0.0))
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait(timeout=10)
+    summary = loadtest.build_results(recorder, elapsed, {})["summary"]
+    print(f"{workers:>7} | {summary['throughput_rps']:>8} | {summary['p50_ms']:>8} | {summary['p95_ms']:>8} | {summary['errors']:>6}")
+    return summary["throughput_rps"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent turns for one session across worker processes, and throughput vs. workers.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rounds", type=int, default=10, help="bursts fired at the stress session")
+    parser.add_argument("--burst", type=int, default=16, help="concurrent turns per burst")
+    parser.add_argument("--users", type=int, default=32, help="virtual users for the scaling run")
+    parser.add_argument("--duration", type=float, default=15.0, help="measured seconds per scaling run")
+    parser.add_argument("--skip-scaling", action="store_true")
+    args = parser.parse_args()
+    random.seed(1)
+
+    print(f"--- {args.rounds} bursts of {args.burst} concurrent turns for one session ---")
+    print(f"{'workers':>7} | {'sent':>5} | {'ok':>4} | {'409':>4} | {'errors':>6} | {'committed':>9} | "
+          f"{'bad replies':>10} | {'lost/duped':>11} | {'version':>7} |")
+    print("-" * 100)
+    passed = all([run_stress(workers, args.rounds, args.burst) for workers in args.workers])
+
+    if not args.skip_scaling:
+        print(f"\n--- {args.users} virtual users, separate sessions, Ollama latency 0.3s ---")
+        print(f"{'workers':>7} | {'req/s':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'errors':>6}")
+        print("-" * 50)
+        for workers in args.workers:
+            run_scaling(workers, args.users, args.duration)
+        print(f"(machine has {os.cpu_count()} CPU cores; each worker has its own LLM_MAX_CONCURRENCY slots)")
+
+    assert passed, "concurrent turns for one session were lost, duplicated or applied out of order"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from fake_ollama import FakeOllamaServer
+from loadtest import free_port
+
+# Startup benchmark: how long `import main` takes (median of fresh
+# interpreters) and that it no longer imports LangChain, then time to live
+# (GET / answers), to the first /analyze response and to ready (GET /ready
+# answers 200) for a uvicorn app started with FAST_BOOT=0 and FAST_BOOT=1,
+# against a fake Ollama that takes --load-time seconds to load the model.
+# Pass --max-import-seconds to fail when the import time regresses.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Prints the import time and whether any langchain module got imported
+IMPORT_PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "print(time.perf_counter() - start, int(any(m.startswith('langchain') for m in sys.modules)))\n"
+)
+# Goes to the LLM: the local classifier has no confident label for it
+FIRST_TEXT = "The new export flow is something I have mixed feelings about"
+
+
+def import_time(module, env, runs):
+    """Median seconds to import `module` in a fresh interpreter, and whether LangChain came with it."""
+    samples, langchain = [], False
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module)],
+            cwd=HERE, env=env, capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1].split()
+        samples.append(float(out[0]))
+        langchain = langchain or out[1] == "1"
+    return statistics.median(samples), langchain
+
+
+def wait_for(url, process, deadline, status=200):
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"app exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == status:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f"{url} did not answer {status} in time")
+
+
+def boot(fast_boot, env, workdir, load_time, timeout):
+    """Starts the app; returns seconds to live, to the first /analyze response and to ready."""
+    # A fresh fake Ollama, so the model isn't resident yet
+    ollama = FakeOllamaServer(port=free_port(), latency=0.05, load_time=load_time)
+    ollama.start()
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(env, OLLAMA_BASE_URL=ollama.url, FAST_BOOT="1" if fast_boot else "0",
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, f'boot{int(fast_boot)}.db')}")
+    log = open(os.path.join(workdir, f"server{int(fast_boot)}.log"), "w")
+    started = time.perf_counter()
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    try:
+        deadline = time.time() + timeout
+        live = wait_for(f"{base_url}/", app, deadline) - started
+        response = httpx.post(f"{base_url}/analyze", json={"text": FIRST_TEXT}, timeout=timeout)
+        response.raise_for_status()
+        first = time.perf_counter() - started
+        ready = wait_for(f"{base_url}/ready", app, deadline) - started
+        return live, first, ready, httpx.get(f"{base_url}/ready").json()
+    finally:
+        app.terminate()
+        app.wait()
+        log.close()
+        ollama.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first response of the app.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per import measurement")
+    parser.add_argument("--load-time", type=float, default=2.0, help="seconds the fake Ollama takes to load the model")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--max-import-seconds", type=float, help="fail when `import main` takes longer (median)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    try:
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'import.db')}",
+            "INTERACTION_LOG_PATH": os.path.join(workdir, "feedback_log.{pid}.jsonl"),
+            "MODEL_KEEPALIVE_HOURS": "",
+        })
+        main_seconds, main_langchain = import_time("main", env, args.runs)
+        stack_seconds, _ = import_time("langchain_ollama, langchain_core.prompts, langchain_core.output_parsers", env, args.runs)
+        print(f"import main: {main_seconds:.2f}s (median of {args.runs}); LangChain stack on its own: {stack_seconds:.2f}s")
+        assert not main_langchain, "import main pulled in LangChain; it must load on first use"
+
+        print(f"{'mode':<12} {'live':>8} {'first /analyze':>15} {'ready':>8}")
+        for fast_boot in (False, True):
+            live, first, ready, report = boot(fast_boot, env, workdir, args.load_time, args.timeout)
+            assert report["ready"] and report["llm_loaded"], report
+            print(f"{'FAST_BOOT=' + str(int(fast_boot)):<12} {live:>7.2f}s {first:>14.2f}s {ready:>7.2f}s")
+
+        if args.max_import_seconds is not None and main_seconds > args.max_import_seconds:
+            sys.exit(f"import main took {main_seconds:.2f}s, over the {args.max_import_seconds:.2f}s budget")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Point the app at a throwaway database before anything imports `database`
+_tmpdir = tempfile.mkdtemp(prefix="turn-cost-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+
+from sqlalchemy import event
+from database import AsyncSessionLocal, async_engine, init_db
+from feedback_processor import FeedbackProcessor
+from session_cache import SessionStateCache
+
+# Full survey path plus the post-CLOSING reset turn
+FLOW = ["9", "The onboarding emails were a nice touch.", "5", "one more thing"]
+
+class InstantLLM:
+    """Stand-in for LLMService so the measurement isolates DB work."""
+    async def analyze_sentiment(self, text, deadline=None):
+        return {"score": 0.0, "label": "Neutral", "keywords": []}
+
+commits = 0
+runs = 0
+
+def _count_commit(conn):
+    global commits
+    commits += 1
+
+event.listen(async_engine.sync_engine, "commit", _count_commit)
+
+async def run_flows(sessions, session_cache):
+    global commits, runs
+    commits = 0
+    runs += 1
+    llm = InstantLLM()
+    latencies = []
+    for n in range(sessions):
+        session_id = f"bench-{runs}-{n}"
+        for text in FLOW:
+            async with AsyncSessionLocal() as db:
+                processor = FeedbackProcessor(llm, db, session_cache=session_cache)
+                start = time.perf_counter()
+                await processor.process_response(text, session_id)
+                latencies.append(time.perf_counter() - start)
+    return commits / len(latencies), latencies
+
+async def main(sessions=200):
+    init_db()
+    await run_flows(20, None)  # warm up connections and statement caches
+    print(f"--- Turn cost over {sessions} sessions x {len(FLOW)} turns ---")
+    for label, cache in [("no session cache", None), ("session cache", SessionStateCache())]:
+        per_turn, latencies = await run_flows(sessions, cache)
+        print(f"{label:>17}: {per_turn:.2f} commits/turn, "
+              f"mean={statistics.mean(latencies) * 1000:.2f}ms p50={statistics.median(latencies) * 1000:.2f}ms")
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,109 @@
+import asyncio
+import datetime
+import time
+
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from fake_ollama import FakeOllamaServer
+from llm_service import LLMService, SENTIMENT_SYSTEM_PROMPT, SentimentAnalysis
+from model_keepalive import ModelKeepAlive
+
+# First-request latency with and without the startup warm-up and the
+# business-hours keep-alive, against fake_ollama with a simulated model load
+# time. Also measures what building the LangChain chain on every call (as
+# analyze_sentiment used to) cost compared to reusing the chain built once.
+
+PORT = 11506
+LOAD_TIME = 3.0
+LATENCY = 0.3
+CHAIN_BUILDS = 2000
+
+def make_service(url, keep_alive="5m"):
+    return LLMService(base_url=url, timeout=30.0, keep_alive=keep_alive)
+
+async def first_request(service):
+    start = time.perf_counter()
+    await service.analyze_sentiment("The checkout page was slow today", fallback=False)
+    return time.perf_counter() - start
+
+async def cold_start(url):
+    service = make_service(url)
+    try:
+        return await first_request(service)
+    finally:
+        await service.close()
+
+async def warm_start(url):
+    service = make_service(url)
+    try:
+        warmup = await service.warm_up()
+        return warmup, await first_request(service)
+    finally:
+        await service.close()
+
+async def after_idle(url, keep_alive, idle, with_keepalive):
+    # keep_alive is shortened so expiry can be observed within seconds
+    service = make_service(url, keep_alive=f"{keep_alive}s")
+    # A fixed Wednesday noon, inside the default weekday window
+    keeper = ModelKeepAlive(service, hours="08:00-18:00", interval=keep_alive / 2,
+                            now=lambda: datetime.datetime(2026, 10, 14, 12, 0))
+    try:
+        await service.warm_up()
+        if with_keepalive:
+            keeper.start()
+        await asyncio.sleep(idle)
+        return await first_request(service), keeper.pings
+    finally:
+        await keeper.stop()
+        await service.close()
+
+def chain_build_cost():
+    service = make_service("http://127.0.0.1:9")
+    service.load()
+    llm_json = service.pool.backends[0].llm_json
+    start = time.perf_counter()
+    for _ in range(CHAIN_BUILDS):
+        ChatPromptTemplate.from_messages([
+            ("system", SENTIMENT_SYSTEM_PROMPT),
+            ("user", "{text}")
+        ]) | llm_json | JsonOutputParser(pydantic_object=SentimentAnalysis)
+    per_build = (time.perf_counter() - start) / CHAIN_BUILDS
+    asyncio.run(service.close())
+    return per_build
+
+def fresh(**settings):
+    # A new server per scenario, so every run starts with the model unloaded
+    return FakeOllamaServer(port=PORT, latency=LATENCY, load_time=LOAD_TIME, **settings)
+
+def main():
+    print(f"fake Ollama: load time {LOAD_TIME}s, generation {LATENCY}s\n")
+    print(f"{'scenario':<52} | {'first request':>13}")
+    print("-" * 70)
+
+    with fresh() as server:
+        cold = asyncio.run(cold_start(server.url))
+    print(f"{'cold start (no warm-up)':<52} | {cold * 1000:>10.0f} ms")
+
+    with fresh() as server:
+        warmup, warm = asyncio.run(warm_start(server.url))
+    print(f"{'after startup warm-up (warm-up took %.2fs)' % warmup:<52} | {warm * 1000:>10.0f} ms")
+
+    with fresh() as server:
+        expired, _ = asyncio.run(after_idle(server.url, keep_alive=2.0, idle=3.0, with_keepalive=False))
+    print(f"{'idle past keep_alive, no keep-alive scheduler':<52} | {expired * 1000:>10.0f} ms")
+
+    with fresh() as server:
+        kept, pings = asyncio.run(after_idle(server.url, keep_alive=2.0, idle=3.0, with_keepalive=True))
+    print(f"{'idle past keep_alive, in business hours (%d pings)' % pings:<52} | {kept * 1000:>10.0f} ms")
+
+    per_build = chain_build_cost()
+    print(f"\nBuilding the sentiment chain per call: {per_build * 1e6:.0f} us/call (now built once per LLMService)")
+
+    assert cold >= LOAD_TIME, "cold request should include the model load"
+    assert warm < LOAD_TIME / 2, "request after warm-up still paid the model load"
+    assert expired >= LOAD_TIME, "model should have been unloaded after keep_alive"
+    assert kept < LOAD_TIME / 2 and pings > 0, "keep-alive did not keep the model resident"
+
+if __name__ == "__main__":
+    main()